@@ -17,10 +17,18 @@ import json
 import requests.packages.urllib3
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
-from config_data_2073 import APIC_EM_URL, APIC_EM_USER, APIC_EM_PASSW
+from config_data_2073 import APIC_EM_URL, APIC_EM_USER, APIC_EM_PASSW, APIC_EM_POOL_SIZE
+
+from SparkConnect_http import create_api_session
+from SparkConnect_metrics import instrument
+from SparkConnect_ticket import ServiceTicketManager
 
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)  # Disable insecure https warnings
 
+APIC_EM_SESSION = create_api_session(pool_maxsize=APIC_EM_POOL_SIZE)  # keep-alive connection pool
+
+APIC_EM_TICKETS = ServiceTicketManager(APIC_EM_URL, APIC_EM_USER, APIC_EM_PASSW, APIC_EM_SESSION)  # shared ticket
+
 
 def pprint(json_data):
     """
@@ -32,26 +40,18 @@ def pprint(json_data):
     print(json.dumps(json_data, indent=4, separators=(' , ', ' : ')))
 
 
+@instrument('APIC-EM')
 def get_service_ticket():
     """
-    This function will generate the Auth ticket required to access APIC-EM
-    API call to /ticket is used to create a new user ticket
+    This function will return the Auth ticket required to access APIC-EM
+    API call to /ticket is used to create a new user ticket, the ticket is cached and refreshed before it expires
     :return: APIC-EM ticket
     """
 
-    payload = {'username': APIC_EM_USER, 'password': APIC_EM_PASSW}
-    url = APIC_EM_URL + '/ticket'
-    header = {'content-type': 'application/json'}
-    ticket_response = requests.post(url, data=json.dumps(payload), headers=header, verify=False)
-    if not ticket_response:
-        print('\nNo data returned!')
-    else:
-        ticket_json = ticket_response.json()
-        ticket = ticket_json['response']['serviceTicket']
-        print('\nCreated APIC-EM ticket: ', ticket)
-        return ticket
+    return APIC_EM_TICKETS.get_ticket()
 
 
+@instrument('APIC-EM')
 def get_device_hostname(ip_address):
     """
     Find out the hostname of the network device with the {ip_address}
@@ -61,8 +61,8 @@ def get_device_hostname(ip_address):
     """
 
     url = APIC_EM_URL + '/network-device/ip-address/' + ip_address
-    header = {'accept': 'application/json', 'X-Auth-Token': APIC_EM_TICKET}
-    device_response = requests.get(url, headers=header, verify=False)
+    header = {'accept': 'application/json'}
+    device_response = APIC_EM_TICKETS.request('GET', url, headers=header)  # retried once with a new ticket on 401
     device_json = device_response.json()
     print('\nNetwork device information:')
     pprint(device_json)
@@ -78,10 +78,9 @@ def main():
     We will print the name of the network device.
     """
 
-    # create the auth ticket for APIC-EM
+    # create the auth ticket for APIC-EM, kept by the ticket manager for the following calls
 
-    global APIC_EM_TICKET    # make the ticket a global variable in this module
-    APIC_EM_TICKET = get_service_ticket()
+    get_service_ticket()
 
     # find the hostname for a network device which by using the IP address
 
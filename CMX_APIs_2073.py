@@ -22,12 +22,21 @@ import requests.packages.urllib3
 from requests.auth import HTTPBasicAuth  # for Basic Auth
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
-from config_data_2073 import CMX_URL, CMX_USER, CMX_PASSW
+from config_data_2073 import CMX_URL, CMX_USER, CMX_PASSW, CMX_POOL_SIZE
+
+from SparkConnect_http import create_api_session
+from SparkConnect_metrics import instrument
+from SparkConnect_cmx import CmxClientIndex, batch_client_lookup
+from SparkConnect_stream import stream_json_items
 
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)  # Disable insecure https warnings
 
 CMX_AUTH = HTTPBasicAuth(CMX_USER, CMX_PASSW)  # http basic auth
 
+CMX_SESSION = create_api_session(auth=CMX_AUTH, pool_maxsize=CMX_POOL_SIZE)  # keep-alive connection pool
+
+CMX_INDEX = CmxClientIndex(CMX_URL, CMX_SESSION)  # active clients index, used for the lookups when started
+
 
 def pprint(json_data):
     """
@@ -39,6 +48,7 @@ def pprint(json_data):
     print(json.dumps(json_data, indent=4, separators=(' , ', ' : ')))
 
 
+@instrument('CMX')
 def get_cmx_client_count():
     """
     This function will find out number of active clients
@@ -48,7 +58,7 @@ def get_cmx_client_count():
     url = CMX_URL + 'api/location/v2/clients/count'
     print('\nThe API url: ', url)
     header = {'content-type': 'application/json', 'accept': 'application/json'}
-    response = requests.get(url, headers=header, auth=CMX_AUTH, verify=False)
+    response = CMX_SESSION.get(url, headers=header)
     print('\nThe API response status code: ', response)
     client_json = response.json()
     print('\nThe API response JSON body :')
@@ -57,6 +67,31 @@ def get_cmx_client_count():
     return client_count
 
 
+def stream_active_clients():
+    """
+    This function will yield the active clients one at a time, parsed while the response is downloaded
+    The memory used does not depend on the number of clients
+    REST API call to CMX - /api/location/v2/clients/active
+    :return: generator of the client info
+    """
+
+    url = CMX_URL + 'api/location/v2/clients/active'
+    header = {'content-type': 'application/json', 'accept': 'application/json'}
+    return stream_json_items(CMX_SESSION, url, headers=header)
+
+
+def stream_active_client_mac():
+    """
+    This function will yield the MAC addresses of the active clients one at a time
+    REST API call to CMX - /api/location/v2/clients/active
+    :return: generator of the MAC addresses
+    """
+
+    for client in stream_active_clients():
+        yield client['macAddress']
+
+
+@instrument('CMX')
 def all_active_client_mac():
     """
     This function will find out the MAC addresses for all active clients
@@ -64,25 +99,28 @@ def all_active_client_mac():
     :return: none, we will print the mac address list
     """
 
-    url = CMX_URL + 'api/location/v2/clients/active'
-    header = {'content-type': 'application/json', 'accept': 'application/json'}
-    mac_response = requests.get(url, headers=header, auth=CMX_AUTH, verify=False)
-    mac_active_clients_json = mac_response.json()
     print('\nMAC addresses of all active clients: \n')
-    pprint(mac_active_clients_json)
+    for mac_address in stream_active_client_mac():
+        print(mac_address)
 
 
+@instrument('CMX')
 def check_cmx_client(username):
     """
     This function will find out the WLC controller IP address for a client authenticated with the {username}
+    The CMX client index is used if fresh, the CMX query is made only if the client is not in the index
     Call to CMX - /api/location/v2/clients/?username={username}
     :param username: username of the client
     :return: WLC IP address
     """
 
+    if CMX_INDEX.is_fresh():
+        client = CMX_INDEX.lookup_username(username)
+        if client is not None:
+            return client['detectingControllers']
     url = CMX_URL + 'api/location/v2/clients/?username=' + username
     header = {'content-type': 'application/json', 'accept': 'application/json'}
-    response = requests.get(url, headers=header, auth=CMX_AUTH, verify=False)
+    response = CMX_SESSION.get(url, headers=header)
     client_json = response.json()
     if not client_json:
         controller_ip_address = None
@@ -91,17 +129,23 @@ def check_cmx_client(username):
     return controller_ip_address
 
 
+@instrument('CMX')
 def check_mac_cmx_client(mac_address):
     """
     This function will find out the WLC controller IP address for a client with the {mac_address}
+    The CMX client index is used if fresh, the CMX query is made only if the client is not in the index
     Call to CMX - /api/location/v2/clients/?username={username}
     :param: mac_address: client MAC address
     :return: WLC IP address
     """
 
+    if CMX_INDEX.is_fresh():
+        client = CMX_INDEX.lookup_mac(mac_address)
+        if client is not None:
+            return client['detectingControllers']
     url = CMX_URL + 'api/location/v2/clients/?macAddress=' + mac_address
     header = {'content-type': 'application/json', 'accept': 'application/json'}
-    response = requests.get(url, headers=header, auth=CMX_AUTH, verify=False)
+    response = CMX_SESSION.get(url, headers=header)
     client_json = response.json()
     pprint(client_json)  # pretty print the client detail info
     if not client_json:
@@ -111,6 +155,38 @@ def check_mac_cmx_client(mac_address):
     return controller_ip_address
 
 
+@instrument('CMX')
+def check_cmx_clients(usernames):
+    """
+    This function will find out the WLC controller IP addresses for many clients authenticated with the {usernames}
+    The duplicate usernames are looked up once, the CMX client index is used if fresh, the other clients are
+    queried concurrently, at most CMX_POOL_SIZE queries at the same time
+    Call to CMX - /api/location/v2/clients/?username={username}, for each client not in the index
+    :param usernames: list of the usernames of the clients
+    :return: ClientLookupResult, the WLC IP address of each username, and by_controller() the usernames grouped
+             by WLC IP address
+    """
+
+    index_lookup = CMX_INDEX.lookup_username if CMX_INDEX.is_fresh() else None
+    return batch_client_lookup(usernames, index_lookup, check_cmx_client, CMX_POOL_SIZE)
+
+
+@instrument('CMX')
+def check_mac_cmx_clients(mac_addresses):
+    """
+    This function will find out the WLC controller IP addresses for many clients with the {mac_addresses}
+    The duplicate MAC addresses are looked up once, the CMX client index is used if fresh, the other clients are
+    queried concurrently, at most CMX_POOL_SIZE queries at the same time
+    Call to CMX - /api/location/v2/clients/?macAddress={mac_address}, for each client not in the index
+    :param mac_addresses: list of the client MAC addresses
+    :return: ClientLookupResult, the WLC IP address of each MAC address, and by_controller() the MAC addresses
+             grouped by WLC IP address
+    """
+
+    index_lookup = CMX_INDEX.lookup_mac if CMX_INDEX.is_fresh() else None
+    return batch_client_lookup(mac_addresses, index_lookup, check_mac_cmx_client, CMX_POOL_SIZE)
+
+
 def main():
     """
     This lab will use the Cisco CMX Sandbox https://msesandbox.cisco.com:8081
@@ -8,6 +8,8 @@
 
 
 import requests
+import asyncio
+import functools
 import json
 import time
 import requests.packages.urllib3
@@ -17,10 +19,29 @@ from requests.auth import HTTPBasicAuth  # for Basic Auth
 
 # import all account info from SparkConnect_init.py file. Update the file with lab account info
 
-from SparkConnect_init import SPARK_URL, SPARK_AUTH, ROOM_NAME
+from SparkConnect_init import SPARK_URL, SPARK_AUTH, ROOM_NAME, DEFAULT_CONTROLLER_IP
 from SparkConnect_init import EM_URL, EM_USER, EM_PASSW
 from SparkConnect_init import PI_URL, PI_USER, PI_PASSW, WLAN_DEPLOY, WLAN_DISABLE
 from SparkConnect_init import CMX_URL, CMX_USER, CMX_PASSW
+from SparkConnect_init import SPARK_POOL_SIZE, CMX_POOL_SIZE, EM_POOL_SIZE, PI_POOL_SIZE
+from SparkConnect_init import INVENTORY_REFRESH, CMX_INDEX_REFRESH, CMX_INDEX_MAX_AGE, FANOUT_WORKERS
+from SparkConnect_init import SPARK_TIMEOUT, CMX_TIMEOUT, EM_TIMEOUT, PI_TIMEOUT, CMX_HEDGE_DELAY, EM_HEDGE_DELAY
+from SparkConnect_init import SPARK_DEADLINE, CMX_DEADLINE, EM_DEADLINE, PI_DEADLINE
+from SparkConnect_init import METRICS_PORT, WARMUP, HTTP_CACHE_DIR, HTTP_CACHE_SIZE
+
+from SparkConnect_http import create_api_session, hedged_call, CircuitBreaker
+from SparkConnect_metrics import instrument, instrument_session, start_metrics_server
+from SparkConnect_messages import SparkMessageReader
+from SparkConnect_rooms import SparkRoomCache, SparkRoomNotFoundError, find_room_id_paginated
+from SparkConnect_pages import iter_spark_items
+from SparkConnect_ticket import ServiceTicketManager
+from SparkConnect_inventory import NetworkInventory
+from SparkConnect_cmx import CmxClientIndex, batch_client_lookup
+from SparkConnect_jobs import PiJobWaiter, JOB_DEADLINE
+from SparkConnect_deploy import WlanTemplateFanout, ControllerStateTracker, SUCCESS_RESULTS
+from SparkConnect_warmup import BackendCheck, warm_up, NO_CACHE
+from SparkConnect_pipeline import Pipeline, PipelineStep
+from SparkConnect_httpcache import HttpCache
 
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)  # Disable insecure https warnings
 
@@ -28,6 +49,41 @@ PI_AUTH = HTTPBasicAuth(PI_USER, PI_PASSW)
 
 CMX_AUTH = HTTPBasicAuth(CMX_USER, CMX_PASSW)
 
+# optional on-disk HTTP cache, shared by the Spark, APIC-EM and PI sessions, the CMX clients are not cached
+
+HTTP_CACHE = HttpCache(HTTP_CACHE_DIR, HTTP_CACHE_SIZE) if HTTP_CACHE_DIR else None
+
+# keep-alive sessions, one connection pool, timeout budget, deadline and circuit breaker for each backend
+
+SPARK_SESSION = create_api_session(headers={'authorization': SPARK_AUTH}, pool_maxsize=SPARK_POOL_SIZE,
+                                   timeout=SPARK_TIMEOUT, breaker=CircuitBreaker('Spark'), cache=HTTP_CACHE,
+                                   deadline=SPARK_DEADLINE)
+CMX_SESSION = create_api_session(auth=CMX_AUTH, pool_maxsize=CMX_POOL_SIZE,
+                                 timeout=CMX_TIMEOUT, breaker=CircuitBreaker('CMX'), deadline=CMX_DEADLINE)
+EM_SESSION = create_api_session(pool_maxsize=EM_POOL_SIZE, timeout=EM_TIMEOUT, breaker=CircuitBreaker('APIC-EM'),
+                                cache=HTTP_CACHE, deadline=EM_DEADLINE)
+PI_SESSION = create_api_session(auth=PI_AUTH, pool_maxsize=PI_POOL_SIZE,
+                                timeout=PI_TIMEOUT, breaker=CircuitBreaker('PI'), cache=HTTP_CACHE,
+                                deadline=PI_DEADLINE)
+
+for backend_name, backend_session in (('Spark', SPARK_SESSION), ('CMX', CMX_SESSION), ('APIC-EM', EM_SESSION),
+                                      ('PI', PI_SESSION)):
+    instrument_session(backend_session, backend_name)   # bytes transferred, recorded when the metrics are enabled
+
+ROOM_CACHE = SparkRoomCache()    # Spark room title to room id cache
+
+EM_TICKETS = ServiceTicketManager(EM_URL, EM_USER, EM_PASSW, EM_SESSION)    # shared APIC-EM ticket
+
+# APIC-EM and PI network inventory index, synced on schedule when started, or on demand with INVENTORY.sync()
+
+INVENTORY = NetworkInventory(EM_URL, EM_TICKETS, PI_URL, PI_SESSION, refresh_interval=INVENTORY_REFRESH)
+
+# CMX active clients index, refreshed periodically when started, used for the client lookups while fresh
+
+CMX_INDEX = CmxClientIndex(CMX_URL, CMX_SESSION, refresh_interval=CMX_INDEX_REFRESH, max_age=CMX_INDEX_MAX_AGE)
+
+PI_JOBS = PiJobWaiter(PI_URL, PI_SESSION)     # PI job completion waiter, shared by all the callers
+
 
 def pprint(json_data):
     """
@@ -39,26 +95,18 @@ def pprint(json_data):
     print(json.dumps(json_data, indent=4, separators=(' , ', ' : ')))
 
 
+@instrument('APIC-EM')
 def get_em_service_ticket():
     """
-    This function will generate the Auth ticket required to access APIC-EM
-    API call to /ticket is used to create a new user ticket
+    This function will return the Auth ticket required to access APIC-EM
+    The ticket is cached and refreshed before it expires, API call to /ticket is used only to create a new ticket
     :return: APIC-EM ticket
     """
 
-    payload = {'username': EM_USER, 'password': EM_PASSW}
-    url = EM_URL + '/ticket'
-    header = {'content-type': 'application/json'}
-    ticket_response = requests.post(url, data=json.dumps(payload), headers=header, verify=False)
-    if ticket_response is None:
-        print('No data returned!')
-    else:
-        ticket_json = ticket_response.json()
-        ticket = ticket_json['response']['serviceTicket']
-        print('APIC-EM ticket: ', ticket)
-        return ticket
+    return EM_TICKETS.get_ticket()
 
 
+@instrument('Spark')
 def create_spark_room(room_name):
     """
     This function will create a Spark room with the title {room_name}
@@ -69,35 +117,34 @@ def create_spark_room(room_name):
 
     payload = {'title': room_name}
     url = SPARK_URL + '/rooms'
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    room_response = requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    header = {'content-type': 'application/json'}
+    room_response = SPARK_SESSION.post(url, data=json.dumps(payload), headers=header)
     room_json = room_response.json()
     room_number = room_json['id']
+    ROOM_CACHE.store(room_name, room_number)
     print('Created Room with the name :  ', ROOM_NAME)
     return room_number
 
 
+@instrument('Spark')
 def find_spark_room_id(room_name):
     """
     This function will find the Spark room id based on the {room_name}
-    API call to /rooms
+    The room id is returned from the room cache if available, without any API call
+    API call to /rooms, paginated, until the first room with the title {room_name} is found
     :param room_name: the room name for which to find the Spark room id
     :return: room_number: the Spark room id
     """
 
-    payload = {'title': room_name}
-    room_number = None
-    url = SPARK_URL + '/rooms'
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    room_response = requests.get(url, data=json.dumps(payload), headers=header, verify=False)
-    room_list_json = room_response.json()
-    room_list = room_list_json['items']
-    for rooms in room_list:
-        if rooms['title'] == room_name:
-            room_number = rooms['id']
+    room_number = ROOM_CACHE.get(room_name)
+    if room_number is None:
+        room_number = find_room_id_paginated(SPARK_URL, SPARK_SESSION, room_name)
+        if room_number is not None:
+            ROOM_CACHE.store(room_name, room_number)
     return room_number
 
 
+@instrument('Spark')
 def add_spark_room_membership(room_id, email_invite):
     """
     This function will add membership to the Spark room with the {room_id}
@@ -109,11 +156,12 @@ def add_spark_room_membership(room_id, email_invite):
 
     payload = {'roomId': room_id, 'personEmail': email_invite, 'isModerator': 'true'}
     url = SPARK_URL + '/memberships'
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    header = {'content-type': 'application/json'}
+    SPARK_SESSION.post(url, data=json.dumps(payload), headers=header)
     print("Invitation sent to :  ", email_invite)
 
 
+@instrument('Spark')
 def last_spark_room_message(room_id):
     """
     This function will find the last message from the Spark room with the {room_id}
@@ -121,36 +169,142 @@ def last_spark_room_message(room_id):
     :param room_id: the Spark room id
     :return: {last_message} - the text of the last message posted in the room
              {last_person_email} - the author of the last message in the room
+             {last_message_id} - the Spark id of the last message in the room
+             None for each if the room is empty, SparkRoomNotFoundError is raised if the room was deleted
     """
 
-    url = SPARK_URL + '/messages?roomId=' + room_id
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    response = requests.get(url, headers=header, verify=False)
+    url = SPARK_URL + '/messages?max=1&roomId=' + room_id     # only the last message is required
+    header = {'content-type': 'application/json'}
+    response = SPARK_SESSION.get(url, headers=header)
+    if response.status_code == 404:
+        ROOM_CACHE.invalidate(room_id)  # the room was deleted, the cached room id is not valid
+        raise SparkRoomNotFoundError('Spark room not found: ' + room_id, response=response)
+    response.raise_for_status()
     list_messages_json = response.json()
     list_messages = list_messages_json['items']
+    if not list_messages:
+        return [None, None, None]
     last_message = list_messages[0]['text']
     last_person_email = list_messages[0]['personEmail']
+    last_message_id = list_messages[0]['id']
     print('Last room message :  ', last_message)
     print('Last Person Email', last_person_email)
-    return [last_message, last_person_email]
+    return [last_message, last_person_email, last_message_id]
+
+
+@instrument('Spark')
+def get_spark_bot_emails():
+    """
+    This function will find the email addresses of the Spark account of the app, the messages posted by the app
+    are identified by their author, and ignored when read back from the room
+    API call to /people/me
+    :return: list of the email addresses of the app account
+    """
+
+    url = SPARK_URL + '/people/me'
+    header = {'content-type': 'application/json'}
+    response = SPARK_SESSION.get(url, headers=header)
+    response.raise_for_status()
+    return response.json()['emails']
+
+
+@instrument('Spark')
+def get_spark_message(message_id):
+    """
+    This function will find the message with the {message_id}, used for the webhook notifications
+    which include only the message id
+    API call to /messages/{message_id}
+    :param message_id: the Spark message id
+    :return: {message} - the text of the message
+             {person_email} - the author of the message
+    """
+
+    url = SPARK_URL + '/messages/' + message_id
+    header = {'content-type': 'application/json'}
+    response = SPARK_SESSION.get(url, headers=header)
+    response.raise_for_status()
+    message_json = response.json()
+    return [message_json.get('text'), message_json['personEmail']]
+
+
+@instrument('Spark')
+def create_spark_webhook(webhook_name, target_url, room_id, secret=None):
+    """
+    This function will create a Spark webhook for the messages created in the room with the {room_id}
+    API call to /webhooks
+    :param webhook_name: the webhook name
+    :param target_url: the URL Spark will POST the notifications to
+    :param room_id: the Spark room id
+    :param secret: optional secret used by Spark to sign the notifications
+    :return: the Spark webhook id
+    """
+
+    payload = {'name': webhook_name, 'targetUrl': target_url, 'resource': 'messages', 'event': 'created',
+               'filter': 'roomId=' + room_id}
+    if secret:
+        payload['secret'] = secret
+    url = SPARK_URL + '/webhooks'
+    header = {'content-type': 'application/json'}
+    webhook_response = SPARK_SESSION.post(url, data=json.dumps(payload), headers=header)
+    webhook_response.raise_for_status()
+    webhook_id = webhook_response.json()['id']
+    print('Created Spark webhook :  ', webhook_name, ' , target URL: ', target_url)
+    return webhook_id
+
+
+@instrument('Spark')
+def find_spark_webhooks(target_url, room_id):
+    """
+    This function will find the Spark webhooks already registered for the {target_url} and the room with the
+    {room_id}, for example by a previous run of the application
+    API call to /webhooks
+    :param target_url: the URL Spark will POST the notifications to
+    :param room_id: the Spark room id
+    :return: list of the Spark webhook ids
+    """
+
+    url = SPARK_URL + '/webhooks'
+    header = {'content-type': 'application/json'}
+    return [webhook['id'] for webhook in iter_spark_items(SPARK_SESSION, url, {'max': 100})
+            if webhook.get('targetUrl') == target_url and webhook.get('filter') == 'roomId=' + room_id]
+
+
+@instrument('Spark')
+def delete_spark_webhook(webhook_id):
+    """
+    This function will delete the Spark webhook with the {webhook_id}
+    API call to /webhooks/{webhook_id}
+    :param webhook_id: the Spark webhook id
+    :return: none
+    """
+
+    url = SPARK_URL + '/webhooks/' + webhook_id
+    header = {'content-type': 'application/json'}
+    SPARK_SESSION.delete(url, headers=header)
+    print('Deleted Spark webhook :  ', webhook_id)
 
 
+@instrument('Spark')
 def post_spark_room_message(room_id, message):
     """
     This function will post the {message} to the Spark room with the {room_id}
     API call to /messages
     :param room_id: the Spark room id
     :param message: the text of the message to be posted in the room
-    :return: none
+    :return: none, SparkRoomNotFoundError is raised if the room was deleted
     """
 
     payload = {'roomId': room_id, 'text': message}
     url = SPARK_URL + '/messages'
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    header = {'content-type': 'application/json'}
+    response = SPARK_SESSION.post(url, data=json.dumps(payload), headers=header)
+    if response.status_code == 404:
+        ROOM_CACHE.invalidate(room_id)  # the room was deleted, the cached room id is not valid
+        raise SparkRoomNotFoundError('Spark room not found: ' + room_id, response=response)
     print("Message posted :  ", message)
 
 
+@instrument('Spark')
 def delete_spark_room(room_id):
     """
     This function will delete the Spark room with the room Id
@@ -160,23 +314,30 @@ def delete_spark_room(room_id):
     """
 
     url = SPARK_URL + '/rooms/' + room_id
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    requests.delete(url, headers=header, verify=False)
+    header = {'content-type': 'application/json'}
+    SPARK_SESSION.delete(url, headers=header)
+    ROOM_CACHE.invalidate(room_id)
     print("Deleted Spark Room :  ", ROOM_NAME)
 
 
+@instrument('CMX')
 def check_cmx_client(username):
     """
     This function will find out the WLC controller IP address for a client authenticated with the {username}
+    The CMX client index is used if fresh, the CMX query is made only if the client is not in the index
     Call to CMX - /api/location/v2/clients/?username={username}
     :param username: username of the client
     :return: WLC IP address
     """
 
+    if CMX_INDEX.is_fresh():
+        client = CMX_INDEX.lookup_username(username)
+        if client is not None:
+            return client['detectingControllers']
     url = CMX_URL + 'api/location/v2/clients/?username=' + username
     print('\nCMX client info API: ', url, '\n')
     header = {'content-type': 'application/json', 'accept': 'application/json'}
-    response = requests.get(url, headers=header, auth=CMX_AUTH, verify=False)
+    response = hedged_call(CMX_SESSION.get, url, headers=header, hedge_after=CMX_HEDGE_DELAY)
     client_json = response.json()
     pprint(client_json)
     if not client_json:
@@ -186,39 +347,70 @@ def check_cmx_client(username):
     return controller_ip_address
 
 
-def get_controller_hostname(ip_address, ticket):
+@instrument('CMX')
+def check_cmx_clients(usernames):
+    """
+    This function will find out the WLC controller IP addresses for many clients at once, for example all the
+    attendees of a meeting. The duplicate usernames are looked up once, the CMX client index is used if fresh,
+    the clients not in the index are queried concurrently, at most CMX_POOL_SIZE queries at the same time
+    Call to CMX - /api/location/v2/clients/?username={username}, for each client not in the index
+    :param usernames: list of the usernames of the clients
+    :return: ClientLookupResult, {clients} maps each username to the WLC IP address, None if not found,
+             by_controller() groups the usernames by WLC IP address
+    """
+
+    index_lookup = CMX_INDEX.lookup_username if CMX_INDEX.is_fresh() else None
+    return batch_client_lookup(usernames, index_lookup, check_cmx_client, CMX_POOL_SIZE)
+
+
+@instrument('APIC-EM')
+def get_controller_hostname(ip_address, ticket=None):
     """
     Find out the wireless LAN controller hostname of the network device with the {ip_address}
+    The network inventory index is checked first, the API call is made only if the device is not in the index
     Call to:    APIC-EM - network-device/ip-address/{ip_address}
     :param ip_address: network device ip address
-    :param ticket: APIC-EM ticket
+    :param ticket: APIC-EM ticket, the cached ticket is used if None
     :return: network device hostname
     """
 
+    hostname = INVENTORY.hostname_for_ip(ip_address)
+    if hostname is not None:
+        return hostname
     url = EM_URL + '/network-device/ip-address/' + ip_address
-    header = {'accept': 'application/json', 'X-Auth-Token': ticket}
-    device_response = requests.get(url, headers=header, verify=False)
+    header = {'accept': 'application/json'}
+    device_response = hedged_call(EM_TICKETS.request, 'GET', url, ticket=ticket, headers=header,
+                                  hedge_after=EM_HEDGE_DELAY)  # retried once on 401
     device_json = device_response.json()
     hostname = device_json['response']['hostname']
+    INVENTORY.add(ip_address=ip_address, hostname=hostname)
     return hostname
 
 
+@instrument('PI')
 def get_pi_device_id(device_name):
     """
     The function will find out the PI device Id using the device hostname
+    The network inventory index is checked first, the API call is made only if the device is not in the index
     Call to:    Prime Infrastructure - /webacs/api/v1/data/Devices, filtered using the Device Hostname
     :param device_name: network device hostname
     :return: PI device id
     """
 
+    device_id = INVENTORY.pi_id_for_hostname(device_name)
+    if device_id is not None:
+        return device_id
+
     url = PI_URL + '/webacs/api/v1/data/Devices?deviceName=' + device_name
     header = {'content-type': 'application/json', 'accept': 'application/json'}
-    response = requests.get(url, headers=header, verify=False, auth=PI_AUTH)
+    response = PI_SESSION.get(url, headers=header)
     device_id_json = response.json()
     device_id = device_id_json['queryResponse']['entityId'][0]['$']
+    INVENTORY.add(hostname=device_name, pi_id=device_id)
     return device_id
 
 
+@instrument('PI')
 def deploy_pi_wlan_template(controller_name, template_name):
     """
     This function will deploy a WLAN template to a wireless controller through job
@@ -238,40 +430,128 @@ def deploy_pi_wlan_template(controller_name, template_name):
     print(param)
     url = PI_URL + '/webacs/api/v1/op/wlanProvisioning/deployTemplate'
     header = {'content-type': 'application/json', 'accept': 'application/json'}
-    response = requests.put(url, json.dumps(param), headers=header, verify=False, auth=PI_AUTH)
+    response = PI_SESSION.put(url, json.dumps(param), headers=header)
     job_json = response.json()
     job_name = job_json['mgmtResponse']['jobInformation']['jobName']
     print('job name: ', job_name)
     return job_name
 
 
+@instrument('PI')
 def get_pi_job_status(job_name):
     """
-    This function will get PI job status
-    Call to:    PI - /webacs/api/v1/data/JobSummary, filtered by the job name, will provide the job id
-                A second call to /webacs/api/v1/data/JobSummary using the job id
+    This function will get PI job status, the current status even if the job is not completed
+    Call to:    PI - /webacs/api/v1/data/JobSummary?.full=true, filtered by the job name
     :param job_name: Infrastructure job name
            global variable - PI_Auth, HTTP basic auth
     :return: job status
     """
 
-    #  find out the PI job id using the job name
+    return PI_JOBS.job_status(job_name)
 
-    url = PI_URL + '/webacs/api/v1/data/JobSummary?jobName=' + job_name
-    header = {'content-type': 'application/json', 'accept': 'application/json'}
-    response = requests.get(url, headers=header, verify=False, auth=PI_AUTH)
-    job_id_json = response.json()
-    job_id = job_id_json['queryResponse']['entityId'][0]['$']
 
-    #  find out the job status using the job id
+@instrument('PI')
+def wait_pi_job_status(job_name, deadline=JOB_DEADLINE):
+    """
+    This function will wait for the PI job to complete, polling the job status with backoff
+    Call to:    PI - /webacs/api/v1/data/JobSummary?.full=true, filtered by the job names of all outstanding jobs
+    :param job_name: Infrastructure job name
+    :param deadline: maximum seconds to wait for the job
+    :return: job status, TIMEOUT if the job is not completed before the deadline
+    """
 
-    url = PI_URL + '/webacs/api/v1/data/JobSummary/' + job_id
-    header = {'content-type': 'application/json', 'accept': 'application/json'}
-    response = requests.get(url, headers=header, verify=False, auth=PI_AUTH)
-    job_status_json = response.json()
-    #  print(json.dumps(job_status_json, indent=4, separators=(' , ', ' : ')))    # pretty print
-    job_status = job_status_json['queryResponse']['entity'][0]['jobSummaryDTO']['resultStatus']
-    return job_status
+    return PI_JOBS.wait_one(job_name, deadline)
+
+
+DEPLOY_FANOUT = WlanTemplateFanout(deploy_pi_wlan_template, PI_JOBS, FANOUT_WORKERS)  # bounded worker pool
+
+# SparkConnect WLAN state of each controller, deploys WLAN_DEPLOY for the first active HotSpot,
+# and WLAN_DISABLE when the last active HotSpot ends
+
+CONTROLLERS = ControllerStateTracker(deploy_pi_wlan_template, PI_JOBS, WLAN_DEPLOY, WLAN_DISABLE)
+
+
+@instrument('PI')
+def deploy_pi_wlan_template_fanout(controller_names, template_name, deadline=JOB_DEADLINE):
+    """
+    This function will deploy a WLAN template to many wireless controllers concurrently, and wait for the jobs
+    Call to:    Prime Infrastructure - /webacs/api/v1/op/wlanProvisioning/deployTemplate, for each controller
+                Prime Infrastructure - /webacs/api/v1/data/JobSummary, batched job status
+    :param controller_names: list of WLC Prime Infrastructure names
+    :param template_name: WLAN template name
+    :param deadline: maximum seconds to wait for the jobs
+    :return: FanoutResult, the job name and job status for each controller, retry with DEPLOY_FANOUT.retry_failed()
+    """
+
+    return DEPLOY_FANOUT.deploy(controller_names, template_name, deadline)
+
+
+def provisioning_pipeline(person_email, call, notify, acquire, release):
+    """
+    This function will create the dependency graph of the HotSpot provisioning chain
+    The CMX lookup and the APIC-EM ticket run concurrently, the controller hostname is found as soon as both are
+    available, while the message asking the user to connect to WiFi is posted. The PI device id is verified while
+    the WLAN is deployed, the HotSpot is released if the verification fails.
+    :param person_email: the user email
+    :param call: coroutine function, call(function, *args) runs the blocking API function
+    :param notify: coroutine function, notify(message) posts the message in the Spark room
+    :param acquire: coroutine function, deploys the WLAN to the controller hostname, awaits the PI job and returns
+    the job status
+    :param release: coroutine function, removes the HotSpot acquired on the controller hostname
+    :return: the Pipeline, the step results are cmx, ticket, notify, hostname, deploy and pi_id
+    """
+
+    device_id = {}      # the PI device id lookup, started with the deploy
+
+    async def notify_not_connected(controller_ip_address):
+        if controller_ip_address is None:
+            await notify('You are not connected to WiFi, please connect and try again!')
+
+    async def deploy(hostname):
+        lookup = device_id['lookup'] = asyncio.ensure_future(call(get_pi_device_id, hostname))
+        try:
+            job_status = await acquire(hostname)
+        except BaseException:
+            lookup.cancel()
+            raise
+        try:
+            await lookup
+        except Exception:
+            if job_status in SUCCESS_RESULTS:
+                await release(hostname)     # rollback, the controller is not a PI device
+            raise
+        return job_status
+
+    return Pipeline([
+        PipelineStep('cmx', lambda: call(check_cmx_client, person_email)),
+        PipelineStep('ticket', lambda: call(get_em_service_ticket)),
+        PipelineStep('notify', notify_not_connected, requires=('cmx',)),
+        PipelineStep('hostname', lambda controller_ip_address, ticket: call(
+            get_controller_hostname, controller_ip_address or DEFAULT_CONTROLLER_IP, ticket),
+            requires=('cmx', 'ticket')),
+        PipelineStep('deploy', deploy, requires=('hostname',)),
+        PipelineStep('pi_id', lambda job_status: device_id['lookup'], requires=('deploy',))])
+
+
+def warm_up_backends():
+    """
+    This function will resolve and connect to Spark, CMX, APIC-EM and PI in parallel, and validate the credentials
+    Call to:    Spark - /people/me, the access token
+                CMX - /api/location/v2/clients/count, the basic auth
+                APIC-EM - /ticket and /network-device/count, the APIC-EM ticket
+                Prime Infrastructure - /webacs/api/v1/data/Devices?.maxResults=1, the basic auth
+    The keep-alive connections opened stay in the session pools, for the first user requests
+    :return: dict of the backend name to the readiness report
+    """
+
+    checks = [BackendCheck('Spark', SPARK_URL, lambda: SPARK_SESSION.get(SPARK_URL + '/people/me', headers=NO_CACHE)),
+              BackendCheck('CMX', CMX_URL, lambda: CMX_SESSION.get(CMX_URL + 'api/location/v2/clients/count',
+                                                                   headers=NO_CACHE)),
+              BackendCheck('APIC-EM', EM_URL, lambda: EM_TICKETS.request('GET', EM_URL + '/network-device/count',
+                                                                         headers=NO_CACHE)),
+              BackendCheck('PI', PI_URL, lambda: PI_SESSION.get(PI_URL + '/webacs/api/v1/data/Devices',
+                                                                params={'.maxResults': 1}, headers=NO_CACHE))]
+    return warm_up(checks)
 
 
 def main():
@@ -281,6 +561,16 @@ def main():
     LAN switches, WLAN Controllers and AP's, CMX and Cisco Spark are required for this application.
     """
 
+    # optional metrics endpoint, latency, errors and bytes transferred for each API call
+
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
+    # connect to all the backends in parallel and validate the credentials, before the first user request
+
+    if WARMUP:
+        warm_up_backends()
+
     # verify if Spark Room exists, if not create Spark Room, and add membership (optional)
 
     spark_room_id = find_spark_room_id(ROOM_NAME)
@@ -297,76 +587,90 @@ def main():
         post_spark_room_message(spark_room_id, 'Ready for input!')
     print('- ', ROOM_NAME, ' -  Spark room id: ', spark_room_id)
 
-    # check for messages to identify the last message posted and the user's email who posted the message
+    # check for new messages to identify the message posted and the user's email who posted the message
+    # the reader returns every message posted since the previous poll, the messages posted by the app are skipped
 
-    last_message = last_spark_room_message(spark_room_id)[0]
+    bot_emails = get_spark_bot_emails()
+    message_reader = SparkMessageReader(spark_room_id, SPARK_URL, SPARK_SESSION)
+    message_reader.prime()
+    last_message = 'Ready for input!'
 
     while last_message == 'Ready for input!':
         time.sleep(5)
-        last_message = last_spark_room_message(spark_room_id)[0]
-        if last_message == '/E':
-            last_person_email = last_spark_room_message(spark_room_id)[1]
-            post_spark_room_message(spark_room_id, 'How long time do you need the HotSpot for? (in minutes) : ')
-            time.sleep(10)
-            if last_spark_room_message(spark_room_id)[0] == 'How long time do you need the HotSpot for? (in minutes) :':
-                timer = 30 * 60
-            else:
-                timer = int(last_spark_room_message(spark_room_id)[0]) * 60
-        elif last_message != 'Ready for input!':
-            post_spark_room_message(spark_room_id, 'I do not understand you')
+        try:
+            messages = message_reader.new_messages()
+        except SparkRoomNotFoundError:
+            # the room was deleted while waiting, the room is found or created again
+            print('- ', ROOM_NAME, ' -  Spark room deleted')
+            spark_room_id = find_spark_room_id(ROOM_NAME)
+            if spark_room_id is None:
+                spark_room_id = create_spark_room(ROOM_NAME)
             post_spark_room_message(spark_room_id, 'To start HotSpot {Spark:Connect} enter  :  /E')
             post_spark_room_message(spark_room_id, 'Ready for input!')
-            last_message = 'Ready for input!'
-
-    # CMX will use the email address to provide the wireless controller IP address
-    # managing the AP the user is connected to.
-
-    controller_ip_address = check_cmx_client(last_person_email)
-
-    # if controller IP address not found, ask user to connect to WiFi
-
-    if controller_ip_address is None:
-        post_spark_room_message(spark_room_id, 'You are not connected to WiFi, please connect and try again!')
-        controller_ip_address = '172.16.1.26'
-    else:
-        print('We found a WLC at your site, IP address: ', controller_ip_address)
-
-    # create an APIC EM auth ticket
-
-    em_ticket = get_em_service_ticket()
-
-    # find the wireless controller hostname based on the management IP address provided by CMX
-
-    controller_hostname = get_controller_hostname(controller_ip_address, em_ticket)
+            print('- ', ROOM_NAME, ' -  Spark room id: ', spark_room_id)
+            message_reader = SparkMessageReader(spark_room_id, SPARK_URL, SPARK_SESSION)
+            message_reader.prime()
+            continue
+        for message in messages:
+            if message['text'] is None or message['personEmail'] in bot_emails:
+                continue
+            last_message = message['text'].strip()
+            if last_message == '/E':
+                last_person_email = message['personEmail']
+                post_spark_room_message(spark_room_id, 'How long time do you need the HotSpot for? (in minutes) : ')
+                time.sleep(10)
+                timer = 30 * 60
+                for answer in message_reader.new_messages():
+                    if answer['personEmail'] == last_person_email and (answer['text'] or '').strip().isdigit():
+                        timer = int(answer['text']) * 60
+                break
+            else:
+                post_spark_room_message(spark_room_id, 'I do not understand you')
+                post_spark_room_message(spark_room_id, 'To start HotSpot {Spark:Connect} enter  :  /E')
+                post_spark_room_message(spark_room_id, 'Ready for input!')
+                last_message = 'Ready for input!'
+
+    # CMX will use the email address to provide the wireless controller IP address managing the AP the user is
+    # connected to, the APIC-EM ticket is created at the same time. The controller hostname, the PI device Id and
+    # the WLAN template deploy follow as soon as their inputs are available, the deploy is skipped if the SSID is
+    # already live
+
+    async def call(function, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+    async def notify(message):
+        await call(post_spark_room_message, spark_room_id, message)
+
+    pipeline = provisioning_pipeline(last_person_email, call, notify,
+                                     functools.partial(CONTROLLERS.acquire_async, call=call),
+                                     functools.partial(call, CONTROLLERS.release))
+    results = asyncio.run(pipeline.run())
+    controller_hostname = results['hostname']
+    job_status = results['deploy']
+    print('We found a WLC at your site, IP address: ', results['cmx'] or DEFAULT_CONTROLLER_IP)
     print('We found a WLC at your site, hostname: ', controller_hostname)
-
-    # find the controller PI device Id using the WLC hostname
-
-    pi_controller_device_id = get_pi_device_id(controller_hostname)
-    print('Controller PI device Id :  ', pi_controller_device_id)
-
-    # deploy WLAN template to controller to enable the SparkConnect SSID, and get job status
-
-    job_name_wlan = deploy_pi_wlan_template(controller_hostname, WLAN_DEPLOY)
-    time.sleep(20)    # required to give time to PI to deploy the template
-    job_status = get_pi_job_status(job_name_wlan)
+    print('Controller PI device Id :  ', results['pi_id'])
+    print(pipeline.report())
 
     # post status update in Spark, an emoji, and the length of time the HotSpot network will be available
 
     post_spark_room_message(spark_room_id, 'HotSpot {Spark:Connect} ' + job_status)
-    post_spark_room_message(spark_room_id, 'The HotSpot will be available for ' + str(int(timer / 60)) + ' minute')
-    post_spark_room_message(spark_room_id,  '  ' + '\U0001F44D')
+    if job_status in SUCCESS_RESULTS:
+        post_spark_room_message(spark_room_id, 'The HotSpot will be available for ' + str(int(timer / 60)) +
+                                ' minute')
+        post_spark_room_message(spark_room_id,  '  ' + '\U0001F44D')
 
-    # timer required to maintain the HotSpot enabled, user provided
+        # timer required to maintain the HotSpot enabled, user provided
 
-    time.sleep(timer)
+        time.sleep(timer)
 
-    # disable WLAN via WLAN template, to be deployed to controller
+        # disable WLAN via WLAN template, deployed to controller if no other HotSpot is active on the controller
+        # the failed deployments were already released by CONTROLLERS.acquire
 
-    job_disable_wlan = deploy_pi_wlan_template(controller_hostname, WLAN_DISABLE)
+        job_disable_wlan = CONTROLLERS.release(controller_hostname)
 
-    post_spark_room_message(spark_room_id, 'HotSpot {Spark:Connect} has been disabled')
-    post_spark_room_message(spark_room_id, 'Thank you for using our service')
+        post_spark_room_message(spark_room_id, 'HotSpot {Spark:Connect} has been disabled')
+        post_spark_room_message(spark_room_id, 'Thank you for using our service')
 
     # delete Room - optional step, not required
 
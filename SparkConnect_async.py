@@ -0,0 +1,450 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the asyncio provisioning engine for SparkConnect
+# Each hotspot request is a session that moves independently through the provisioning pipeline, CMX lookup and
+# APIC-EM ticket concurrently, controller hostname, PI deploy, and expiry. The blocking API calls from
+# SparkConnect.py run in a thread pool, all the waits are asyncio timers, so one process is able to serve many
+# concurrent hotspot requests.
+# The active HotSpots are leases in the lease scheduler, expired together on each controller.
+
+
+import asyncio
+import functools
+import time
+
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+
+import SparkConnect
+
+from SparkConnect_init import ROOM_NAME, ENGINE_WORKERS, POLL_INTERVAL, DEFAULT_CONTROLLER_IP
+from SparkConnect_init import WEBHOOK_URL, WEBHOOK_PORT, WEBHOOK_SECRET, HISTORY_PATH, HISTORY_INTERVAL
+from SparkConnect_leases import LeaseScheduler
+from SparkConnect_messages import SparkMessageReader
+from SparkConnect_outbox import SparkMessageQueue
+from SparkConnect_rooms import SparkRoomNotFoundError
+from SparkConnect_webhook import WebhookReceiver
+
+INSTRUCTIONS = 'To start HotSpot {Spark:Connect} enter  :  /E'
+READY = 'Ready for input!'
+DURATION_QUESTION = 'How long time do you need the HotSpot for? (in minutes) : '
+EXTEND_INSTRUCTIONS = 'To extend the HotSpot enter  :  /X {minutes}'
+DURATION_WAIT = 10              # seconds to wait for the user to answer the duration question
+DEFAULT_MINUTES = 30            # HotSpot duration if the user does not answer
+POLL_MAX_BACKOFF = 60           # maximum seconds between two polls while Spark is not available
+WEBHOOK_CHECK_INTERVAL = 60     # seconds between two checks of the room for the messages not notified by webhook
+WEBHOOK_GRACE = 10              # seconds a message may take to be notified, before the room is polled
+
+
+class HotspotSession(object):
+    """
+    The state of one hotspot request, from the /E command to the WLAN disable deploy
+    """
+
+    def __init__(self, room_id, person_email, minutes):
+        self.room_id = room_id
+        self.person_email = person_email
+        self.minutes = minutes
+        self.state = 'requested'
+        self.controller_ip_address = None
+        self.controller_hostname = None
+        self.job_status = None
+        self.created = time.time()
+        self.task = None
+        self.lease_id = None
+        self.error = None
+        self.pipeline = None    # the provisioning steps, with the stage timings
+
+
+class ProvisioningEngine(object):
+    """
+    The asyncio provisioning engine, it dispatches the Spark room messages to the command handler,
+    and runs every hotspot session as an independent asyncio task
+    """
+
+    def __init__(self, max_workers=ENGINE_WORKERS, controllers=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.sessions = set()
+        self.pending_duration = {}      # (room id, person email) -> task waiting for the duration answer
+        self.bot_emails = None          # the Spark account of the engine, its messages are ignored when read back
+        self.active = {}                # (room id, person email) -> the active hotspot session
+        self.leases = LeaseScheduler(self.expire_leases)
+        self.outbox = SparkMessageQueue(SparkConnect.SPARK_URL, SparkConnect.SPARK_SESSION)
+        self.controllers = controllers or SparkConnect.CONTROLLERS    # the WLAN state of the controllers
+        self.loop = None
+
+    async def call(self, function, *args):
+        """
+        This function will run the blocking API {function} in the thread pool, without blocking the event loop
+        :param function: the blocking function from SparkConnect.py
+        :param args: the function arguments
+        :return: the function return value
+        """
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args))
+
+    async def post(self, room_id, message):
+        """
+        This function will queue the {message} for the Spark room with the {room_id}
+        The outbound queue merges the consecutive messages to the same room, and delivers them in the background
+        :param room_id: the Spark room id
+        :param message: the text of the message to be posted in the room
+        :return: none
+        """
+
+        self.outbox.post(room_id, message)
+
+    async def identify(self):
+        """
+        This function will find the email addresses of the Spark account of the engine, once
+        The messages posted by this account, by this worker or by the previous owner of the room, are ignored
+        :return: none
+        """
+
+        if self.bot_emails is None:
+            self.bot_emails = set(await self.call(SparkConnect.get_spark_bot_emails))
+
+    async def handle_message(self, room_id, text, person_email):
+        """
+        This function is the command handler, it will process one message posted in the room
+        :param room_id: the Spark room id
+        :param text: the text of the message
+        :param person_email: the author of the message
+        :return: none
+        """
+
+        if text is None or person_email in (self.bot_emails or ()):
+            return
+        text = text.strip()
+        pending = self.pending_duration.pop((room_id, person_email), None)
+        if pending is not None:
+            pending.cancel()
+            if text.isdigit() and int(text) > 0:
+                self.start_session(room_id, person_email, int(text))
+                return
+            self.start_session(room_id, person_email, DEFAULT_MINUTES)
+        if text.startswith('/X'):
+            await self.extend_session(room_id, person_email, text[2:].strip())
+        elif text == '/E':
+            await self.post(room_id, DURATION_QUESTION)
+            key = (room_id, person_email)
+            self.pending_duration[key] = asyncio.ensure_future(self.duration_timeout(room_id, person_email))
+        elif pending is None:
+            await self.post(room_id, 'I do not understand you')
+            await self.post(room_id, INSTRUCTIONS)
+            await self.post(room_id, READY)
+
+    async def duration_timeout(self, room_id, person_email):
+        """
+        This function will start the hotspot session with the default duration if the user does not answer
+        :param room_id: the Spark room id
+        :param person_email: the user email
+        :return: none
+        """
+
+        await asyncio.sleep(DURATION_WAIT)
+        if self.pending_duration.pop((room_id, person_email), None) is not None:
+            self.start_session(room_id, person_email, DEFAULT_MINUTES)
+
+    def start_session(self, room_id, person_email, minutes):
+        """
+        This function will create a new hotspot session and schedule the provisioning task
+        :param room_id: the Spark room id
+        :param person_email: the user email
+        :param minutes: the HotSpot duration in minutes
+        :return: the hotspot session
+        """
+
+        self.loop = asyncio.get_event_loop()
+        session = HotspotSession(room_id, person_email, minutes)
+        self.sessions.add(session)
+        session.task = asyncio.ensure_future(self.provision(session))
+        session.task.add_done_callback(lambda task: self.sessions.discard(session))
+        return session
+
+    async def provision(self, session):
+        """
+        This function will run one hotspot session: the provisioning pipeline, CMX lookup and APIC-EM ticket,
+        controller hostname, deploy and PI device id, the HotSpot lifetime, and the WLAN disable deploy
+        :param session: the hotspot session
+        :return: none
+        """
+
+        room_id = session.room_id
+        try:
+
+            # the provisioning chain as a dependency graph: CMX lookup and APIC-EM ticket concurrently,
+            # controller hostname, the WLAN template deploy to enable the SparkConnect SSID and the PI device id
+            # the deploy is skipped if the SSID is already live on the controller for another user
+
+            session.state = 'provisioning'
+            session.pipeline = SparkConnect.provisioning_pipeline(
+                session.person_email, self.call, functools.partial(self.post, room_id),
+                functools.partial(self.controllers.acquire_async, call=self.call),
+                functools.partial(self.call, self.controllers.release))
+            results = await session.pipeline.run()
+            session.controller_ip_address = results['cmx'] or DEFAULT_CONTROLLER_IP
+            session.controller_hostname = results['hostname']
+            session.job_status = results['deploy']
+
+            await self.post(room_id, 'HotSpot {Spark:Connect} ' + session.job_status)
+            if session.job_status != 'SUCCESS':
+                session.state = 'failed'
+                return
+            await self.post(room_id, 'The HotSpot will be available for ' + str(session.minutes) + ' minute')
+            await self.post(room_id, '  ' + '\U0001F44D')
+            await self.post(room_id, EXTEND_INSTRUCTIONS)
+
+            # HotSpot lifetime, a lease on the controller, the WLAN is disabled when the lease expires
+
+            session.state = 'active'
+            session.lease_id = self.leases.add(session.controller_hostname, session.minutes * 60, session)
+            self.active[(room_id, session.person_email)] = session
+        except asyncio.CancelledError:
+            session.state = 'cancelled'
+            raise
+        except Exception as error:
+            session.state = 'failed'
+            session.error = repr(error)
+            print('HotSpot session for ', session.person_email, ' failed: ', session.error)
+            await self.post(room_id, 'HotSpot {Spark:Connect} request failed, please try again')
+
+    async def extend_session(self, room_id, person_email, minutes):
+        """
+        This function will extend the active HotSpot of the user, without a new WLAN deploy
+        :param room_id: the Spark room id
+        :param person_email: the user email
+        :param minutes: the extra time, in minutes, the default duration if not provided
+        :return: none
+        """
+
+        session = self.active.get((room_id, person_email))
+        minutes = int(minutes) if minutes.isdigit() else DEFAULT_MINUTES
+        if session is None or self.leases.extend(session.lease_id, minutes * 60) is None:
+            await self.post(room_id, 'You do not have an active HotSpot, to start HotSpot {Spark:Connect} enter : /E')
+            return
+        session.minutes += minutes
+        await self.post(room_id, 'The HotSpot will be available for ' + str(minutes) + ' more minutes')
+
+    def expire_leases(self, controller_hostname, leases):
+        """
+        This function is called by the lease scheduler thread, for the leases expired together on one controller
+        One WLAN disable job is deployed for all the leases, only if no other HotSpot is active on the controller,
+        and every user is notified
+        :param controller_hostname: the controller hostname
+        :param leases: list of the expired leases
+        :return: none
+        """
+
+        self.controllers.release(controller_hostname, len(leases))
+        for lease in leases:
+            session = lease.data
+            session.state = 'done'
+            if self.active.get((session.room_id, session.person_email)) is session:
+                del self.active[(session.room_id, session.person_email)]
+            asyncio.run_coroutine_threadsafe(self.notify_disabled(session.room_id), self.loop)
+
+    async def notify_disabled(self, room_id):
+        await self.post(room_id, 'HotSpot {Spark:Connect} has been disabled')
+        await self.post(room_id, 'Thank you for using our service')
+
+    async def poll_room(self, room_id, last_message_id=None, checkpoint=None):
+        """
+        This function will poll the Spark room with the {room_id} and dispatch every new message,
+        in the order they were posted
+        :param room_id: the Spark room id
+        :param last_message_id: the id of the last message dispatched, the polling resumes after it,
+                                the messages posted before the first poll are skipped if None
+        :param checkpoint: optional function called with the id of every message dispatched, the polling stops
+                           when it returns False, the room is served by another worker
+        :return: none, SparkRoomNotFoundError is raised if the room was deleted
+        """
+
+        message_reader = SparkMessageReader(room_id, SparkConnect.SPARK_URL, SparkConnect.SPARK_SESSION)
+        if last_message_id:
+            message_reader.resume(last_message_id)
+        else:
+            await self.call(message_reader.prime)
+        delay = POLL_INTERVAL
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.identify()
+                messages = await self.call(message_reader.new_messages)
+            except SparkRoomNotFoundError:
+                raise
+            except requests.exceptions.RequestException as error:
+                delay = min(delay * 2, POLL_MAX_BACKOFF)    # Spark unavailable, the leases are kept, poll again
+                print('Spark room poll failed, retry in ', delay, ' seconds: ', repr(error))
+                continue
+            delay = POLL_INTERVAL
+            for message in messages:
+                await self.handle_message(room_id, message['text'], message['personEmail'])
+                if checkpoint and not await self.call(checkpoint, message['id']):
+                    print('Spark room ', room_id, ' - served by another worker, polling stopped')
+                    return
+
+    async def receive_webhooks(self, room_id, webhook_url, port, secret=None):
+        """
+        This function will start the local webhook receiver and register the Spark webhook for the room
+        The webhooks left for the same URL and room by a previous run are deleted first, so every message is
+        notified once. The notifications are passed to the command handler running in the event loop
+        :param room_id: the Spark room id
+        :param webhook_url: the public URL Spark will POST the notifications to
+        :param port: the local port of the webhook receiver
+        :param secret: the webhook secret
+        :return: the webhook receiver, or None if the webhook could not be created
+        """
+
+        loop = asyncio.get_event_loop()
+
+        def dispatch(message_room_id, text, person_email):
+            if message_room_id == room_id:
+                asyncio.run_coroutine_threadsafe(self.handle_message(message_room_id, text, person_email), loop)
+
+        receiver = WebhookReceiver(dispatch, port, secret=secret)
+        receiver.start()
+        try:
+            await self.identify()
+            for webhook_id in await self.call(SparkConnect.find_spark_webhooks, webhook_url, room_id):
+                await self.call(SparkConnect.delete_spark_webhook, webhook_id)
+            receiver.webhook_id = await self.call(SparkConnect.create_spark_webhook, 'SparkConnect', webhook_url,
+                                                  room_id, secret)
+        except Exception as error:
+            print('Spark webhook not created, polling the room: ', repr(error))
+            receiver.stop()
+            return None
+        return receiver
+
+    async def stop_webhooks(self, receiver):
+        """
+        This function will delete the Spark webhook and stop the local webhook receiver
+        :param receiver: the webhook receiver
+        :return: none
+        """
+
+        receiver.stop()
+        try:
+            await self.call(SparkConnect.delete_spark_webhook, receiver.webhook_id)
+        except Exception as error:
+            print('Spark webhook not deleted: ', repr(error))
+
+    async def watch_webhooks(self, room_id, receiver):
+        """
+        This function will check the room every WEBHOOK_CHECK_INTERVAL seconds for the messages not notified by
+        the webhook. A message still not notified WEBHOOK_GRACE seconds later means the webhook delivery stopped,
+        the missed messages are dispatched, and the function returns, the room is polled from then on
+        :param room_id: the Spark room id
+        :param receiver: the webhook receiver
+        :return: the id of the last message dispatched, the polling resumes after it,
+                 SparkRoomNotFoundError is raised if the room was deleted
+        """
+
+        message_reader = SparkMessageReader(room_id, SparkConnect.SPARK_URL, SparkConnect.SPARK_SESSION)
+        await self.call(message_reader.prime)
+        while True:
+            await asyncio.sleep(WEBHOOK_CHECK_INTERVAL)
+            try:
+                messages = await self.call(message_reader.new_messages)
+            except SparkRoomNotFoundError:
+                raise
+            except requests.exceptions.RequestException as error:
+                print('Spark room check failed: ', repr(error))
+                continue
+            missed = [message for message in messages if not receiver.is_seen(message['id'])]
+            if not missed:
+                continue
+            await asyncio.sleep(WEBHOOK_GRACE)
+            missed = [message for message in missed if receiver.remember(message['id'])]
+            if missed:
+                print('Spark webhook notifications stopped, polling the room')
+                for message in missed:
+                    await self.handle_message(room_id, message['text'], message['personEmail'])
+                return messages[-1]['id']
+
+    def start_services(self):
+        """
+        This function will start the background services used by the engine, the metrics endpoint,
+        the backend connections pre-warming, the network inventory and CMX client indexes,
+        and the optional CMX history recorder
+        :return: none
+        """
+
+        if SparkConnect.METRICS_PORT:
+            SparkConnect.start_metrics_server(SparkConnect.METRICS_PORT)
+        if SparkConnect.WARMUP:
+            SparkConnect.warm_up_backends()     # warm connections and validated credentials for the first request
+        SparkConnect.INVENTORY.start()     # controller hostname and PI device id lookups from the local index
+        SparkConnect.CMX_INDEX.start()     # CMX client lookups from the local index
+        if HISTORY_PATH:
+            from SparkConnect_history import CmxHistoryStore, CmxHistoryRecorder   # numpy is required
+            CmxHistoryRecorder(SparkConnect.CMX_INDEX, CmxHistoryStore(HISTORY_PATH, HISTORY_INTERVAL)).start()
+
+    async def run(self, room_name, webhook_url=WEBHOOK_URL):
+        """
+        This function will find or create the Spark room with the {room_name}, post the instructions,
+        and serve the hotspot requests posted in the room
+        The messages are received by webhook if {webhook_url} is configured, the room is polled otherwise,
+        or when the webhook notifications stop, the webhook is deleted when the engine stops
+        If the room is deleted, it is found or created again
+        :param room_name: the Spark room name
+        :param webhook_url: the public URL of the webhook receiver, or None
+        :return: none
+        """
+
+        self.start_services()
+        while True:
+            room_id = await self.call(SparkConnect.find_spark_room_id, room_name)
+            if room_id is None:
+                room_id = await self.call(SparkConnect.create_spark_room, room_name)
+            await self.post(room_id, INSTRUCTIONS)
+            await self.post(room_id, READY)
+            print('- ', room_name, ' -  Spark room id: ', room_id)
+            try:
+                await self.serve_room(room_id, webhook_url)
+                return
+            except SparkRoomNotFoundError:
+                print('- ', room_name, ' -  Spark room deleted, the room is found or created again')
+                SparkConnect.ROOM_CACHE.invalidate(room_id)
+
+    async def serve_room(self, room_id, webhook_url):
+        """
+        This function will serve the hotspot requests posted in the room, received by webhook or polled
+        :param room_id: the Spark room id
+        :param webhook_url: the public URL of the webhook receiver, or None
+        :return: none, SparkRoomNotFoundError is raised if the room was deleted
+        """
+
+        receiver = None
+        if webhook_url:
+            receiver = await self.receive_webhooks(room_id, webhook_url, WEBHOOK_PORT, WEBHOOK_SECRET)
+        if receiver is None:
+            await self.poll_room(room_id)
+            return
+        try:
+            last_message_id = await self.watch_webhooks(room_id, receiver)   # the receiver dispatches the messages
+        finally:
+            await self.stop_webhooks(receiver)
+        await self.poll_room(room_id, last_message_id)
+
+
+def main():
+    """
+    This program will run the SparkConnect application with the asyncio provisioning engine.
+    Many users are able to request a HotSpot at the same time, each request is an independent session.
+    """
+
+    engine = ProvisioningEngine()
+    try:
+        asyncio.run(engine.run(ROOM_NAME))
+    except KeyboardInterrupt:
+        print('\nEnd of Application Run!')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the micro-benchmark suite for the SparkConnect API functions
+# Every benchmark calls one API function against the local stand-in servers, and reports the throughput and
+# the latency percentiles. The results are saved to a JSON file, and compared with the previous saved results,
+# so the performance regressions are measured offline. The results are saved as the new baseline only if there is
+# no regression, or with --update-baseline, the exit code is 1 if a benchmark is slower than the baseline.
+# Usage:  python SparkConnect_bench.py [--update-baseline] [benchmark name filter ...]
+
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+from SparkConnect_standins import StandinData, start_standins, stop_standins, use_standins
+
+BENCH_ITERATIONS = 200          # timed calls for each benchmark
+BENCH_WARMUP = 10               # calls before the timed calls, not measured
+BENCH_CONCURRENCY = 1           # number of concurrent callers
+BENCH_LATENCY = 0.0             # stand-in latency of every request, in seconds
+BENCH_RESULTS_FILE = 'bench_results.json'
+REGRESSION_TOLERANCE = 0.20     # a p50 or p90 slower by more than 20% is reported as a regression
+REGRESSION_MIN_MS = 0.1         # the latencies below 0.1 ms are timer noise, not compared
+
+
+def percentile(sorted_values, fraction):
+    """
+    This function will find the percentile of the sorted values, nearest rank
+    :param sorted_values: the sorted list of values
+    :param fraction: the percentile, 0.5 for p50, 0.99 for p99
+    :return: the percentile value, None for an empty list
+    """
+
+    if not sorted_values:
+        return None
+    rank = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class BenchResult(object):
+    """
+    The result of one benchmark, the latency of every timed call and the number of failed calls
+    """
+
+    def __init__(self, name, concurrency):
+        self.name = name
+        self.concurrency = concurrency
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def summary(self):
+        """
+        This function will calculate the throughput and the latency percentiles, in milliseconds
+        :return: dict of the benchmark statistics
+        """
+
+        latencies = sorted(self.latencies)
+        calls = len(latencies) + self.errors
+        return {'name': self.name, 'calls': calls, 'errors': self.errors, 'concurrency': self.concurrency,
+                'throughput': calls / self.elapsed if self.elapsed else 0.0,
+                'p50_ms': (percentile(latencies, 0.50) or 0) * 1000,
+                'p90_ms': (percentile(latencies, 0.90) or 0) * 1000,
+                'p99_ms': (percentile(latencies, 0.99) or 0) * 1000,
+                'max_ms': (latencies[-1] if latencies else 0) * 1000}
+
+
+def run_benchmark(name, call, setup=None, iterations=BENCH_ITERATIONS, warmup=BENCH_WARMUP,
+                  concurrency=BENCH_CONCURRENCY):
+    """
+    This function will run the benchmark of the {call}
+    :param name: the benchmark name
+    :param call: the function to benchmark, called with the iteration number
+    :param setup: optional function called with the iteration number before each call, not measured
+    :param iterations: the number of timed calls
+    :param warmup: the number of calls before the timed calls
+    :param concurrency: the number of concurrent callers
+    :return: the BenchResult
+    """
+
+    for iteration in range(warmup):
+        if setup:
+            setup(iteration)
+        call(iteration)
+    result = BenchResult(name, concurrency)
+    counter = iter(range(iterations))
+    lock = threading.Lock()
+
+    def caller():
+        while True:
+            with lock:
+                iteration = next(counter, None)
+            if iteration is None:
+                return
+            if setup:
+                setup(iteration)
+            start = time.perf_counter()
+            try:
+                call(iteration)
+                latency = time.perf_counter() - start
+                with lock:
+                    result.latencies.append(latency)
+            except Exception:
+                with lock:
+                    result.errors += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=caller) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def benchmark_cases(data):
+    """
+    This function will create the benchmarks of the SparkConnect API functions, for the stand-in {data}
+    The functions are called through SparkConnect, after use_standins()
+    :param data: the StandinData served by the stand-ins
+    :return: list of (name, call, setup)
+    """
+
+    import SparkConnect
+
+    room_name = data.rooms[-1]['title']         # the last page of the room list
+    room_id = data.rooms[-1]['id']
+    usernames = [client['userName'] for client in data.clients]
+    controllers = data.controllers
+    job_names = []
+
+    def clear_room_cache(iteration):
+        SparkConnect.ROOM_CACHE.rooms.clear()
+
+    def clear_inventory(iteration):
+        with SparkConnect.INVENTORY.lock:
+            SparkConnect.INVENTORY.by_ip.clear()
+            SparkConnect.INVENTORY.by_hostname.clear()
+            SparkConnect.INVENTORY.by_pi_id.clear()
+
+    def stale_cmx_index(iteration):
+        SparkConnect.CMX_INDEX.last_refresh = 0
+
+    def fresh_cmx_index(iteration):
+        if not SparkConnect.CMX_INDEX.is_fresh():
+            SparkConnect.CMX_INDEX.refresh()
+
+    def deploy(iteration):
+        controller = controllers[iteration % len(controllers)]
+        job_names.append(SparkConnect.deploy_pi_wlan_template(controller['hostname'], SparkConnect.WLAN_DEPLOY))
+
+    def job_status(iteration):
+        if not job_names:
+            deploy(iteration)
+        SparkConnect.get_pi_job_status(job_names[iteration % len(job_names)])
+
+    return [
+        ('find_spark_room_id paginated', lambda i: SparkConnect.find_spark_room_id(room_name), clear_room_cache),
+        ('find_spark_room_id cached', lambda i: SparkConnect.find_spark_room_id(room_name), None),
+        ('post_spark_room_message', lambda i: SparkConnect.post_spark_room_message(room_id, 'Bench %d' % i), None),
+        ('last_spark_room_message', lambda i: SparkConnect.last_spark_room_message(room_id), None),
+        ('check_cmx_client API', lambda i: SparkConnect.check_cmx_client(usernames[i % len(usernames)]),
+         stale_cmx_index),
+        ('check_cmx_client index', lambda i: SparkConnect.check_cmx_client(usernames[i % len(usernames)]),
+         fresh_cmx_index),
+        ('get_em_service_ticket', lambda i: SparkConnect.get_em_service_ticket(), None),
+        ('get_controller_hostname API',
+         lambda i: SparkConnect.get_controller_hostname(controllers[i % len(controllers)]['ip_address']),
+         clear_inventory),
+        ('get_controller_hostname inventory',
+         lambda i: SparkConnect.get_controller_hostname(controllers[i % len(controllers)]['ip_address']), None),
+        ('get_pi_device_id API',
+         lambda i: SparkConnect.get_pi_device_id(controllers[i % len(controllers)]['hostname']), clear_inventory),
+        ('deploy_pi_wlan_template', deploy, None),
+        ('get_pi_job_status', job_status, None),
+    ]
+
+
+def print_report(summaries, baseline=None):
+    """
+    This function will print the benchmark results, compared with the {baseline} results if available
+    :param summaries: list of the benchmark summaries
+    :param baseline: dict of the benchmark name to the summary of a previous run, or None
+    :return: list of the names of the benchmarks slower than the baseline
+    """
+
+    regressions = []
+    print('\n%-36s %8s %6s %10s %9s %9s %9s %9s' % ('benchmark', 'calls', 'errors', 'calls/s', 'p50 ms', 'p90 ms',
+                                                   'p99 ms', 'max ms'))
+    for summary in summaries:
+        line = '%-36s %8d %6d %10.1f %9.3f %9.3f %9.3f %9.3f' % (
+            summary['name'], summary['calls'], summary['errors'], summary['throughput'], summary['p50_ms'],
+            summary['p90_ms'], summary['p99_ms'], summary['max_ms'])
+        previous = (baseline or {}).get(summary['name'])
+        if previous and previous['p50_ms'] and previous['p90_ms']:
+            p50_change = summary['p50_ms'] / previous['p50_ms'] - 1
+            p90_change = summary['p90_ms'] / previous['p90_ms'] - 1
+            line += '   p50 %+.0f%%, p90 %+.0f%%' % (p50_change * 100, p90_change * 100)
+            if ((p50_change > REGRESSION_TOLERANCE and summary['p50_ms'] > REGRESSION_MIN_MS) or
+                    (p90_change > REGRESSION_TOLERANCE and summary['p90_ms'] > REGRESSION_MIN_MS)):
+                line += '  REGRESSION'
+                regressions.append(summary['name'])
+        print(line)
+    return regressions
+
+
+def main():
+    """
+    This program will run the benchmarks matching the command line filters, all the benchmarks if none,
+    against the local stand-in servers
+    """
+
+    update_baseline = '--update-baseline' in sys.argv[1:]
+    name_filters = [argument for argument in sys.argv[1:] if argument != '--update-baseline']
+    data = StandinData(num_clients=5000, num_controllers=20, num_rooms=500)
+    servers = start_standins(data, latency=BENCH_LATENCY)
+    use_standins(servers)
+    summaries = []
+    try:
+        for name, call, setup in benchmark_cases(data):
+            if name_filters and not any(name_filter in name for name_filter in name_filters):
+                continue
+            print('Running benchmark: ', name)
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):    # the API functions print
+                result = run_benchmark(name, call, setup)
+            summaries.append(result.summary())
+    finally:
+        stop_standins(servers)
+
+    baseline = {}
+    if os.path.exists(BENCH_RESULTS_FILE):
+        with open(BENCH_RESULTS_FILE) as results_file:
+            baseline = {summary['name']: summary for summary in json.load(results_file)}
+    regressions = print_report(summaries, baseline)
+    if not regressions or update_baseline:
+        baseline.update((summary['name'], summary) for summary in summaries)  # the benchmarks not run are kept
+        with open(BENCH_RESULTS_FILE, 'w') as results_file:
+            json.dump(list(baseline.values()), results_file, indent=4)
+        print('\nResults saved to ', BENCH_RESULTS_FILE)
+    if regressions:
+        print('Regressions: ', regressions)
+        if not update_baseline:
+            print('Baseline not updated, run with --update-baseline to accept the new results')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
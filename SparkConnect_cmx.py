@@ -0,0 +1,206 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the in-memory CMX client index
+# A background thread downloads the CMX active clients periodically, and indexes them by MAC address and username.
+# The client lookups are answered from the index while it is fresh enough, instead of one CMX query per lookup.
+# The active clients response is parsed as a stream, one client at a time.
+# The batch lookups resolve many usernames or MAC addresses at once, from the index if fresh, the clients not
+# in the index are queried concurrently, with a bounded number of CMX queries in progress.
+
+
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from SparkConnect_stream import stream_json_items
+
+CMX_INDEX_REFRESH = 30      # seconds between two downloads of the active clients
+CMX_INDEX_MAX_AGE = 60      # seconds, the index is not used for lookups if older
+CMX_LOOKUP_WORKERS = 10     # maximum number of CMX client queries in progress, for one batch lookup
+
+
+def client_record(client):
+    """
+    This function will keep only the client info required for the lookups
+    :param client: the CMX client JSON
+    :return: dict with the {macAddress}, {userName}, {detectingControllers} and {location} keys
+    """
+
+    map_info = client.get('mapInfo') or {}
+    coordinate = client.get('mapCoordinate') or {}
+    return {'macAddress': client.get('macAddress'),
+            'userName': client.get('userName'),
+            'detectingControllers': client.get('detectingControllers'),
+            'location': {'mapHierarchyString': map_info.get('mapHierarchyString'),
+                         'x': coordinate.get('x'),
+                         'y': coordinate.get('y'),
+                         'unit': coordinate.get('unit')}}
+
+
+class CmxClientIndex(object):
+    """
+    In-memory index of the CMX active clients, keyed by MAC address and username
+    The CMX calls are made through the {session}, to the {cmx_url}
+    """
+
+    def __init__(self, cmx_url, session, refresh_interval=CMX_INDEX_REFRESH, max_age=CMX_INDEX_MAX_AGE):
+        self.cmx_url = cmx_url
+        self.session = session
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.by_mac = {}
+        self.by_username = {}
+        self.last_refresh = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def refresh(self):
+        """
+        This function will download all the active clients and replace the index
+        REST API call to CMX - /api/location/v2/clients/active
+        :return: number of active clients
+        """
+
+        url = self.cmx_url + 'api/location/v2/clients/active'
+        header = {'content-type': 'application/json', 'accept': 'application/json'}
+        by_mac = {}
+        by_username = {}
+        for client in stream_json_items(self.session, url, headers=header):
+            record = client_record(client)
+            if record['macAddress']:
+                by_mac[record['macAddress'].lower()] = record
+            if record['userName']:
+                by_username[record['userName'].lower()] = record
+        self.by_mac, self.by_username = by_mac, by_username
+        self.last_refresh = time.time()
+        return len(by_mac)
+
+    def clients(self):
+        """
+        This function will return the records of all the active clients in the index
+        :return: list of client records
+        """
+
+        return list(self.by_mac.values())
+
+    def is_fresh(self):
+        """
+        This function will check if the index is recent enough to answer the lookups
+        :return: True if the index was refreshed in the last {max_age} seconds
+        """
+
+        return time.time() - self.last_refresh < self.max_age
+
+    def lookup_mac(self, mac_address):
+        """
+        This function will find the client with the {mac_address}
+        :param mac_address: client MAC address
+        :return: the client record, or None if not found
+        """
+
+        return self.by_mac.get(mac_address.lower())
+
+    def lookup_username(self, username):
+        """
+        This function will find the client authenticated with the {username}
+        :param username: username of the client
+        :return: the client record, or None if not found
+        """
+
+        return self.by_username.get(username.lower())
+
+    def refresh_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as error:
+                print('CMX client index refresh failed: ', repr(error))
+            self.stop_event.wait(self.refresh_interval)
+
+    def start(self):
+        """
+        This function will start the periodic refresh of the index, in a background thread
+        :return: none
+        """
+
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.refresh_loop, name='cmx-client-index', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        This function will stop the periodic refresh of the index
+        :return: none
+        """
+
+        self.stop_event.set()
+        self.thread = None
+
+
+class ClientLookupResult(object):
+    """
+    The result of a batch client lookup
+    {clients} is a dict of the username or MAC address to the detectingControllers IP address, None if not found,
+    {errors} is a dict of the username or MAC address to the error of the failed CMX queries
+    """
+
+    def __init__(self):
+        self.clients = {}
+        self.errors = {}
+
+    def by_controller(self):
+        """
+        This function will group the clients found by the controller detecting them
+        :return: dict of the controller IP address to the list of usernames or MAC addresses
+        """
+
+        groups = {}
+        for identity, controller_ip_address in self.clients.items():
+            if controller_ip_address is not None:
+                groups.setdefault(controller_ip_address, []).append(identity)
+        return groups
+
+    def not_found(self):
+        return [identity for identity, controller_ip_address in self.clients.items() if controller_ip_address is None]
+
+
+def batch_client_lookup(identities, index_lookup, query_function, max_workers=CMX_LOOKUP_WORKERS):
+    """
+    This function will find the controllers detecting many clients at once
+    The {identities} are deduplicated, without regard to case, the first spelling is kept. The clients found with
+    {index_lookup} are answered without a CMX query, the other clients are queried with {query_function},
+    at most {max_workers} queries at the same time.
+    :param identities: list of the usernames or MAC addresses
+    :param index_lookup: CmxClientIndex lookup_username or lookup_mac, None if the index is not fresh
+    :param query_function: the single client lookup, returning the WLC IP address or None
+    :param max_workers: maximum number of concurrent CMX queries
+    :return: the ClientLookupResult
+    """
+
+    result = ClientLookupResult()
+    unique = {}
+    for identity in identities:
+        unique.setdefault(identity.lower(), identity)
+    queries = []
+    for identity in unique.values():
+        client = index_lookup(identity) if index_lookup is not None else None
+        if client is not None:
+            result.clients[identity] = client['detectingControllers']
+        else:
+            queries.append(identity)
+    if queries:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+            futures = {identity: executor.submit(query_function, identity) for identity in queries}
+            for identity, future in futures.items():
+                try:
+                    result.clients[identity] = future.result()
+                except Exception as error:
+                    result.errors[identity] = repr(error)
+    print('CMX batch lookup of ', len(unique), ' clients: ', len(unique) - len(queries), ' from the index, ',
+          len(queries), ' queried, ', len(result.by_controller()), ' controllers, ', len(result.errors), ' errors')
+    return result
@@ -0,0 +1,370 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the multi-controller WLAN template deployment
+# The WLAN template is deployed to many controllers concurrently by a bounded worker pool, the PI jobs are
+# tracked together by the job waiter, and the results are aggregated per controller.
+# The controller state tracker skips the deployments that would not change the WLAN state of a controller.
+
+
+import asyncio
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from SparkConnect_jobs import JOB_DEADLINE, JOB_TIMEOUT, resolve_future
+
+FANOUT_WORKERS = 8      # maximum number of concurrent deployTemplate calls
+
+DEPLOY_ERROR = 'ERROR'  # status of a controller if the deployTemplate call failed
+SUCCESS_RESULTS = ('SUCCESS',)
+FAILED_RESULTS = ('FAILURE', DEPLOY_ERROR)  # the template was not applied, any other result may have applied it
+
+
+def is_live_after(template_status, enabled):
+    """
+    This function will find the WLAN state after a deployment, the TIMEOUT and PARTIAL_SUCCESS deployments may
+    have applied the template, PI usually completes them later, so the WLAN is considered possibly live
+    :param template_status: the job status of the deployment, None if the deployTemplate call failed
+    :param enabled: True for the enable template, False for the disable template
+    :return: True if the WLAN is live, or possibly live
+    """
+
+    if enabled:
+        return template_status is not None and template_status not in FAILED_RESULTS
+    return template_status is None or template_status in FAILED_RESULTS
+
+
+class FanoutResult(object):
+    """
+    The result of a WLAN template deployment to many controllers
+    {controllers} is a dict of the controller name to a dict with the {job_name}, {status} and {error} keys
+    """
+
+    def __init__(self, template_name):
+        self.template_name = template_name
+        self.controllers = {}
+
+    def succeeded(self):
+        return [name for name, result in self.controllers.items() if result['status'] in SUCCESS_RESULTS]
+
+    def failed(self):
+        return [name for name, result in self.controllers.items() if result['status'] not in SUCCESS_RESULTS]
+
+    def running(self):
+        return [name for name, result in self.controllers.items() if result['status'] == JOB_TIMEOUT]
+
+    def summary(self):
+        """
+        This function will count the controllers for each deployment status
+        :return: dict of the status to the number of controllers
+        """
+
+        counts = {}
+        for result in self.controllers.values():
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        return counts
+
+
+class WlanTemplateFanout(object):
+    """
+    Deploys a WLAN template to many controllers concurrently
+    {deploy_function} is deploy_pi_wlan_template(controller_name, template_name), returning the PI job name,
+    {job_waiter} is the PiJobWaiter used to track the jobs
+    """
+
+    def __init__(self, deploy_function, job_waiter, max_workers=FANOUT_WORKERS):
+        self.deploy_function = deploy_function
+        self.job_waiter = job_waiter
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def deploy(self, controller_names, template_name, deadline=JOB_DEADLINE):
+        """
+        This function will deploy the {template_name} to all the {controller_names}, and wait for the PI jobs
+        :param controller_names: list of the controller names
+        :param template_name: WLAN template name, WLAN_DEPLOY or WLAN_DISABLE
+        :param deadline: maximum seconds to wait for the PI jobs
+        :return: the FanoutResult
+        """
+
+        result = FanoutResult(template_name)
+        controller_names = list(dict.fromkeys(controller_names))    # deploy once to each controller
+        futures = {name: self.executor.submit(self.deploy_function, name, template_name)
+                   for name in controller_names}
+        for name, future in futures.items():
+            try:
+                result.controllers[name] = {'job_name': future.result(), 'status': None, 'error': None}
+            except Exception as error:
+                result.controllers[name] = {'job_name': None, 'status': DEPLOY_ERROR, 'error': repr(error)}
+        job_names = [entry['job_name'] for entry in result.controllers.values() if entry['job_name']]
+        if job_names:
+            statuses = self.job_waiter.wait(job_names, deadline)
+            for entry in result.controllers.values():
+                if entry['job_name']:
+                    entry['status'] = statuses[entry['job_name']]
+        print('WLAN template ', template_name, ' deployed to ', len(controller_names), ' controllers: ',
+              result.summary())
+        return result
+
+    def retry_failed(self, result, deadline=JOB_DEADLINE):
+        """
+        This function will deploy the template again to the controllers that failed, and update the {result}
+        The jobs not completed before the previous deadline are awaited first, the template is not deployed again
+        to the controllers with a job still running
+        :param result: the FanoutResult of a previous deployment
+        :param deadline: maximum seconds to wait for the PI jobs
+        :return: the updated FanoutResult
+        """
+
+        running = {name: result.controllers[name]['job_name'] for name in result.running()}
+        if running:
+            statuses = self.job_waiter.wait(list(running.values()), deadline)
+            for name, job_name in running.items():
+                result.controllers[name]['status'] = statuses[job_name]
+        failed = [name for name in result.failed() if result.controllers[name]['status'] != JOB_TIMEOUT]
+        if failed:
+            retry = self.deploy(failed, result.template_name, deadline)
+            result.controllers.update(retry.controllers)
+        return result
+
+
+class PendingDeploy(object):
+    """
+    One WLAN template deployment in progress on a controller, the other callers wait for its job status,
+    the threads on the {event}, the asyncio tasks on a future resolved in their event loop
+    """
+
+    def __init__(self, template_name):
+        self.template_name = template_name
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.futures = []
+        self.status = None
+        self.error = None
+
+    def complete(self, status, error=None):
+        with self.lock:
+            self.status = status
+            self.error = error
+            self.event.set()
+            futures, self.futures = self.futures, []
+        for loop, future in futures:
+            loop.call_soon_threadsafe(resolve_future, future, status)
+
+    async def wait_async(self):
+        with self.lock:
+            if self.event.is_set():
+                return self.status
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self.futures.append((loop, future))
+        return await future
+
+
+class ControllerState(object):
+    """
+    The SparkConnect WLAN state of one controller, and the number of active HotSpots using it
+    {live} is True if the WLAN is live, or possibly live after a TIMEOUT or PARTIAL_SUCCESS deployment
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.live = False
+        self.job_status = None
+        self.pending = None     # the PendingDeploy in progress, the lock is not held while the job runs
+
+
+class ControllerStateTracker(object):
+    """
+    Per-controller WLAN state tracker, reference counting the active HotSpots on each controller
+    The {enable_template} is deployed only if the WLAN is not already live on the controller,
+    the {disable_template} is deployed only when the last active HotSpot on the controller ends
+    The asyncio callers use acquire_async and release_async, the PI jobs are awaited without holding a thread
+    """
+
+    def __init__(self, deploy_function, job_waiter, enable_template, disable_template, deadline=JOB_DEADLINE):
+        self.deploy_function = deploy_function
+        self.job_waiter = job_waiter
+        self.enable_template = enable_template
+        self.disable_template = disable_template
+        self.deadline = deadline
+        self.lock = threading.Lock()
+        self.controllers = {}
+
+    def state(self, controller_name):
+        with self.lock:
+            state = self.controllers.get(controller_name)
+            if state is None:
+                state = self.controllers[controller_name] = ControllerState()
+            return state
+
+    def deploy(self, controller_name, template_name):
+        job_name = self.deploy_function(controller_name, template_name)
+        return self.job_waiter.wait_one(job_name, self.deadline)
+
+    def reserve(self, controller_name, state):
+        """
+        This function will add one active HotSpot on the controller, and find the enable deployment to wait for
+        :param controller_name: the controller name
+        :param state: the ControllerState
+        :return: the PendingDeploy, and True if the caller runs the deployment, False if the caller waits for it.
+        A disable deployment in progress is returned with None, the caller waits for it and tries again.
+        """
+
+        with state.lock:
+            pending = state.pending
+            if pending is not None and pending.template_name != self.enable_template:
+                return pending, None
+            state.active += 1
+            if pending is not None:
+                return pending, False
+            if state.live and state.job_status in SUCCESS_RESULTS:
+                print('WLAN already live on controller ', controller_name, ', deploy skipped')
+                pending = PendingDeploy(self.enable_template)
+                pending.complete(state.job_status)
+                return pending, False
+            state.pending = PendingDeploy(self.enable_template)
+            return state.pending, True
+
+    def reserve_disable(self, state, count):
+        """
+        This function will remove {count} active HotSpots from the controller
+        :param state: the ControllerState
+        :param count: the number of HotSpots ended
+        :return: the PendingDeploy of the disable template, the caller runs it, or None if not required
+        """
+
+        with state.lock:
+            state.active = max(state.active - count, 0)
+            if state.active > 0 or not state.live or state.pending is not None:
+                return None
+            state.pending = PendingDeploy(self.disable_template)
+            return state.pending
+
+    def deploy_done(self, state, pending, status, error):
+        """
+        This function will update the WLAN state after the {pending} deployment, and wake up the callers waiting
+        """
+
+        enabled = pending.template_name == self.enable_template
+        with state.lock:
+            state.live = is_live_after(None if error else status, enabled)
+            if enabled:
+                state.job_status = status
+            state.pending = None
+        pending.complete(status, error)
+
+    def run_deploy(self, controller_name, state, pending):
+        status, error = DEPLOY_ERROR, None
+        try:
+            status = self.deploy(controller_name, pending.template_name)
+        except Exception as deploy_error:
+            error = deploy_error
+        finally:
+            self.deploy_done(state, pending, status, error)
+
+    async def run_deploy_async(self, controller_name, state, pending, call):
+        """
+        This function will deploy the template of the {pending} deployment, and await the PI job
+        :param controller_name: the controller name
+        :param state: the ControllerState
+        :param pending: the PendingDeploy
+        :param call: coroutine function, call(function, *args) runs the blocking deployTemplate call
+        :return: none
+        """
+
+        status, error = DEPLOY_ERROR, None
+        try:
+            job_name = await call(self.deploy_function, controller_name, pending.template_name)
+            status = JOB_TIMEOUT    # deployed, possibly live if the wait is cancelled
+            status = await self.job_waiter.wait_one_async(job_name, self.deadline)
+        except Exception as deploy_error:
+            error = deploy_error
+        finally:
+            self.deploy_done(state, pending, status, error)
+
+    def acquire(self, controller_name):
+        """
+        This function will add one active HotSpot on the controller, the WLAN template is deployed if not live
+        The concurrent callers for the same controller wait for one deployment, and share the result. If the
+        deployment is not successful the HotSpot is not added, and the WLAN is disabled if possibly live.
+        :param controller_name: the controller name
+        :return: the job status of the deployment that made the WLAN live
+        """
+
+        state = self.state(controller_name)
+        pending, owner = self.reserve(controller_name, state)
+        while owner is None:
+            pending.event.wait()    # the WLAN disable deployment completes first
+            pending, owner = self.reserve(controller_name, state)
+        if owner:
+            self.run_deploy(controller_name, state, pending)
+        pending.event.wait()
+        if pending.status not in SUCCESS_RESULTS:
+            self.release(controller_name)
+            if owner and pending.error is not None:
+                raise pending.error
+        return pending.status
+
+    async def acquire_async(self, controller_name, call):
+        """
+        This function will add one active HotSpot on the controller, as acquire, the PI job is awaited
+        :param controller_name: the controller name
+        :param call: coroutine function, call(function, *args) runs the blocking deployTemplate call
+        :return: the job status of the deployment that made the WLAN live
+        """
+
+        state = self.state(controller_name)
+        pending, owner = self.reserve(controller_name, state)
+        while owner is None:
+            await pending.wait_async()
+            pending, owner = self.reserve(controller_name, state)
+        try:
+            if owner:
+                await self.run_deploy_async(controller_name, state, pending, call)
+            await pending.wait_async()
+        except asyncio.CancelledError:
+            with state.lock:
+                state.active = max(state.active - 1, 0)
+            raise
+        if pending.status not in SUCCESS_RESULTS:
+            await self.release_async(controller_name, call)
+            if owner and pending.error is not None:
+                raise pending.error
+        return pending.status
+
+    def release(self, controller_name, count=1):
+        """
+        This function will remove {count} active HotSpots from the controller,
+        the WLAN disable template is deployed when no HotSpot is active any more
+        :param controller_name: the controller name
+        :param count: the number of HotSpots ended
+        :return: the job status of the disable deployment, or None if not required
+        """
+
+        state = self.state(controller_name)
+        pending = self.reserve_disable(state, count)
+        if pending is None:
+            return None
+        self.run_deploy(controller_name, state, pending)
+        return pending.status
+
+    async def release_async(self, controller_name, call, count=1):
+        state = self.state(controller_name)
+        pending = self.reserve_disable(state, count)
+        if pending is None:
+            return None
+        await self.run_deploy_async(controller_name, state, pending, call)
+        return pending.status
+
+    def active_hotspots(self, controller_name):
+        """
+        This function will find the number of active HotSpots on the controller
+        :param controller_name: the controller name
+        :return: number of active HotSpots
+        """
+
+        return self.state(controller_name).active
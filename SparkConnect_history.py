@@ -0,0 +1,326 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the CMX client location history recorder, used to analyse the HotSpot demand over time
+# The periodic snapshots of the CMX active clients are saved in a compact columnar format, one file per column:
+# MAC addresses as 48 bit integers, controllers and floors as dictionary encoded ids,
+# timestamps and coordinates as typed arrays. The column files are memory-mapped for the scans and aggregations,
+# which run vectorized with numpy, one chunk at a time, without loading all the rows in memory.
+# The metadata file saves the number of complete rows, written after the column files are flushed, and the snapshot
+# interval. The rows of an interrupted append are ignored by the readers, and truncated by the next append.
+
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+HISTORY_INTERVAL = 60       # seconds between two snapshots
+CHUNK_ROWS = 1 << 20        # number of rows processed at once by the scans and aggregations
+
+COLUMNS = {
+    'timestamp': np.dtype('<u4'),       # snapshot time, seconds since epoch
+    'mac': np.dtype('<u8'),             # client MAC address, 48 bit integer
+    'controller': np.dtype('<u2'),      # dictionary encoded detectingControllers
+    'floor': np.dtype('<u2'),           # dictionary encoded mapHierarchyString
+    'x': np.dtype('<f4'),               # map coordinates
+    'y': np.dtype('<f4')
+}
+
+DICTIONARIES = ('controller', 'floor')
+
+
+def mac_to_int(mac_address):
+    """
+    This function will convert the {mac_address} to a 48 bit integer
+    :param mac_address: MAC address, for example '00:00:2a:01:00:04'
+    :return: the integer value
+    """
+
+    return int(mac_address.replace(':', '').replace('-', '').replace('.', ''), 16)
+
+
+def int_to_mac(mac_int):
+    """
+    This function will convert the 48 bit integer {mac_int} to a MAC address
+    :param mac_int: the integer value
+    :return: MAC address, for example '00:00:2a:01:00:04'
+    """
+
+    mac_hex = '%012x' % int(mac_int)
+    return ':'.join(mac_hex[i:i + 2] for i in range(0, 12, 2))
+
+
+class CmxHistoryStore(object):
+    """
+    Columnar on-disk store for the CMX client location snapshots, saved in the {path} directory
+    The snapshot {interval} of a new store is saved in the metadata, an existing store keeps its own interval
+    """
+
+    def __init__(self, path, interval=HISTORY_INTERVAL):
+        self.path = path
+        self.lock = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.interval = self.metadata()['interval'] or interval
+        self.dictionaries = {name: [] for name in DICTIONARIES}
+        try:
+            with open(self.dictionary_file()) as dictionary_file:
+                self.dictionaries.update(json.load(dictionary_file))
+        except (IOError, ValueError):
+            pass
+        self.codes = {name: {value: code for code, value in enumerate(values)}
+                      for name, values in self.dictionaries.items()}
+
+    def column_file(self, name):
+        return os.path.join(self.path, name + '.col')
+
+    def dictionary_file(self):
+        return os.path.join(self.path, 'dictionaries.json')
+
+    def metadata_file(self):
+        return os.path.join(self.path, 'metadata.json')
+
+    def metadata(self):
+        """
+        This function will read the store metadata, the number of complete rows and the snapshot interval
+        The stores created without the metadata file count the rows complete in all the column files
+        :return: dict with the keys {rows} and {interval}, the interval is None if not saved
+        """
+
+        try:
+            with open(self.metadata_file()) as metadata_file:
+                return json.load(metadata_file)
+        except (IOError, ValueError):
+            pass
+        counts = []
+        for name, dtype in COLUMNS.items():
+            try:
+                counts.append(os.path.getsize(self.column_file(name)) // dtype.itemsize)
+            except OSError:
+                counts.append(0)
+        return {'rows': min(counts), 'interval': None}
+
+    def save_json(self, file_name, data):
+        with open(file_name + '.tmp', 'w') as json_file:
+            json.dump(data, json_file)
+            json_file.flush()
+            os.fsync(json_file.fileno())
+        os.replace(file_name + '.tmp', file_name)
+
+    def encode(self, name, value):
+        """
+        This function will find the dictionary code of the {value}, a new code is added for a new value
+        :param name: the dictionary name, controller or floor
+        :param value: the string value
+        :return: the integer code
+        """
+
+        codes = self.codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = len(self.dictionaries[name])
+            self.dictionaries[name].append(value)
+            codes[value] = code
+        return code
+
+    def decode(self, name, code):
+        """
+        This function will find the string value of the dictionary {code}
+        :param name: the dictionary name, controller or floor
+        :param code: the integer code
+        :return: the string value
+        """
+
+        return self.dictionaries[name][int(code)]
+
+    def append(self, timestamp, clients):
+        """
+        This function will append one snapshot of the active clients to the column files
+        :param timestamp: the snapshot time, seconds since epoch
+        :param clients: list of client records, as returned by the CMX client index
+        :return: number of rows appended
+        """
+
+        clients = [client for client in clients if client.get('macAddress')]
+        rows = len(clients)
+        if not rows:
+            return 0
+        with self.lock:
+            columns = {name: np.empty(rows, dtype=dtype) for name, dtype in COLUMNS.items()}
+            columns['timestamp'][:] = int(timestamp)
+            for row, client in enumerate(clients):
+                location = client.get('location') or {}
+                columns['mac'][row] = mac_to_int(client['macAddress'])
+                columns['controller'][row] = self.encode('controller', client.get('detectingControllers') or '')
+                columns['floor'][row] = self.encode('floor', location.get('mapHierarchyString') or '')
+                columns['x'][row] = np.nan if location.get('x') is None else location['x']
+                columns['y'][row] = np.nan if location.get('y') is None else location['y']
+            self.save_json(self.dictionary_file(), self.dictionaries)
+            committed = self.metadata()['rows']
+            for name, values in columns.items():
+                with open(self.column_file(name), 'ab') as column_file:
+                    column_file.truncate(committed * COLUMNS[name].itemsize)    # the rows of an interrupted append
+                    column_file.write(values.tobytes())
+                    column_file.flush()
+                    os.fsync(column_file.fileno())
+            self.save_json(self.metadata_file(), {'rows': committed + rows, 'interval': self.interval})
+        return rows
+
+    def row_count(self):
+        """
+        This function will find the number of complete rows saved in the store, from the metadata
+        :return: number of rows
+        """
+
+        return self.metadata()['rows']
+
+    def columns(self):
+        """
+        This function will memory-map all the column files, read only
+        :return: dict of the column name to the numpy memory-mapped array
+        """
+
+        rows = self.row_count()
+        if rows == 0:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        return {name: np.memmap(self.column_file(name), dtype=dtype, mode='r', shape=(rows,))
+                for name, dtype in COLUMNS.items()}
+
+    def iter_chunks(self, names, start=None, end=None):
+        """
+        This function will iterate over the {names} columns, one chunk of rows at a time,
+        with the rows outside of the [start, end) time interval removed
+        :param names: list of the column names
+        :param start: start time, seconds since epoch
+        :param end: end time, seconds since epoch
+        :return: generator of dict of the column name to the numpy array chunk
+        """
+
+        columns = self.columns()
+        rows = len(columns['timestamp'])
+        for first in range(0, rows, CHUNK_ROWS):
+            timestamps = columns['timestamp'][first:first + CHUNK_ROWS]
+            mask = None
+            if start is not None:
+                mask = timestamps >= start
+            if end is not None:
+                mask = (timestamps < end) if mask is None else mask & (timestamps < end)
+            chunk = {}
+            for name in names:
+                values = columns[name][first:first + CHUNK_ROWS]
+                chunk[name] = values if mask is None else values[mask]
+            yield chunk
+
+    def count_by(self, name, start=None, end=None):
+        """
+        This function will count the rows for each controller or floor
+        :param name: the dictionary encoded column, controller or floor
+        :param start: start time, seconds since epoch
+        :param end: end time, seconds since epoch
+        :return: dict of the controller or floor to the number of client snapshots
+        """
+
+        size = len(self.dictionaries[name])
+        counts = np.zeros(size, dtype=np.int64)
+        for chunk in self.iter_chunks([name], start, end):
+            counts += np.bincount(chunk[name], minlength=size)[:size]
+        return {self.decode(name, code): int(count) for code, count in enumerate(counts) if count}
+
+    def demand_by_hour(self, name, start=None, end=None):
+        """
+        This function will count the distinct clients for each hour and each controller or floor
+        :param name: the dictionary encoded column, controller or floor
+        :param start: start time, seconds since epoch
+        :param end: end time, seconds since epoch
+        :return: dict of (hour start time, controller or floor) to the number of distinct clients
+        """
+
+        keys = []
+        for chunk in self.iter_chunks(['timestamp', 'mac', name], start, end):
+            hours = chunk['timestamp'].astype(np.uint64) // 3600
+            keys.append(np.unique(np.stack([hours, chunk[name].astype(np.uint64), chunk['mac']], axis=1), axis=0))
+        if not keys:
+            return {}
+        unique_keys = np.unique(np.concatenate(keys), axis=0)
+        hour_codes, counts = np.unique(unique_keys[:, :2], axis=0, return_counts=True)
+        return {(int(hour) * 3600, self.decode(name, code)): int(count)
+                for (hour, code), count in zip(hour_codes, counts)}
+
+    def dwell_times(self, start=None, end=None):
+        """
+        This function will estimate how long each client stayed, the number of snapshots multiplied by the
+        snapshot interval saved in the store
+        :param start: start time, seconds since epoch
+        :param end: end time, seconds since epoch
+        :return: dict of the client MAC address to the dwell time in seconds
+        """
+
+        macs = []
+        totals = []
+        for chunk in self.iter_chunks(['mac'], start, end):
+            chunk_macs, chunk_counts = np.unique(chunk['mac'], return_counts=True)
+            macs.append(chunk_macs)
+            totals.append(chunk_counts)
+        if not macs:
+            return {}
+        all_macs, inverse = np.unique(np.concatenate(macs), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate(totals))
+        return {int_to_mac(mac): int(count) * self.interval for mac, count in zip(all_macs, counts)}
+
+
+class CmxHistoryRecorder(object):
+    """
+    Records a snapshot of the CMX active clients from the {cmx_index} every {interval} seconds,
+    the snapshot interval of the {store} by default
+    The CMX client index is refreshed by the recorder if it is not fresh
+    """
+
+    def __init__(self, cmx_index, store, interval=None):
+        self.cmx_index = cmx_index
+        self.store = store
+        self.interval = interval or store.interval
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def snapshot(self):
+        """
+        This function will append the current CMX active clients to the store
+        :return: number of rows appended
+        """
+
+        if not self.cmx_index.is_fresh():
+            self.cmx_index.refresh()
+        return self.store.append(time.time(), self.cmx_index.clients())
+
+    def record_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                self.snapshot()
+            except Exception as error:
+                print('CMX history snapshot failed: ', repr(error))
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        """
+        This function will start the periodic snapshots, in a background thread
+        :return: none
+        """
+
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.record_loop, name='cmx-history', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        This function will stop the periodic snapshots
+        :return: none
+        """
+
+        self.stop_event.set()
+        self.thread = None
@@ -0,0 +1,288 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the shared HTTP client layer used by SparkConnect.py and the lab modules
+# One keep-alive session, with its own connection pool and auth, is created for each backend:
+# Spark, CMX, APIC-EM and Prime Infrastructure
+# Every session has connect and read timeouts, a deadline for the whole request, and optionally a circuit breaker
+# that fails fast when the backend is unhealthy. The idempotent GET calls may be hedged, a second request is sent
+# if the first one is slow.
+
+
+import threading
+import time
+
+import requests
+import requests.packages.urllib3
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import InsecureRequestWarning
+
+from SparkConnect_httpcache import CachingAdapter
+
+requests.packages.urllib3.disable_warnings(InsecureRequestWarning)  # Disable insecure https warnings
+
+DEFAULT_POOL_CONNECTIONS = 4    # number of host pools to cache, one per backend host is enough
+DEFAULT_POOL_MAXSIZE = 10       # maximum number of keep-alive connections per host
+DEFAULT_TIMEOUT = (3.05, 30)    # seconds, connect and read timeouts
+DEFAULT_DEADLINE = 60           # seconds, the whole request, connect, response headers and body
+DEADLINE_CHUNK = 64 * 1024      # bytes read at a time from a response with a deadline
+
+BREAKER_FAILURES = 5            # consecutive failures to open the circuit
+BREAKER_RESET = 30              # seconds the circuit stays open, before one trial request is allowed
+
+HEDGE_DELAY = 1.0               # seconds to wait for the first request, before sending the hedged request
+HEDGE_WORKERS = 16              # maximum number of concurrent hedged requests
+
+HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=HEDGE_WORKERS)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """
+    Raised when a request is not sent because the circuit breaker of the backend is open
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker for one backend, opened after {failure_threshold} consecutive failures,
+    a trial request is allowed after {reset_timeout} seconds
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def before_request(self):
+        """
+        This function will check if a request may be sent to the backend
+        :return: True if the request is the trial request of the half open circuit,
+        CircuitOpenError is raised if the circuit is open
+        """
+
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            if time.time() - self.opened_at >= self.reset_timeout and not self.trial:
+                self.trial = True       # half open, only one trial request
+                return True
+        raise CircuitOpenError('Circuit open for backend ' + self.name)
+
+    def end_trial(self):
+        with self.lock:
+            self.trial = False      # the trial request ended without a result, another one is allowed
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print('Circuit opened for backend ', self.name)
+                self.opened_at = time.time()
+            self.trial = False
+
+    def is_open(self):
+        return self.opened_at is not None
+
+
+def timeout_tuple(timeout):
+    """
+    This function will convert the requests {timeout}, one value for both, to the (connect, read) timeouts
+    """
+
+    if isinstance(timeout, (tuple, list)):
+        return tuple(timeout)
+    return timeout, timeout
+
+
+def read_before(response, end):
+    """
+    This function will read the body of the streamed {response}, the Timeout is raised if the body is not read
+    before the {end} time, from time.perf_counter()
+    :param response: the response of a request sent with stream=True
+    :param end: the deadline of the request
+    :return: none, the body is available as response.content
+    """
+
+    chunks = []
+    try:
+        if time.perf_counter() > end:
+            raise requests.exceptions.Timeout('Request deadline exceeded: ' + response.url)
+        for chunk in response.iter_content(DEADLINE_CHUNK):
+            chunks.append(chunk)
+            if time.perf_counter() > end:
+                raise requests.exceptions.Timeout('Request deadline exceeded: ' + response.url)
+    except BaseException:
+        response.close()
+        raise
+    response._content = b''.join(chunks)
+    response._content_consumed = True
+
+
+class DeadlineTimeout(tuple):
+    """
+    The (connect, read) timeouts of a request, and the {end} time of the request deadline, from time.perf_counter()
+    """
+
+    def __new__(cls, timeout, end):
+        deadline_timeout = tuple.__new__(cls, timeout)
+        deadline_timeout.end = end
+        return deadline_timeout
+
+
+class DeadlineAdapter(HTTPAdapter):
+    """
+    HTTP adapter reading the response body by chunks, the Timeout is raised if the body is not read before
+    the end time of the DeadlineTimeout
+    """
+
+    def send(self, request, stream=False, timeout=None, **kwargs):
+        end = getattr(timeout, 'end', None)
+        response = HTTPAdapter.send(self, request, stream=stream or end is not None, timeout=timeout, **kwargs)
+        if end is not None and not stream:
+            read_before(response, end)
+        return response
+
+
+class ApiSession(requests.Session):
+    """
+    requests session with default connect and read timeouts, an optional circuit breaker, and a deadline,
+    the whole request, the connect, the response headers and the body, must complete in {deadline} seconds
+    or the Timeout is raised. The deadline=seconds argument sets the deadline of one request, deadline=None
+    disables it. The read timeout only limits each socket read, a slow response may be longer.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, breaker=None, deadline=DEFAULT_DEADLINE):
+        requests.Session.__init__(self)
+        self.timeout = timeout
+        self.breaker = breaker
+        self.deadline = deadline
+        self.mount('https://', DeadlineAdapter())
+        self.mount('http://', DeadlineAdapter())
+
+    def request(self, method, url, *args, **kwargs):
+        deadline = kwargs.pop('deadline', self.deadline)
+        timeout = timeout_tuple(kwargs.get('timeout') or self.timeout)
+        if deadline is not None:
+            timeout = DeadlineTimeout((min(timeout[0], deadline), min(timeout[1], deadline)),
+                                      time.perf_counter() + deadline)
+        kwargs['timeout'] = timeout
+        trial = self.breaker is not None and self.breaker.before_request()
+        try:
+            response = requests.Session.request(self, method, url, *args, **kwargs)
+            if self.breaker is not None:
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+        except requests.exceptions.RequestException:
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise
+        finally:
+            if trial:
+                self.breaker.end_trial()    # no-op if the result was recorded
+        return response
+
+
+class DeadlineCachingAdapter(CachingAdapter, DeadlineAdapter):
+    """
+    HTTP adapter answering the GET calls from the HTTP cache, the other responses are read before the deadline
+    """
+
+
+def create_api_session(auth=None, headers=None, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                       pool_maxsize=DEFAULT_POOL_MAXSIZE, timeout=DEFAULT_TIMEOUT, breaker=None, cache=None,
+                       deadline=DEFAULT_DEADLINE):
+    """
+    This function will create a requests session with a keep-alive connection pool for one backend
+    The TCP and TLS connections are reused by all the calls made through the session
+    :param auth: requests auth object, for example HTTPBasicAuth for CMX and PI
+    :param headers: headers to be sent with every request, for example the Spark authorization header
+    :param pool_connections: number of host connection pools to cache
+    :param pool_maxsize: maximum number of connections kept alive in each pool
+    :param timeout: the (connect, read) timeouts, in seconds
+    :param breaker: the CircuitBreaker of the backend, or None
+    :param cache: the HttpCache for the GET calls of the slowly changing endpoints, or None
+    :param deadline: the default deadline of each request, in seconds, or None
+    :return: the requests session
+    """
+
+    session = ApiSession(timeout, breaker, deadline)
+    if cache is None:
+        adapter = DeadlineAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    else:
+        adapter = DeadlineCachingAdapter(cache, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.verify = False
+    session.auth = auth
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def set_session_ticket(session, ticket):
+    """
+    This function will set the APIC-EM auth ticket header on the {session}
+    Every following call made through the session will be authenticated with the {ticket}
+    :param session: the APIC-EM requests session
+    :param ticket: APIC-EM ticket
+    :return: none
+    """
+
+    if ticket is None:
+        session.headers.pop('X-Auth-Token', None)
+    else:
+        session.headers['X-Auth-Token'] = ticket
+
+
+def hedged_call(function, *args, **kwargs):
+    """
+    This function will call the idempotent {function}, and call it a second time if the first call does not
+    return in {hedge_after} seconds. The first successful result is returned.
+    The {hedge_after} wait starts when the first call starts, the time spent in the queue of the busy executor
+    does not send a hedged call.
+    Use only for idempotent requests, for example the GET calls
+    :param function: the function making the request, for example session.get
+    :param args: the function arguments
+    :param kwargs: the function keyword arguments, hedge_after=seconds to wait before the hedged call
+    :return: the function return value
+    """
+
+    hedge_after = kwargs.pop('hedge_after', HEDGE_DELAY)
+    started = threading.Event()
+
+    def first_call():
+        started.set()
+        return function(*args, **kwargs)
+
+    first = HEDGE_EXECUTOR.submit(first_call)
+    started.wait()
+    done, pending = wait([first], timeout=hedge_after)
+    if done and first.exception() is None:
+        return first.result()
+    futures = [first, HEDGE_EXECUTOR.submit(function, *args, **kwargs)]
+    error = None
+    while futures:
+        done, pending = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            futures.remove(future)
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
@@ -0,0 +1,292 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the optional on-disk HTTP response cache, used under the sessions created with
+# create_api_session(cache=HttpCache(...)).
+# Only the GET calls of the slowly changing endpoints are cached, each endpoint has its own freshness rule:
+# the PI Devices, the PI JobSummary of the completed jobs, the APIC-EM network-device/ip-address and the Spark rooms.
+# A fresh response is returned from the disk, a stale response is revalidated with If-None-Match and
+# If-Modified-Since, and returned from the disk if the backend answers 304 Not Modified. A request with the
+# Cache-Control: no-cache header is always revalidated, a request with no-store is not cached.
+# The least recently used responses are evicted when the cache is larger than {max_bytes}. The directory may be
+# shared by many processes, the responses saved by the other processes are used, and the directory is scanned
+# after every new response is saved, so the eviction counts the files saved by all the processes.
+
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from collections import Counter, OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from SparkConnect_jobs import is_job_completed
+
+HTTP_CACHE_SIZE = 64 * 1024 * 1024     # bytes, the maximum size of the cached responses on disk
+UNCACHED_HEADERS = ('content-encoding', 'transfer-encoding', 'connection', 'keep-alive', 'set-cookie')
+
+
+def completed_jobs(request, response):
+    """
+    This function will check if the JobSummary {response} includes all the requested jobs, all completed
+    The status of the completed jobs does not change, the response may be cached
+    :param request: the JobSummary request, jobName=in("name1","name2") or jobName=name
+    :param response: the JobSummary response
+    :return: True if all the requested jobs are completed
+    """
+
+    job_filter = parse_qs(urlsplit(request.url).query).get('jobName', [''])[0]
+    job_names = re.findall(r'"([^"]+)"', job_filter) or [job_filter]
+    entities = response.json()['queryResponse'].get('entity', [])
+    summaries = [entity['jobSummaryDTO'] for entity in entities]
+    return len(summaries) >= len(job_names) and all(is_job_completed(summary) for summary in summaries)
+
+
+class CacheRule(object):
+    """
+    Freshness rule of the endpoints with the URL path matching the {pattern}, the responses are used without
+    revalidation for {max_age} seconds, 0 to revalidate every time. The optional {cacheable}(request, response)
+    decides if one response may be cached.
+    """
+
+    def __init__(self, pattern, max_age, cacheable=None):
+        self.pattern = re.compile(pattern)
+        self.max_age = max_age
+        self.cacheable = cacheable
+
+
+CACHE_RULES = [
+    CacheRule(r'/webacs/api/v1/data/Devices$', 300),
+    CacheRule(r'/webacs/api/v1/data/JobSummary$', 86400, completed_jobs),
+    CacheRule(r'/network-device/ip-address/[^/]+$', 600),
+    CacheRule(r'/rooms$', 0)    # new rooms must be found, always revalidated
+]
+
+
+class HttpCache(object):
+    """
+    On-disk HTTP response cache in the {directory}, with the freshness {rules}, at most {max_bytes} on disk
+    Every response is one file, a JSON line with the status and headers, followed by the body. The file
+    modification time is the time the response was last validated. The least recently used files are evicted
+    first, the order is kept in memory, and loaded from the modification times when the directory is scanned.
+    """
+
+    def __init__(self, directory, max_bytes=HTTP_CACHE_SIZE, rules=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rules = CACHE_RULES if rules is None else rules
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # key -> size in bytes, the least recently used first
+        self.size = 0
+        self.stats = Counter()          # hits, revalidated, misses, stored, evicted
+        os.makedirs(directory, exist_ok=True)
+        self.scan()
+
+    def scan(self):
+        """
+        This function will load the cached responses saved in the directory, by this process and the other ones,
+        ordered by modification time
+        :return: none
+        """
+
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                try:
+                    status = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue    # evicted by another process
+                files.append((status.st_mtime, name[:-len('.cache')], status.st_size))
+        entries = OrderedDict((key, size) for mtime, key, size in sorted(files))
+        with self.lock:
+            self.entries = entries
+            self.size = sum(entries.values())
+
+    def rule_for(self, request):
+        """
+        This function will find the freshness rule of the {request}
+        :param request: the prepared request
+        :return: the CacheRule, None if the request is not cached
+        """
+
+        if request.method != 'GET':
+            return None
+        path = urlsplit(request.url).path
+        for rule in self.rules:
+            if rule.pattern.search(path):
+                return rule
+        return None
+
+    def key(self, request):
+        """
+        The cache key, the URL and the credentials, the responses of different users are not shared
+        """
+
+        identity = request.headers.get('Authorization', '')
+        return hashlib.sha256((request.url + '\n' + identity).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.cache')
+
+    def load(self, key):
+        """
+        This function will read the cached response
+        :param key: the cache key
+        :return: the status and headers, the body, and the age in seconds, or None if not cached
+        """
+
+        try:
+            with open(self.path(key), 'rb') as cache_file:
+                status = os.fstat(cache_file.fileno())
+                meta = json.loads(cache_file.readline().decode('utf-8'))
+                body = cache_file.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.size -= self.entries.pop(key, 0)
+            return None
+        except (OSError, ValueError):
+            self.remove(key)
+            return None
+        with self.lock:
+            self.size += status.st_size - self.entries.pop(key, 0)  # also saved by another process
+            self.entries[key] = status.st_size
+        return meta, body, time.time() - status.st_mtime
+
+    def store(self, key, response):
+        """
+        This function will save the {response}, and evict the least recently used responses if required
+        :param key: the cache key
+        :param response: the response, with the body read
+        :return: none
+        """
+
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in UNCACHED_HEADERS}
+        headers['Content-Length'] = str(len(response.content))
+        meta = {'url': response.url, 'status': response.status_code, 'reason': response.reason, 'headers': headers}
+        data = json.dumps(meta).encode('utf-8') + b'\n' + response.content
+        if len(data) > self.max_bytes:
+            return
+        temporary = self.path(key) + '.%d.%d' % (os.getpid(), threading.get_ident())
+        with open(temporary, 'wb') as cache_file:
+            cache_file.write(data)
+        os.replace(temporary, self.path(key))
+        self.scan()     # the new response, and the files saved by the other processes
+        with self.lock:
+            self.entries.move_to_end(key)
+            self.stats['stored'] += 1
+            evicted = []
+            while self.size > self.max_bytes:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.size -= old_size
+                evicted.append(old_key)
+            self.stats['evicted'] += len(evicted)
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except OSError:
+                pass
+
+    def touch(self, key):
+        """
+        This function will mark the cached response as validated now, after a 304 Not Modified
+        """
+
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            self.remove(key)
+
+    def remove(self, key):
+        with self.lock:
+            self.size -= self.entries.pop(key, 0)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for key in list(self.entries):
+            self.remove(key)
+
+
+def cached_response(request, meta, body, adapter):
+    """
+    This function will create the response returned from the cache
+    :param request: the prepared request
+    :param meta: the cached status and headers
+    :param body: the cached body
+    :param adapter: the adapter returning the response
+    :return: the requests response, with from_cache=True
+    """
+
+    response = requests.models.Response()
+    response.status_code = meta['status']
+    response.reason = meta['reason']
+    response.headers = CaseInsensitiveDict(meta['headers'])
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = body
+    response._content_consumed = True
+    response.url = request.url
+    response.request = request
+    response.connection = adapter
+    response.from_cache = True
+    return response
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    HTTP adapter answering the GET calls from the {cache} when fresh, or after a 304 Not Modified revalidation
+    The streamed responses are never cached, they are read by the caller one item at a time
+    """
+
+    def __init__(self, cache, **kwargs):
+        HTTPAdapter.__init__(self, **kwargs)
+        self.cache = cache
+
+    def send(self, request, stream=False, **kwargs):
+        send = super(CachingAdapter, self).send     # the deadline adapter, under the sessions with a deadline
+        rule = None if stream else self.cache.rule_for(request)
+        if rule is None:
+            return send(request, stream=stream, **kwargs)
+        cache_control = request.headers.get('Cache-Control', '')
+        if 'no-store' in cache_control:
+            return send(request, stream=stream, **kwargs)
+        cache = self.cache
+        key = cache.key(request)
+        entry = cache.load(key)
+        if entry is not None:
+            meta, body, age = entry
+            if age < rule.max_age and 'no-cache' not in cache_control:
+                cache.stats['hits'] += 1
+                return cached_response(request, meta, body, self)
+            etag = meta['headers'].get('ETag')
+            last_modified = meta['headers'].get('Last-Modified')
+            if etag:
+                request.headers['If-None-Match'] = etag
+            if last_modified:
+                request.headers['If-Modified-Since'] = last_modified
+        response = send(request, stream=stream, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            response.content    # the empty body is read, the connection is returned to the pool
+            cache.touch(key)
+            cache.stats['revalidated'] += 1
+            return cached_response(request, entry[0], entry[1], self)
+        cache.stats['misses'] += 1
+        if response.status_code == 200 and 'no-store' not in response.headers.get('Cache-Control', ''):
+            try:
+                if rule.cacheable is None or rule.cacheable(request, response):
+                    cache.store(key, response)
+            except (ValueError, KeyError, TypeError, OSError) as error:
+                print('HTTP cache store failed: ', repr(error))
+        return response
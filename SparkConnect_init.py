@@ -33,3 +33,86 @@ IT_ENG_EMAIL = 'gabriel.zapodeanu@gmail.com'
 
 WIFI_SSID = 'CLIVE'
 
+# wireless controller used when CMX does not find the user connected to WiFi
+
+DEFAULT_CONTROLLER_IP = '172.16.1.26'
+
+# HTTP connection pool sizes, the maximum number of keep-alive connections to each backend
+
+SPARK_POOL_SIZE = 10
+CMX_POOL_SIZE = 10
+EM_POOL_SIZE = 10
+PI_POOL_SIZE = 10
+
+
+# asyncio provisioning engine, number of worker threads for the blocking API calls, and Spark poll interval
+
+ENGINE_WORKERS = 32
+POLL_INTERVAL = 5
+
+# Spark webhook receiver, optional. WEBHOOK_URL is the public URL Spark will POST the notifications to,
+# forwarded to the local WEBHOOK_PORT. The room is polled when WEBHOOK_URL is None
+
+WEBHOOK_URL = None
+WEBHOOK_PORT = 8080
+WEBHOOK_SECRET = None
+
+# APIC-EM and PI network inventory index, seconds between two scheduled syncs
+
+INVENTORY_REFRESH = 3600
+
+# CMX active clients index, seconds between two refreshes, and maximum age for the index to be used
+
+CMX_INDEX_REFRESH = 30
+CMX_INDEX_MAX_AGE = 60
+
+# CMX client location history, the directory of the columnar store, None to disable the recorder,
+# and seconds between two snapshots
+
+HISTORY_PATH = None
+HISTORY_INTERVAL = 60
+
+# maximum number of concurrent WLAN template deployments, for the multi-controller deployments
+
+FANOUT_WORKERS = 8
+
+# HTTP (connect, read) timeouts for each backend, in seconds, and the delay before sending a hedged request
+# for the idempotent CMX client and APIC-EM device lookups
+
+SPARK_TIMEOUT = (3.05, 10)
+CMX_TIMEOUT = (3.05, 10)
+EM_TIMEOUT = (3.05, 15)
+PI_TIMEOUT = (3.05, 30)
+CMX_HEDGE_DELAY = 1.0
+EM_HEDGE_DELAY = 1.5
+
+# HTTP deadline for each backend, in seconds, the whole request, connect, response headers and body, the read
+# timeout only limits each socket read
+
+SPARK_DEADLINE = 20
+CMX_DEADLINE = 20
+EM_DEADLINE = 30
+PI_DEADLINE = 60
+
+# local port of the Prometheus metrics endpoint, http://127.0.0.1:{METRICS_PORT}/metrics, None to disable
+
+METRICS_PORT = None
+
+# startup pre-warming, the backends are resolved, connected and authenticated in parallel before the first request
+
+WARMUP = True
+
+# optional on-disk HTTP cache of the slowly changing Spark, APIC-EM and PI GET responses, the cache directory,
+# None to disable, and the maximum cache size in bytes
+
+HTTP_CACHE_DIR = None
+HTTP_CACHE_SIZE = 64 * 1024 * 1024
+
+# sharded multi-room mode, the site room names, the SQLite store shared by the workers, the number of local worker
+# processes, the room lease time and the heartbeat interval, in seconds
+
+SHARD_ROOMS = [ROOM_NAME]
+SHARD_STORE = 'sparkconnect_shards.db'
+SHARD_WORKERS = 4
+SHARD_LEASE_TTL = 30
+SHARD_HEARTBEAT = 10
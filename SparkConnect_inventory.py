@@ -0,0 +1,212 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the local network inventory index
+# The APIC-EM network device inventory and the PI Devices data are downloaded in bulk, one page at a time,
+# and joined into one index keyed by management IP address, hostname and PI device id.
+# The IP address -> hostname -> PI device id resolution is then an in-memory lookup.
+# The device pages are parsed as a stream, one device at a time.
+
+
+import threading
+import time
+
+from SparkConnect_stream import iter_response_items, stream_json_items
+
+INVENTORY_PAGE_SIZE = 500       # number of devices requested in one page
+INVENTORY_REFRESH = 3600        # seconds between two scheduled inventory syncs
+
+
+class NetworkInventory(object):
+    """
+    Network inventory index, built from the APIC-EM /network-device inventory and the PI Devices data
+    The APIC-EM calls use the {em_tickets} ticket manager, the PI calls use the {pi_session}
+    """
+
+    def __init__(self, em_url, em_tickets, pi_url, pi_session, page_size=INVENTORY_PAGE_SIZE,
+                 refresh_interval=INVENTORY_REFRESH):
+        self.em_url = em_url
+        self.em_tickets = em_tickets
+        self.pi_url = pi_url
+        self.pi_session = pi_session
+        self.page_size = page_size
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.by_ip = {}
+        self.by_hostname = {}
+        self.by_pi_id = {}
+        self.last_sync = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def fetch_em_devices(self):
+        """
+        This function will download the APIC-EM network device inventory
+        Call to:    APIC-EM - /network-device/{start_index}/{records_to_return}
+        :return: list of {management IP address, hostname} dict
+        """
+
+        devices = []
+        start_index = 1
+        header = {'accept': 'application/json'}
+        while True:
+            url = self.em_url + '/network-device/' + str(start_index) + '/' + str(self.page_size)
+            response = self.em_tickets.request('GET', url, headers=header, stream=True)
+            response.raise_for_status()
+            page_count = 0
+            for device in iter_response_items(response, ('response',)):
+                devices.append({'ip_address': device.get('managementIpAddress'), 'hostname': device.get('hostname'),
+                                'em_id': device.get('id')})
+                page_count += 1
+            if page_count < self.page_size:
+                return devices
+            start_index += self.page_size
+
+    def fetch_pi_devices(self):
+        """
+        This function will download the PI Devices data
+        Call to:    Prime Infrastructure - /webacs/api/v1/data/Devices?.full=true&.firstResult=&.maxResults=
+        The paging follows @count and @last when PI sends them before the entity array, otherwise the next page
+        is requested while a page returns {page_size} devices
+        :return: list of {PI device id, device name, IP address} dict
+        """
+
+        devices = []
+        first_result = 0
+        url = self.pi_url + '/webacs/api/v1/data/Devices'
+        header = {'content-type': 'application/json', 'accept': 'application/json'}
+        while True:
+            params = {'.full': 'true', '.firstResult': first_result, '.maxResults': self.page_size}
+            query_response = {}     # @count and @last, if sent before the entity array
+            page_count = 0
+            for entity in stream_json_items(self.pi_session, url, ('queryResponse', 'entity'), query_response,
+                                            params=params, headers=header):
+                device = entity['devicesDTO']
+                devices.append({'pi_id': str(device['@id']), 'hostname': device.get('deviceName'),
+                                'ip_address': device.get('ipAddress')})
+                page_count += 1
+            if '@count' in query_response and '@last' in query_response:
+                last = int(query_response['@last'])
+                if last + 1 >= int(query_response['@count']) or page_count == 0:
+                    return devices
+                first_result = last + 1
+            else:
+                # the attributes are missing, or sent after the entity array, a short page is the last page
+                if page_count < self.page_size:
+                    return devices
+                first_result += page_count
+
+    def sync(self):
+        """
+        This function will download the APIC-EM and PI inventories, and replace the index
+        :return: number of devices in the index
+        """
+
+        with self.sync_lock:
+            by_ip = {}
+            by_hostname = {}
+            for device in self.fetch_em_devices():
+                entry = {'ip_address': device['ip_address'], 'hostname': device['hostname'],
+                         'em_id': device['em_id'], 'pi_id': None}
+                if entry['ip_address']:
+                    by_ip[entry['ip_address']] = entry
+                if entry['hostname']:
+                    by_hostname[entry['hostname']] = entry
+            by_pi_id = {}
+            for device in self.fetch_pi_devices():
+                entry = by_hostname.get(device['hostname']) or by_ip.get(device['ip_address'])
+                if entry is None:
+                    entry = {'ip_address': device['ip_address'], 'hostname': device['hostname'], 'em_id': None}
+                    if entry['ip_address']:
+                        by_ip[entry['ip_address']] = entry
+                    if entry['hostname']:
+                        by_hostname[entry['hostname']] = entry
+                entry['pi_id'] = device['pi_id']
+                by_pi_id[device['pi_id']] = entry
+            with self.lock:
+                self.by_ip, self.by_hostname, self.by_pi_id = by_ip, by_hostname, by_pi_id
+                self.last_sync = time.time()
+            print('Network inventory synced, devices: ', len(by_ip))
+            return len(by_ip)
+
+    def add(self, ip_address=None, hostname=None, pi_id=None):
+        """
+        This function will add one device, resolved by API calls, to the index
+        :param ip_address: management IP address
+        :param hostname: device hostname
+        :param pi_id: PI device id
+        :return: none
+        """
+
+        with self.lock:
+            entry = (self.by_hostname.get(hostname) or self.by_ip.get(ip_address) or
+                     {'ip_address': None, 'hostname': None, 'em_id': None, 'pi_id': None})
+            for key, value in (('ip_address', ip_address), ('hostname', hostname), ('pi_id', pi_id)):
+                if value is not None:
+                    entry[key] = value
+            if entry['ip_address']:
+                self.by_ip[entry['ip_address']] = entry
+            if entry['hostname']:
+                self.by_hostname[entry['hostname']] = entry
+            if entry['pi_id']:
+                self.by_pi_id[entry['pi_id']] = entry
+
+    def hostname_for_ip(self, ip_address):
+        """
+        This function will find the hostname of the device with the management {ip_address}
+        :param ip_address: management IP address
+        :return: device hostname, or None if not in the index
+        """
+
+        entry = self.by_ip.get(ip_address)
+        return entry['hostname'] if entry else None
+
+    def pi_id_for_hostname(self, hostname):
+        """
+        This function will find the PI device id of the device with the {hostname}
+        :param hostname: device hostname
+        :return: PI device id, or None if not in the index
+        """
+
+        entry = self.by_hostname.get(hostname)
+        return entry['pi_id'] if entry else None
+
+    def device_for_pi_id(self, pi_id):
+        """
+        This function will find the device with the PI device id {pi_id}
+        :param pi_id: PI device id
+        :return: dict with the {ip_address}, {hostname}, {em_id} and {pi_id} keys, or None if not in the index
+        """
+
+        return self.by_pi_id.get(str(pi_id))
+
+    def refresh_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                self.sync()
+            except Exception as error:
+                print('Network inventory sync failed: ', repr(error))
+            self.stop_event.wait(self.refresh_interval)
+
+    def start(self):
+        """
+        This function will start the scheduled inventory sync, in a background thread
+        :return: none
+        """
+
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.refresh_loop, name='network-inventory', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        This function will stop the scheduled inventory sync
+        :return: none
+        """
+
+        self.stop_event.set()
+        self.thread = None
@@ -0,0 +1,234 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the Prime Infrastructure job completion waiter
+# The outstanding jobs of all the callers are polled by one background thread, with backoff, until they reach a
+# terminal state or the caller deadline. The status of many jobs is checked with a single JobSummary query.
+# The asyncio callers await a future resolved by the poller, they do not hold a thread while the job runs.
+
+
+import asyncio
+import threading
+import time
+
+JOB_DEADLINE = 120              # seconds to wait for a job to complete
+JOB_POLL_DELAY = 1.0            # seconds before the first status check
+JOB_POLL_MAX_DELAY = 10.0       # maximum seconds between two status checks of a job
+JOB_POLL_BACKOFF = 1.5          # the delay between two status checks is multiplied by this factor
+JOB_BATCH_SIZE = 50             # maximum number of jobs checked by one JobSummary query
+
+TERMINAL_RESULTS = ('SUCCESS', 'FAILURE', 'PARTIAL_SUCCESS')
+JOB_TIMEOUT = 'TIMEOUT'         # status returned for the jobs not completed before the deadline
+
+
+def is_job_completed(job_summary):
+    """
+    This function will check if the PI job reached a terminal state
+    :param job_summary: the PI jobSummaryDTO
+    :return: True if the job is completed
+    """
+
+    run_status = job_summary.get('runStatus') or job_summary.get('jobStatus')
+    if run_status is not None and run_status.upper() != 'COMPLETED':
+        return False
+    return (job_summary.get('resultStatus') or '').upper() in TERMINAL_RESULTS
+
+
+def resolve_future(future, result):
+    if not future.done():   # the waiter may have been cancelled
+        future.set_result(result)
+
+
+class PendingJob(object):
+    """
+    One outstanding PI job, polled with backoff
+    """
+
+    def __init__(self, job_name):
+        self.job_name = job_name
+        self.event = threading.Event()
+        self.status = None
+        self.delay = JOB_POLL_DELAY
+        self.next_poll = time.time() + self.delay
+        self.waiters = 0
+        self.futures = []   # (event loop, future) of the asyncio waiters
+
+    def complete(self, status):
+        """
+        This function will save the job result status, and wake up the threads and the asyncio tasks waiting
+        :param status: the job result status
+        :return: none
+        """
+
+        self.status = status
+        self.event.set()
+        for loop, future in self.futures:
+            loop.call_soon_threadsafe(resolve_future, future, status)
+
+
+class PiJobWaiter(object):
+    """
+    Prime Infrastructure job completion waiter, the PI calls are made through the {session}, to the {pi_url}
+    """
+
+    def __init__(self, pi_url, session):
+        self.pi_url = pi_url
+        self.session = session
+        self.jobs = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def query_jobs(self, job_names):
+        """
+        This function will get the summary of the jobs with the {job_names}, with one API call for each batch
+        Call to:    PI - /webacs/api/v1/data/JobSummary?.full=true&jobName=in("name1","name2")
+        :param job_names: list of PI job names
+        :return: dict of the job name to the PI jobSummaryDTO
+        """
+
+        url = self.pi_url + '/webacs/api/v1/data/JobSummary'
+        header = {'content-type': 'application/json', 'accept': 'application/json'}
+        summaries = {}
+        for first in range(0, len(job_names), JOB_BATCH_SIZE):
+            batch = job_names[first:first + JOB_BATCH_SIZE]
+            names_filter = 'in(' + ','.join('"' + name + '"' for name in batch) + ')'
+            params = {'.full': 'true', 'jobName': names_filter, '.maxResults': len(batch)}
+            response = self.session.get(url, params=params, headers=header)
+            response.raise_for_status()
+            for entity in response.json()['queryResponse'].get('entity', []):
+                job_summary = entity['jobSummaryDTO']
+                job_name = job_summary.get('jobName')
+                summaries[job_name] = job_summary
+        return summaries
+
+    def job_status(self, job_name):
+        """
+        This function will get the current status of the job with the {job_name}, with one API call
+        :param job_name: PI job name
+        :return: the job result status, None if the job is not found
+        """
+
+        job_summary = self.query_jobs([job_name]).get(job_name)
+        return job_summary.get('resultStatus') if job_summary else None
+
+    def poll_loop(self):
+        while True:
+            with self.condition:
+                while True:
+                    now = time.time()
+                    due = [job for job in self.jobs.values() if job.next_poll <= now]
+                    if due:
+                        break
+                    next_poll = min([job.next_poll for job in self.jobs.values()] or [now + 60])
+                    self.condition.wait(next_poll - now)
+            try:
+                summaries = self.query_jobs([job.job_name for job in due])
+            except Exception as error:
+                print('PI job status query failed: ', repr(error))
+                summaries = {}
+            with self.condition:
+                now = time.time()
+                for job in due:
+                    job_summary = summaries.get(job.job_name)
+                    if job_summary is not None and is_job_completed(job_summary):
+                        job.complete(job_summary['resultStatus'])
+                        self.jobs.pop(job.job_name, None)
+                    else:
+                        job.delay = min(job.delay * JOB_POLL_BACKOFF, JOB_POLL_MAX_DELAY)
+                        job.next_poll = now + job.delay
+
+    def wait(self, job_names, deadline=JOB_DEADLINE):
+        """
+        This function will wait for the jobs with the {job_names} to complete
+        The jobs of all the concurrent callers are checked together by the background poller
+        :param job_names: list of PI job names
+        :param deadline: maximum seconds to wait
+        :return: dict of the job name to the job result status, JOB_TIMEOUT for the jobs not completed in time
+        """
+
+        end = time.time() + deadline
+        pending = self.register(job_names)
+        statuses = {}
+        try:
+            for job in pending:
+                job.event.wait(max(end - time.time(), 0))
+                statuses[job.job_name] = job.status if job.event.is_set() else JOB_TIMEOUT
+        finally:
+            self.unregister(pending)
+        return statuses
+
+    async def wait_async(self, job_names, deadline=JOB_DEADLINE):
+        """
+        This function will wait for the jobs with the {job_names} to complete, without blocking a thread
+        The background poller resolves one future for each job, in the event loop of the caller
+        :param job_names: list of PI job names
+        :param deadline: maximum seconds to wait
+        :return: dict of the job name to the job result status, JOB_TIMEOUT for the jobs not completed in time
+        """
+
+        loop = asyncio.get_running_loop()
+        futures = {}
+        pending = self.register(job_names, loop, futures)
+        try:
+            if futures:
+                await asyncio.wait(list(futures.values()), timeout=deadline)
+        finally:
+            self.unregister(pending, futures)
+        return {job.job_name: job.status if job.event.is_set() else JOB_TIMEOUT for job in pending}
+
+    def register(self, job_names, loop=None, futures=None):
+        """
+        This function will add the jobs with the {job_names} to the jobs polled, and start the poller if required
+        :param job_names: list of PI job names
+        :param loop: the event loop of the asyncio caller, None for the thread callers
+        :param futures: dict filled with the job name to the future resolved when the job completes
+        :return: list of the PendingJob
+        """
+
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.poll_loop, name='pi-job-waiter', daemon=True)
+                self.thread.start()
+            pending = []
+            for job_name in job_names:
+                job = self.jobs.get(job_name)
+                if job is None:
+                    job = self.jobs[job_name] = PendingJob(job_name)
+                job.waiters += 1
+                if loop is not None:
+                    futures[job_name] = loop.create_future()
+                    job.futures.append((loop, futures[job_name]))
+                pending.append(job)
+            self.condition.notify()
+        return pending
+
+    def unregister(self, pending, futures=None):
+        with self.condition:
+            for job in pending:
+                job.waiters -= 1
+                if futures:
+                    job.futures = [item for item in job.futures if item[1] is not futures.get(job.job_name)]
+                if job.waiters == 0 and not job.event.is_set():
+                    self.jobs.pop(job.job_name, None)
+
+    def wait_one(self, job_name, deadline=JOB_DEADLINE):
+        """
+        This function will wait for the job with the {job_name} to complete
+        :param job_name: PI job name
+        :param deadline: maximum seconds to wait
+        :return: the job result status, JOB_TIMEOUT if not completed in time
+        """
+
+        return self.wait([job_name], deadline)[job_name]
+
+    async def wait_one_async(self, job_name, deadline=JOB_DEADLINE):
+        """
+        This function will wait for the job with the {job_name} to complete, without blocking a thread
+        :param job_name: PI job name
+        :param deadline: maximum seconds to wait
+        :return: the job result status, JOB_TIMEOUT if not completed in time
+        """
+
+        return (await self.wait_async([job_name], deadline))[job_name]
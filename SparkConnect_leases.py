@@ -0,0 +1,177 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the HotSpot lease scheduler
+# The leases of all the active HotSpots are kept in one heap ordered by expiry time, and served by one thread.
+# The leases expiring close together on the same controller are released with one callback, so one WLAN disable
+# job is deployed for all of them. A lease extension pushes a new heap entry, O(log n), the old entry is ignored.
+
+
+import heapq
+import itertools
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+COALESCE_WINDOW = 30        # seconds, the leases expiring within this window on one controller are released together
+EXPIRY_WORKERS = 4          # maximum number of concurrent expiry callbacks
+
+
+class Lease(object):
+    """
+    One HotSpot lease on the {controller}, {data} is the caller information, for example the HotSpot session
+    """
+
+    def __init__(self, lease_id, controller, expires_at, data=None):
+        self.lease_id = lease_id
+        self.controller = controller
+        self.expires_at = expires_at
+        self.data = data
+        self.version = 0
+
+
+class LeaseScheduler(object):
+    """
+    HotSpot lease scheduler, {on_expire}(controller, leases) is called once for the leases expired together
+    on the same controller
+    """
+
+    def __init__(self, on_expire, coalesce_window=COALESCE_WINDOW, max_workers=EXPIRY_WORKERS):
+        self.on_expire = on_expire
+        self.coalesce_window = coalesce_window
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.condition = threading.Condition()
+        self.heap = []
+        self.leases = {}
+        self.pending = {}       # controller -> [flush time, list of the expired leases]
+        self.lease_ids = itertools.count(1)
+        self.thread = None
+        self.stopped = False
+
+    def add(self, controller, duration, data=None):
+        """
+        This function will add a new lease on the {controller}
+        :param controller: the controller name
+        :param duration: the lease duration, in seconds
+        :param data: the caller information, returned with the lease on expiry
+        :return: the lease id
+        """
+
+        with self.condition:
+            lease = Lease(next(self.lease_ids), controller, time.time() + duration, data)
+            self.leases[lease.lease_id] = lease
+            heapq.heappush(self.heap, (lease.expires_at, lease.lease_id, lease.version))
+            self.start()
+            self.condition.notify()
+            return lease.lease_id
+
+    def extend(self, lease_id, extra_seconds):
+        """
+        This function will extend the lease with the {lease_id}, no extra WLAN deploy is required
+        :param lease_id: the lease id
+        :param extra_seconds: the extra time, in seconds
+        :return: the new expiry time, or None if the lease is not active
+        """
+
+        with self.condition:
+            lease = self.leases.get(lease_id)
+            if lease is None:
+                return None
+            pending = self.pending.get(lease.controller)
+            if pending is not None and lease in pending[1]:
+                pending[1].remove(lease)    # expired, waiting for the release, the lease is active again
+                if not pending[1]:
+                    del self.pending[lease.controller]
+            lease.expires_at = max(lease.expires_at, time.time()) + extra_seconds
+            lease.version += 1
+            heapq.heappush(self.heap, (lease.expires_at, lease.lease_id, lease.version))
+            self.condition.notify()
+            return lease.expires_at
+
+    def cancel(self, lease_id):
+        """
+        This function will remove the lease with the {lease_id}, without calling the expiry callback
+        :param lease_id: the lease id
+        :return: the lease, or None if the lease is not active
+        """
+
+        with self.condition:
+            lease = self.leases.pop(lease_id, None)
+            if lease is not None:
+                pending = self.pending.get(lease.controller)
+                if pending is not None and lease in pending[1]:
+                    pending[1].remove(lease)
+                    if not pending[1]:
+                        del self.pending[lease.controller]
+            return lease
+
+    def active_leases(self, controller=None):
+        """
+        This function will find the active leases, on all the controllers or on the {controller}
+        :param controller: the controller name, or None
+        :return: list of the leases
+        """
+
+        with self.condition:
+            return [lease for lease in self.leases.values() if controller is None or lease.controller == controller]
+
+    def run(self):
+        with self.condition:
+            while not self.stopped:
+                now = time.time()
+
+                # move the expired leases to the pending release of their controller
+
+                while self.heap and self.heap[0][0] <= now:
+                    expires_at, lease_id, version = heapq.heappop(self.heap)
+                    lease = self.leases.get(lease_id)
+                    if lease is None or lease.version != version:
+                        continue    # cancelled or extended lease
+                    pending = self.pending.setdefault(lease.controller, [expires_at + self.coalesce_window, []])
+                    pending[1].append(lease)
+
+                # release together all the leases pending on a controller when the coalesce window ends
+
+                for controller, (flush_time, leases) in list(self.pending.items()):
+                    if flush_time <= now:
+                        del self.pending[controller]
+                        for lease in leases:
+                            self.leases.pop(lease.lease_id, None)
+                        self.executor.submit(self.expire, controller, leases)
+
+                next_times = [flush_time for flush_time, leases in self.pending.values()]
+                if self.heap:
+                    next_times.append(self.heap[0][0])
+                self.condition.wait(min(next_times) - now if next_times else None)
+
+    def expire(self, controller, leases):
+        try:
+            self.on_expire(controller, leases)
+        except Exception as error:
+            print('HotSpot lease expiry failed for controller ', controller, ': ', repr(error))
+
+    def start(self):
+        """
+        This function will start the scheduler thread
+        :return: none
+        """
+
+        with self.condition:
+            if self.thread is None:
+                self.stopped = False
+                self.thread = threading.Thread(target=self.run, name='hotspot-leases', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        """
+        This function will stop the scheduler thread, the active leases are not released
+        :return: none
+        """
+
+        with self.condition:
+            self.stopped = True
+            self.thread = None
+            self.condition.notify()
@@ -0,0 +1,264 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the closed-loop load simulator for the SparkConnect provisioning pipeline
+# Synthetic users post /E and the HotSpot duration to the provisioning engine, wait for the HotSpot, and repeat,
+# against the local stand-in servers for Spark, CMX, APIC-EM and PI, with many controllers.
+# The number of concurrent users is increased step by step, every step reports the provisioning latency
+# distribution, the throughput and the backend calls per request. The saturation point is the concurrency
+# after which the throughput does not grow any more. The capacity report is saved to a JSON file.
+# Usage:  python SparkConnect_loadsim.py [step duration in seconds]
+
+
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import re
+import sys
+import time
+
+from collections import Counter
+
+import SparkConnect
+
+from SparkConnect_async import ProvisioningEngine
+from SparkConnect_init import ENGINE_WORKERS
+from SparkConnect_bench import percentile
+from SparkConnect_http import CircuitBreaker
+from SparkConnect_standins import StandinData, start_standins, stop_standins, use_standins
+
+LOAD_LEVELS = (1, 2, 4, 8, 16, 32, 64, 128, 256)     # number of concurrent synthetic users at each step
+STEP_DURATION = 20              # seconds, each step
+SIM_CLIENTS = 20000             # CMX clients, the synthetic users
+SIM_CONTROLLERS = 200           # wireless controllers
+SIM_LATENCY = {'Spark': {'latency': 0.08, 'jitter': 0.04}, 'CMX': {'latency': 0.15, 'jitter': 0.10},
+               'APIC_EM': {'latency': 0.10, 'jitter': 0.05}, 'PI': {'latency': 0.25, 'jitter': 0.15}}
+PI_JOB_DURATION = 2.0           # seconds, from the deployTemplate call to the job completion
+HOTSPOT_MINUTES = 1             # HotSpot duration requested by the synthetic users
+SATURATION_GAIN = 0.10          # a step adding less than 10% throughput is past the saturation point
+MAX_FAILURE_RATE = 0.01         # a step with more than 1% failed requests is past the saturation point
+REPORT_FILE = 'loadsim_report.json'
+
+
+class SimulatedEngine(ProvisioningEngine):
+    """
+    Provisioning engine recording the hotspot sessions it creates, so the simulator can wait for them
+    """
+
+    def __init__(self, *args, **kwargs):
+        ProvisioningEngine.__init__(self, *args, **kwargs)
+        self.created = {}   # (room id, person email) -> the last hotspot session created
+
+    def start_session(self, room_id, person_email, minutes):
+        session = ProvisioningEngine.start_session(self, room_id, person_email, minutes)
+        self.created[(room_id, person_email)] = session
+        return session
+
+
+class StepResult(object):
+    """
+    The result of one load step, with {concurrency} synthetic users
+    """
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.latencies = []
+        self.failures = 0
+        self.failure_reasons = Counter()
+        self.elapsed = 0.0
+        self.backend_calls = {}
+        self.outbox_backlog = 0
+        self.stage_times = {}           # pipeline stage name -> list of the stage durations
+        self.critical_paths = Counter()
+
+    def summary(self):
+        """
+        This function will calculate the throughput, the latency percentiles and the backend calls per request
+        :return: dict of the step statistics
+        """
+
+        latencies = sorted(self.latencies)
+        requests = len(latencies) + self.failures
+        calls_per_request = {}
+        for backend, counts in self.backend_calls.items():
+            calls_per_request[backend] = {'%s %s' % route: round(count / max(requests, 1), 2)
+                                          for route, count in sorted(counts.items())}
+        return {'concurrency': self.concurrency, 'requests': requests, 'failures': self.failures,
+                'failure_rate': self.failures / requests if requests else 0.0,
+                'throughput': len(latencies) / self.elapsed if self.elapsed else 0.0,
+                'p50_s': percentile(latencies, 0.50), 'p90_s': percentile(latencies, 0.90),
+                'p99_s': percentile(latencies, 0.99), 'max_s': latencies[-1] if latencies else None,
+                'failure_reasons': dict(self.failure_reasons.most_common(5)),
+                'outbox_backlog': self.outbox_backlog, 'calls_per_request': calls_per_request,
+                'stage_mean_ms': {name: round(1000 * sum(times) / len(times), 1)
+                                  for name, times in self.stage_times.items()},
+                'critical_path': self.critical_paths.most_common(1)[0][0] if self.critical_paths else None}
+
+
+async def synthetic_user(engine, room_id, emails, end_time, result):
+    """
+    This function is one synthetic user, it requests a HotSpot, waits for it, and repeats until the {end_time}
+    The provisioning latency is measured from the duration answer to the HotSpot status
+    :param engine: the provisioning engine
+    :param room_id: the Spark room id
+    :param emails: iterator of the user emails, shared by all the synthetic users
+    :param end_time: the end of the load step
+    :param result: the StepResult
+    :return: none
+    """
+
+    while time.time() < end_time:
+        email = next(emails)
+        await engine.handle_message(room_id, '/E', email)
+        start = time.perf_counter()
+        await engine.handle_message(room_id, str(HOTSPOT_MINUTES), email)
+        session = engine.created.pop((room_id, email))
+        await session.task
+        if session.pipeline is not None:
+            for name, (stage_start, stage_end) in session.pipeline.timings.items():
+                result.stage_times.setdefault(name, []).append(stage_end - stage_start)
+            result.critical_paths[' -> '.join(session.pipeline.critical_path())] += 1
+        if session.state == 'active':
+            result.latencies.append(time.perf_counter() - start)
+        else:
+            result.failures += 1
+            reason = session.error or 'job status ' + str(session.job_status)
+            result.failure_reasons[re.sub(r"'[^']*'", "'...'", reason)] += 1     # group the same errors
+
+
+async def run_step(concurrency, room_id, emails, servers, duration):
+    """
+    This function will run one load step, with {concurrency} synthetic users for {duration} seconds
+    Every step starts with a new engine, the WLAN state of the controllers is reset,
+    and the inventory and CMX indexes are loaded, as when the application starts
+    :param concurrency: the number of concurrent synthetic users
+    :param room_id: the Spark room id
+    :param emails: iterator of the user emails
+    :param servers: the stand-in servers
+    :param duration: the step duration, in seconds
+    :return: the StepResult
+    """
+
+    SparkConnect.CONTROLLERS.controllers.clear()
+    for session in (SparkConnect.SPARK_SESSION, SparkConnect.CMX_SESSION, SparkConnect.EM_SESSION,
+                    SparkConnect.PI_SESSION):
+        session.breaker = CircuitBreaker(session.breaker.name)     # closed, not opened by the previous step
+    SparkConnect.INVENTORY.sync()
+    SparkConnect.CMX_INDEX.refresh()
+    SparkConnect.CMX_INDEX.max_age = duration + 60     # fresh for the whole step, as with the refresh thread
+    engine = SimulatedEngine()
+    for server in servers.values():
+        server.reset_counts()
+    result = StepResult(concurrency)
+    start = time.perf_counter()
+    end_time = time.time() + duration
+    await asyncio.gather(*[synthetic_user(engine, room_id, emails, end_time, result) for user in range(concurrency)])
+    result.elapsed = time.perf_counter() - start
+    result.backend_calls = {backend: server.call_counts() for backend, server in servers.items()}
+
+    # stop the engine, the queued room messages are dropped, they would be counted in the next step
+
+    engine.leases.stop()
+    with engine.outbox.condition:
+        result.outbox_backlog = len(engine.outbox.messages)
+        engine.outbox.messages.clear()
+    engine.executor.shutdown(wait=False)
+    return result
+
+
+def find_saturation(summaries):
+    """
+    This function will find the saturation point, the last step adding throughput without failures
+    :param summaries: list of the step summaries, by increasing concurrency
+    :return: the summary of the saturation step
+    """
+
+    best = None
+    for summary in summaries:
+        if summary['failure_rate'] > MAX_FAILURE_RATE:
+            break
+        if best is not None and summary['throughput'] < best['throughput'] * (1 + SATURATION_GAIN):
+            break
+        best = summary
+    return best
+
+
+def print_report(summaries, saturation):
+    """
+    This function will print the capacity report
+    :param summaries: list of the step summaries
+    :param saturation: the summary of the saturation step
+    :return: none
+    """
+
+    print('\n%6s %9s %8s %10s %8s %8s %8s %8s %8s' % ('users', 'requests', 'failed', 'hotspot/s', 'p50 s', 'p90 s',
+                                                      'p99 s', 'max s', 'backlog'))
+    for summary in summaries:
+        print('%6d %9d %8d %10.2f %8.2f %8.2f %8.2f %8.2f %8d' % (
+            summary['concurrency'], summary['requests'], summary['failures'], summary['throughput'],
+            summary['p50_s'] or 0, summary['p90_s'] or 0, summary['p99_s'] or 0, summary['max_s'] or 0,
+            summary['outbox_backlog']))
+    if saturation:
+        print('\nSaturation point: ', saturation['concurrency'], ' concurrent users, ',
+              round(saturation['throughput'], 2), ' HotSpots per second, p99 ', round(saturation['p99_s'] or 0, 2),
+              ' seconds')
+        print('Backend calls per request at the saturation point:')
+        for backend, calls in saturation['calls_per_request'].items():
+            print('  ', backend, ': ', calls)
+        print('Provisioning stages at the saturation point, mean ms: ', saturation['stage_mean_ms'])
+        print('Critical path: ', saturation['critical_path'])
+
+
+async def simulate(levels, duration):
+    """
+    This function will run the load steps against the local stand-in servers
+    :param levels: the number of concurrent synthetic users at each step
+    :param duration: the duration of each step, in seconds
+    :return: list of the step summaries
+    """
+
+    data = StandinData(num_clients=SIM_CLIENTS, num_controllers=SIM_CONTROLLERS, num_rooms=10,
+                       job_duration=PI_JOB_DURATION)
+    servers = start_standins(data, **SIM_LATENCY)
+    use_standins(servers)
+    emails = itertools.cycle(client['userName'] for client in data.clients)
+    summaries = []
+    try:
+        room_id = SparkConnect.create_spark_room('SparkConnect load simulation')
+        for concurrency in levels:
+            print('Load step: ', concurrency, ' concurrent users', file=sys.stderr)
+            result = await run_step(concurrency, room_id, emails, servers, duration)
+            summary = result.summary()
+            summaries.append(summary)
+            if summary['failure_rate'] > MAX_FAILURE_RATE * 10:
+                break   # far past the saturation point
+    finally:
+        stop_standins(servers)
+    return summaries
+
+
+def main():
+    """
+    This program will run the closed-loop load simulation, and save the capacity report
+    """
+
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else STEP_DURATION
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):   # the API functions print
+        summaries = asyncio.run(simulate(LOAD_LEVELS, duration))
+    saturation = find_saturation(summaries)
+    print_report(summaries, saturation)
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'step_duration': duration,
+              'clients': SIM_CLIENTS, 'controllers': SIM_CONTROLLERS, 'latency': SIM_LATENCY,
+              'pi_job_duration': PI_JOB_DURATION, 'engine_workers': ENGINE_WORKERS,
+              'steps': summaries, 'saturation': saturation}
+    with open(REPORT_FILE, 'w') as report_file:
+        json.dump(report, report_file, indent=4)
+    print('\nCapacity report saved to ', REPORT_FILE)
+
+
+if __name__ == '__main__':
+    main()
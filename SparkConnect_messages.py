@@ -0,0 +1,140 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the incremental Spark room message reader
+# The reader remembers the message ids it has seen, and the creation time of the newest one, and requests only
+# the messages posted after it, using a minimal page size. Every new message is returned once, with the text and
+# the author. If the last seen message was deleted, the older messages are recognized by their creation time,
+# the room history is never returned as new messages.
+
+
+from collections import deque
+
+from SparkConnect_rooms import SparkRoomNotFoundError
+
+READER_PAGE_SIZE = 2        # initial page size, one new message and the last seen message fit in one page
+READER_MAX_PAGE_SIZE = 50   # the page size doubles up to this value while more new messages are found
+READER_MAX_PAGES = 10       # maximum number of pages requested in one poll
+SEEN_MESSAGES = 1000        # number of message ids remembered
+
+
+class SparkMessageReader(object):
+    """
+    Incremental reader for the messages posted in the Spark room with the {room_id}
+    The API calls are made through the Spark {session}, to the {spark_url}
+    """
+
+    def __init__(self, room_id, spark_url, session, page_size=READER_PAGE_SIZE):
+        self.room_id = room_id
+        self.spark_url = spark_url
+        self.session = session
+        self.page_size = page_size
+        self.newest_created = None      # creation time of the newest message returned or primed
+        self.primed = False
+        self.seen_ids = set()
+        self.seen_order = deque()
+
+    def remember(self, message_id):
+        """
+        This function will add the {message_id} to the seen-message set, the oldest ids are forgotten
+        :param message_id: the Spark message id
+        :return: none
+        """
+
+        if message_id in self.seen_ids:
+            return
+        self.seen_ids.add(message_id)
+        self.seen_order.append(message_id)
+        if len(self.seen_order) > SEEN_MESSAGES:
+            self.seen_ids.discard(self.seen_order.popleft())
+
+    def fetch_page(self, max_messages, before_message=None):
+        """
+        This function will get one page of messages, the newest first
+        API call to /messages?roomId={room_id}&max={max_messages}&beforeMessage={before_message}
+        :param max_messages: the page size
+        :param before_message: return only the messages posted before the message with this id
+        :return: the list of messages, SparkRoomNotFoundError is raised if the room was deleted
+        """
+
+        url = self.spark_url + '/messages'
+        params = {'roomId': self.room_id, 'max': max_messages}
+        if before_message:
+            params['beforeMessage'] = before_message
+        header = {'content-type': 'application/json'}
+        response = self.session.get(url, params=params, headers=header)
+        if response.status_code == 404:
+            raise SparkRoomNotFoundError('Spark room not found: ' + self.room_id, response=response)
+        response.raise_for_status()
+        return response.json()['items']
+
+    def prime(self):
+        """
+        This function will set the cursor to the newest message in the room, without returning it
+        :return: the newest message, or None for an empty room
+        """
+
+        items = self.fetch_page(1)
+        self.primed = True
+        if not items:
+            return None
+        self.newest_created = items[0].get('created')
+        self.remember(items[0]['id'])
+        return items[0]
+
+    def resume(self, message_id):
+        """
+        This function will set the cursor to the message with the {message_id}, the messages posted after it
+        are returned by the next poll, used when the room is taken over from another worker
+        :param message_id: the id of the last message already processed
+        :return: none
+        """
+
+        self.remember(message_id)
+        self.primed = True
+
+    def new_messages(self):
+        """
+        This function will find all the messages posted since the last poll
+        The pages are requested newest first until a message already seen, or a message created before the newest
+        message returned, is found. If the last seen message is not found in READER_MAX_PAGES pages, the reader
+        is primed again, and no message is returned, the room history is not replayed as new commands.
+        :return: list of the new messages, the oldest first, each message is a dict with the keys
+                 {id}, {text} and {personEmail}
+        """
+
+        if not self.primed:
+            self.prime()
+            return []
+        new_items = []
+        before_message = None
+        page_size = self.page_size
+        found_cursor = False
+        for page in range(READER_MAX_PAGES):
+            items = self.fetch_page(page_size, before_message)
+            for item in items:
+                if item['id'] in self.seen_ids or (self.newest_created and item.get('created') and
+                                                   item['created'] < self.newest_created):
+                    found_cursor = True
+                    break
+                new_items.append(item)
+            if found_cursor:
+                break
+            if len(items) < page_size:
+                found_cursor = not self.seen_ids    # the room was empty when primed, all its messages are new
+                break
+            before_message = items[-1]['id']
+            page_size = min(page_size * 2, READER_MAX_PAGE_SIZE)
+        if not found_cursor:
+            print('Spark room ', self.room_id, ' - last seen message not found, the reader is primed again')
+            self.prime()
+            return []
+        new_items.reverse()
+        for item in new_items:
+            self.remember(item['id'])
+            if item.get('created') and (self.newest_created is None or item['created'] > self.newest_created):
+                self.newest_created = item['created']
+        return [{'id': item['id'], 'text': item.get('text'), 'personEmail': item.get('personEmail')}
+                for item in new_items]
@@ -0,0 +1,224 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the built-in metrics for the API calls
+# Every instrumented API function records a latency histogram, call and error counters and an in-flight gauge.
+# The instrumented sessions record the same metrics for every HTTP request, by backend and route, so the calls made
+# by the background services, the message reader, the outbound queue, the indexes and the PI job poller,
+# are measured too, and the bytes transferred for each backend.
+# The metrics are served in the Prometheus text format from an optional local HTTP endpoint, /metrics.
+# Nothing is recorded until the metrics are enabled, the instrumented functions only check one flag.
+
+
+import functools
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROUTE_ID = re.compile(r'^(?=.*[0-9])([0-9.:-]+|[A-Za-z0-9_=+-]{8,})$')    # the path segments replaced by {id}
+
+
+class MetricsRegistry(object):
+    """
+    The API call metrics, keyed by backend and API name, exported as the {prefix}_* metric families with the
+    {label} label for the API name
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, prefix='sparkconnect_api', label='api', description='API function'):
+        self.enabled = False
+        self.buckets = buckets
+        self.prefix = prefix
+        self.label = label
+        self.description = description
+        self.lock = threading.Lock()
+        self.latency = {}       # (backend, api) -> [bucket counts, sum, count]
+        self.errors = {}        # (backend, api) -> number of calls that raised an exception
+        self.in_flight = {}     # (backend, api) -> number of calls in progress
+        self.bytes = {}         # (backend, direction) -> bytes sent or received
+
+    def start_call(self, key):
+        with self.lock:
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def end_call(self, key, seconds, failed):
+        with self.lock:
+            self.in_flight[key] -= 1
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = [[0] * len(self.buckets), 0.0, 0]
+            for position, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][position] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            if failed:
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def add_bytes(self, backend, direction, count):
+        with self.lock:
+            key = (backend, direction)
+            self.bytes[key] = self.bytes.get(key, 0) + count
+
+    def prometheus_text(self):
+        """
+        This function will format all the metrics in the Prometheus text exposition format
+        :return: the metrics text
+        """
+
+        prefix, label, description = self.prefix, self.label, self.description
+        lines = []
+        with self.lock:
+            lines.append('# HELP %s_latency_seconds %s call latency' % (prefix, description))
+            lines.append('# TYPE %s_latency_seconds histogram' % prefix)
+            for (backend, api), (counts, total, count) in sorted(self.latency.items()):
+                labels = 'backend="%s",%s="%s"' % (backend, label, api)
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append('%s_latency_seconds_bucket{%s,le="%s"} %d' % (prefix, labels, bound, bucket_count))
+                lines.append('%s_latency_seconds_bucket{%s,le="+Inf"} %d' % (prefix, labels, count))
+                lines.append('%s_latency_seconds_sum{%s} %f' % (prefix, labels, total))
+                lines.append('%s_latency_seconds_count{%s} %d' % (prefix, labels, count))
+            lines.append('# HELP %s_errors_total %s calls that failed' % (prefix, description))
+            lines.append('# TYPE %s_errors_total counter' % prefix)
+            for (backend, api), count in sorted(self.errors.items()):
+                lines.append('%s_errors_total{backend="%s",%s="%s"} %d' % (prefix, backend, label, api, count))
+            lines.append('# HELP %s_in_flight %s calls in progress' % (prefix, description))
+            lines.append('# TYPE %s_in_flight gauge' % prefix)
+            for (backend, api), count in sorted(self.in_flight.items()):
+                lines.append('%s_in_flight{backend="%s",%s="%s"} %d' % (prefix, backend, label, api, count))
+            if self.bytes:
+                lines.append('# HELP sparkconnect_http_bytes_total HTTP bytes transferred to and from each backend')
+                lines.append('# TYPE sparkconnect_http_bytes_total counter')
+                for (backend, direction), count in sorted(self.bytes.items()):
+                    lines.append('sparkconnect_http_bytes_total{backend="%s",direction="%s"} %d' % (
+                        backend, direction, count))
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+REQUEST_METRICS = MetricsRegistry(prefix='sparkconnect_http_request', label='route', description='HTTP request')
+
+
+def timed_call(registry, key, function, *args, **kwargs):
+    """
+    This function will call the {function}, and record its latency and failure in the {registry}, under the {key}
+    A response with a 5xx status code is recorded as failed
+    :return: the function return value
+    """
+
+    registry.start_call(key)
+    start = time.time()
+    failed = True
+    try:
+        result = function(*args, **kwargs)
+        failed = getattr(result, 'status_code', 0) >= 500
+        return result
+    finally:
+        registry.end_call(key, time.time() - start, failed)
+
+
+def route_template(url):
+    """
+    This function will find the route of the {url}, the path with the ids, the IP and MAC addresses
+    replaced by {id}, so all the requests to one API endpoint are recorded together
+    :param url: the request URL
+    :return: the route, for example /v1/messages/{id}
+    """
+
+    path = url.split('://', 1)[-1].partition('/')[2].split('?')[0]
+    return '/' + '/'.join('{id}' if ROUTE_ID.match(segment) else segment for segment in path.split('/'))
+
+
+def instrument(backend, api=None):
+    """
+    This function is a decorator, it will record the metrics of the decorated API function
+    :param backend: the backend name, Spark, CMX, APIC-EM or PI
+    :param api: the API name, the function name if None
+    :return: the decorator
+    """
+
+    def decorator(function):
+        key = (backend, api or function.__name__)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return function(*args, **kwargs)
+            return timed_call(METRICS, key, function, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_session(session, backend):
+    """
+    This function will record the latency and the failures of every request made through the requests {session},
+    by backend and route, and the bytes sent and received
+    The latency of the streamed responses is measured to the response headers, the received bytes are counted
+    from the Content-Length header
+    :param session: the requests session
+    :param backend: the backend name
+    :return: none
+    """
+
+    request = session.request
+
+    @functools.wraps(request)
+    def timed_request(method, url, *args, **kwargs):
+        if not METRICS.enabled:
+            return request(method, url, *args, **kwargs)
+        key = (backend, method.upper() + ' ' + route_template(url))
+        return timed_call(REQUEST_METRICS, key, request, method, url, *args, **kwargs)
+
+    def record_bytes(response, *args, **kwargs):
+        if not METRICS.enabled:
+            return
+        body = response.request.body
+        METRICS.add_bytes(backend, 'sent', len(body) if body else 0)
+        if getattr(response, 'from_cache', False):
+            return      # the body is read from the local HTTP cache
+        content_length = response.headers.get('Content-Length')
+        if content_length is not None and content_length.isdigit():
+            METRICS.add_bytes(backend, 'received', int(content_length))
+        elif not kwargs.get('stream'):
+            METRICS.add_bytes(backend, 'received', len(response.content))
+
+    session.request = timed_request
+    session.hooks['response'].append(record_bytes)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = (METRICS.prometheus_text() + REQUEST_METRICS.prometheus_text()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """
+    This function will enable the metrics, and serve them from http://{host}:{port}/metrics
+    :param port: the local port
+    :param host: the local address
+    :return: the HTTP server
+    """
+
+    METRICS.enabled = True
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print('Metrics available at http://' + host + ':' + str(port) + '/metrics')
+    return server
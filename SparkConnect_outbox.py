@@ -0,0 +1,184 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the outbound Spark message queue
+# The messages are delivered by a background thread, posting never blocks the caller. The consecutive messages
+# to the same room are merged into one markdown post, and the posts are rate limited by a token bucket,
+# which is paused for the Retry-After time when Spark returns 429. After a network error, an open circuit or
+# a 5xx response the bucket is paused for an increasing delay before the retry, a 4xx response is not retried.
+
+
+import json
+import threading
+import time
+
+from collections import deque
+
+OUTBOX_RATE = 2.0               # messages per second
+OUTBOX_BURST = 5                # maximum number of messages posted in a burst
+OUTBOX_MAX_MERGE = 7000         # maximum length of a merged markdown message, Spark limit is 7439 bytes
+OUTBOX_RETRIES = 5              # number of retries for a message after a network error or a 5xx response
+OUTBOX_RETRY_DELAY = 2.0        # seconds to wait before the first retry, doubled for each following retry
+RETRY_AFTER_DEFAULT = 5         # seconds to wait if Spark returns 429 without a Retry-After header
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter, {rate} tokens per second, up to {capacity} tokens
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.time()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        """
+        This function will stop issuing tokens for {seconds}, used for the Retry-After time
+        :param seconds: the pause time
+        :return: none
+        """
+
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+            self.tokens = 0
+
+    def acquire(self):
+        """
+        This function will wait for one token
+        :return: none
+        """
+
+        while True:
+            with self.lock:
+                now = time.time()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - max(self.updated, self.paused_until)) *
+                                      self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+
+class SparkMessageQueue(object):
+    """
+    Outbound Spark message queue, the messages are posted through the Spark {session}, to the {spark_url}
+    """
+
+    def __init__(self, spark_url, session, rate=OUTBOX_RATE, burst=OUTBOX_BURST):
+        self.spark_url = spark_url
+        self.session = session
+        self.bucket = TokenBucket(rate, burst)
+        self.messages = deque()
+        self.condition = threading.Condition()
+        self.in_flight = False
+        self.failed = 0     # number of messages not delivered
+        self.thread = None
+
+    def post(self, room_id, message):
+        """
+        This function will queue the {message} for the Spark room with the {room_id}, it does not wait for the post
+        :param room_id: the Spark room id
+        :param message: the text of the message
+        :return: none
+        """
+
+        with self.condition:
+            self.messages.append((room_id, message, 0))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.deliver_loop, name='spark-outbox', daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    def next_batch(self):
+        """
+        This function will take the consecutive messages queued for the same room, merged in one markdown message
+        :return: the room id, the merged message, the list of the queued messages
+        """
+
+        room_id = self.messages[0][0]
+        batch = [self.messages.popleft()]
+        length = len(batch[0][1])
+        while self.messages and self.messages[0][0] == room_id:
+            length += len(self.messages[0][1]) + 2
+            if length > OUTBOX_MAX_MERGE:
+                break
+            batch.append(self.messages.popleft())
+        return room_id, '\n\n'.join(message for room, message, retries in batch), batch
+
+    def send(self, room_id, markdown):
+        """
+        This function will post the {markdown} message to the Spark room with the {room_id}
+        API call to /messages
+        :param room_id: the Spark room id
+        :param markdown: the markdown message
+        :return: the API call response
+        """
+
+        payload = {'roomId': room_id, 'markdown': markdown}
+        url = self.spark_url + '/messages'
+        header = {'content-type': 'application/json'}
+        return self.session.post(url, data=json.dumps(payload), headers=header)
+
+    def deliver_loop(self):
+        while True:
+            with self.condition:
+                while not self.messages:
+                    self.condition.wait()
+                room_id, markdown, batch = self.next_batch()
+                self.in_flight = True
+            self.bucket.acquire()
+            try:
+                response = self.send(room_id, markdown)
+                status_code = response.status_code
+            except Exception as error:
+                print('Spark message post failed: ', repr(error))
+                status_code = None
+            with self.condition:
+                if status_code == 429:
+                    retry_after = response.headers.get('Retry-After')
+                    self.bucket.pause(int(retry_after) if retry_after and retry_after.isdigit()
+                                      else RETRY_AFTER_DEFAULT)
+                    self.messages.extendleft(reversed(batch))     # delivered again after the Retry-After time
+                elif status_code is None or status_code >= 500:
+                    retry = [(room, message, retries + 1) for room, message, retries in batch
+                             if retries < OUTBOX_RETRIES]
+                    if len(retry) < len(batch):
+                        print('Spark message delivery failed after ', OUTBOX_RETRIES, ' retries')
+                        self.failed += len(batch) - len(retry)
+                    if retry:
+                        self.bucket.pause(OUTBOX_RETRY_DELAY * 2 ** max(retries for room, message, retries in batch))
+                    self.messages.extendleft(reversed(retry))
+                elif status_code >= 400:
+                    print('Spark message post failed: ', status_code, ' ', markdown)
+                    self.failed += len(batch)
+                else:
+                    print('Message posted :  ', markdown)
+                self.in_flight = False
+                self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        This function will wait until all the queued messages are delivered
+        :param timeout: maximum seconds to wait
+        :return: True if the queue is empty
+        """
+
+        end = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while self.messages or self.in_flight:
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
@@ -0,0 +1,106 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the lazy paginated iterators for the Spark list endpoints, rooms, messages and memberships
+# The pages are requested following the Link header, only when the caller iterates. The next page is prefetched
+# on a background thread while the caller consumes the current page, at most one page is requested ahead.
+# A prefetch already started when the caller stops iterating still completes, the lookups that stop at the
+# first match use prefetch=False, so no page is requested after the match.
+
+
+from concurrent.futures import ThreadPoolExecutor
+
+PAGE_SIZE = 100             # number of items requested in one page
+PREFETCH_WORKERS = 4        # maximum number of pages prefetched at the same time, for all the iterators
+
+PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+
+
+def get_page(session, url, params, headers):
+    """
+    This function will request one page of the list
+    :param session: the Spark requests session
+    :param url: the page URL
+    :param params: the query parameters, None for the Link header URLs which include them
+    :param headers: the request headers
+    :return: the list of the page items, and the URL of the next page or None
+    """
+
+    response = session.get(url, params=params, headers=headers)
+    response.raise_for_status()
+    return response.json()['items'], response.links.get('next', {}).get('url')
+
+
+def iter_spark_items(session, url, params=None, prefetch=True):
+    """
+    This function will yield the items of the Spark list endpoint at the {url}, one page at a time,
+    following the Link header. The next page is requested in the background while the current page is consumed.
+    :param session: the Spark requests session
+    :param url: the list endpoint URL, for example {SPARK_URL}/rooms
+    :param params: the query parameters of the first page, for example the max page size
+    :param prefetch: False to request the next page only when the current page is consumed
+    :return: generator of the items
+    """
+
+    headers = {'content-type': 'application/json'}
+    items, next_url = get_page(session, url, params, headers)
+    pending = None
+    try:
+        while True:
+            if next_url and prefetch:
+                pending = PREFETCH_EXECUTOR.submit(get_page, session, next_url, None, headers)
+            for item in items:
+                yield item
+            if not next_url:
+                return
+            if pending is not None:
+                items, next_url = pending.result()
+                pending = None
+            else:
+                items, next_url = get_page(session, next_url, None, headers)
+    finally:
+        if pending is not None:
+            pending.cancel()    # the caller stopped iterating, the prefetch is dropped only if not started
+
+
+def iter_spark_rooms(spark_url, session, page_size=PAGE_SIZE):
+    """
+    This function will yield all the Spark rooms of the account
+    API call to /rooms?max={page_size}
+    :param spark_url: the Spark API URL
+    :param session: the Spark requests session
+    :param page_size: number of rooms requested in one page
+    :return: generator of the rooms
+    """
+
+    return iter_spark_items(session, spark_url + '/rooms', {'max': page_size})
+
+
+def iter_spark_messages(spark_url, session, room_id, page_size=PAGE_SIZE):
+    """
+    This function will yield the messages of the Spark room with the {room_id}, the newest first
+    API call to /messages?roomId={room_id}&max={page_size}
+    :param spark_url: the Spark API URL
+    :param session: the Spark requests session
+    :param room_id: the Spark room id
+    :param page_size: number of messages requested in one page
+    :return: generator of the messages
+    """
+
+    return iter_spark_items(session, spark_url + '/messages', {'roomId': room_id, 'max': page_size})
+
+
+def iter_spark_memberships(spark_url, session, room_id, page_size=PAGE_SIZE):
+    """
+    This function will yield the memberships of the Spark room with the {room_id}
+    API call to /memberships?roomId={room_id}&max={page_size}
+    :param spark_url: the Spark API URL
+    :param session: the Spark requests session
+    :param room_id: the Spark room id
+    :param page_size: number of memberships requested in one page
+    :return: generator of the memberships
+    """
+
+    return iter_spark_items(session, spark_url + '/memberships', {'roomId': room_id, 'max': page_size})
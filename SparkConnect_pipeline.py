@@ -0,0 +1,121 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the dependency graph executor for the provisioning chain
+# Every step declares the steps it requires, the executor starts each step as soon as the results of the required
+# steps are available, so the independent steps run concurrently. The start and end time of every step is recorded,
+# the report shows the stage timings and the critical path, the chain of steps which determined the total time.
+# If one step fails, the steps not completed are cancelled and the step error is raised.
+
+
+import asyncio
+import time
+
+from SparkConnect_metrics import METRICS
+
+
+class PipelineStep(object):
+    """
+    One step of the pipeline, the coroutine {function} is called with the results of the {requires} steps, in order
+    """
+
+    def __init__(self, name, function, requires=()):
+        self.name = name
+        self.function = function
+        self.requires = tuple(requires)
+
+
+class Pipeline(object):
+    """
+    Dependency graph of the {steps}, executed with the maximum overlap
+    """
+
+    def __init__(self, steps):
+        self.steps = {}
+        for step in steps:
+            missing = [name for name in step.requires if name not in self.steps]
+            if missing:
+                raise ValueError('Step ' + step.name + ' requires unknown or later steps: ' + ', '.join(missing))
+            self.steps[step.name] = step      # the steps are listed after the steps they require, no cycles
+        self.results = {}
+        self.timings = {}   # step name -> (start, end), in seconds from the pipeline start
+        self.start = None
+        self.elapsed = None
+
+    async def run_step(self, step, tasks):
+        """
+        This function will wait for the required steps, and run the {step}
+        :param step: the PipelineStep
+        :param tasks: dict of the step name to the asyncio task of the step
+        :return: the step result
+        """
+
+        if step.requires:
+            await asyncio.gather(*[tasks[name] for name in step.requires])
+        start = time.perf_counter()
+        failed = True
+        if METRICS.enabled:
+            METRICS.start_call(('pipeline', step.name))
+        try:
+            result = await step.function(*[self.results[name] for name in step.requires])
+            failed = False
+        finally:
+            end = time.perf_counter()
+            self.timings[step.name] = (start - self.start, end - self.start)
+            if METRICS.enabled:
+                METRICS.end_call(('pipeline', step.name), end - start, failed)   # stage latency histogram
+        self.results[step.name] = result
+        return result
+
+    async def run(self):
+        """
+        This function will run all the steps, each one as soon as the required steps are completed
+        :return: dict of the step name to the step result
+        """
+
+        self.start = time.perf_counter()
+        tasks = {}
+        for step in self.steps.values():
+            tasks[step.name] = asyncio.ensure_future(self.run_step(step, tasks))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()   # the steps not completed, after a failed step
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            self.elapsed = time.perf_counter() - self.start
+        return self.results
+
+    def critical_path(self):
+        """
+        This function will find the critical path, from the last completed step back through
+        the required step completed last, at each step
+        :return: list of the step names, in execution order
+        """
+
+        if not self.timings:
+            return []
+        path = [max(self.timings, key=lambda name: self.timings[name][1])]
+        while True:
+            requires = [name for name in self.steps[path[-1]].requires if name in self.timings]
+            if not requires:
+                return path[::-1]
+            path.append(max(requires, key=lambda name: self.timings[name][1]))
+
+    def report(self):
+        """
+        This function will format the stage timings and the critical path
+        :return: the report text
+        """
+
+        lines = ['%-10s %9s %9s %9s' % ('stage', 'start ms', 'end ms', 'took ms')]
+        for name in self.steps:
+            if name in self.timings:
+                start, end = self.timings[name]
+                lines.append('%-10s %9.1f %9.1f %9.1f' % (name, start * 1000, end * 1000, (end - start) * 1000))
+        sequential = sum(end - start for start, end in self.timings.values())
+        lines.append('critical path: ' + ' -> '.join(self.critical_path()) +
+                     ', total %.1f ms, sequential %.1f ms' % ((self.elapsed or 0) * 1000, sequential * 1000))
+        return '\n'.join(lines)
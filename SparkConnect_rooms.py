@@ -0,0 +1,110 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the Spark room title to room id cache, and the paginated room lookup
+# The cache is saved to a JSON file, a room id is removed from the cache when Spark returns 404 for it,
+# and SparkRoomNotFoundError is raised, the caller finds or creates the room again
+
+
+import json
+import os
+import threading
+
+import requests
+
+from SparkConnect_pages import iter_spark_items
+
+ROOM_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.spark_room_cache.json')
+ROOM_PAGE_SIZE = 100    # number of rooms requested in one page
+
+
+class SparkRoomNotFoundError(requests.exceptions.HTTPError):
+    """
+    Raised when Spark returns 404 for a room id, the room was deleted
+    """
+
+
+class SparkRoomCache(object):
+    """
+    Persistent Spark room title to room id cache, saved to the {file_path} JSON file
+    """
+
+    def __init__(self, file_path=ROOM_CACHE_FILE):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.rooms = {}
+        try:
+            with open(file_path) as cache_file:
+                self.rooms = json.load(cache_file)
+        except (IOError, ValueError):
+            self.rooms = {}
+
+    def save(self):
+        temp_path = '%s.%d.tmp' % (self.file_path, os.getpid())     # the processes sharing the file
+        try:
+            with open(temp_path, 'w') as cache_file:
+                json.dump(self.rooms, cache_file)
+            os.replace(temp_path, self.file_path)
+        except (IOError, OSError) as error:
+            print('Spark room cache not saved: ', repr(error))
+
+    def get(self, room_name):
+        """
+        This function will find the cached room id for the {room_name}
+        :param room_name: the Spark room name
+        :return: the Spark room id, or None if not cached
+        """
+
+        return self.rooms.get(room_name)
+
+    def store(self, room_name, room_id):
+        """
+        This function will save the room id for the {room_name}
+        :param room_name: the Spark room name
+        :param room_id: the Spark room id
+        :return: none
+        """
+
+        with self.lock:
+            if self.rooms.get(room_name) != room_id:
+                self.rooms[room_name] = room_id
+                self.save()
+
+    def invalidate(self, room_id):
+        """
+        This function will remove the {room_id} from the cache, called when Spark returns 404 for the room
+        :param room_id: the Spark room id
+        :return: none
+        """
+
+        with self.lock:
+            titles = [title for title, cached_id in self.rooms.items() if cached_id == room_id]
+            for title in titles:
+                del self.rooms[title]
+            if titles:
+                self.save()
+
+
+def find_room_id_paginated(spark_url, session, room_name, page_size=ROOM_PAGE_SIZE):
+    """
+    This function will find the Spark room id based on the {room_name}
+    The room list is requested one page at a time, following the Link header, until the first match,
+    the next page is requested only if the room is not found in the current page
+    API call to /rooms?max={page_size}
+    :param spark_url: the Spark API URL
+    :param session: the Spark requests session
+    :param room_name: the room name for which to find the Spark room id
+    :param page_size: number of rooms requested in one page
+    :return: the Spark room id, or None if not found
+    """
+
+    rooms = iter_spark_items(session, spark_url + '/rooms', {'max': page_size}, prefetch=False)
+    try:
+        for room in rooms:
+            if room['title'] == room_name:
+                return room['id']
+        return None
+    finally:
+        rooms.close()   # no more pages are requested
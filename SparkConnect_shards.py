@@ -0,0 +1,518 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the sharded multi-room mode of SparkConnect
+# The site rooms are partitioned across many worker processes. The room ownership is coordinated through a local
+# SQLite store: every worker renews its heartbeat and its room leases, takes a fair share of the rooms, and takes
+# over the rooms of the workers whose leases expired. Every worker runs its own provisioning engine and polls
+# only the rooms it owns. The WLAN state of the controllers is shared through the store, so a worker does not
+# disable the SparkConnect SSID while a HotSpot of another worker is active on the same controller.
+# Usage:  python SparkConnect_shards.py            start SHARD_WORKERS local worker processes
+#         python SparkConnect_shards.py worker     start one worker, for example on another node sharing the store
+
+
+import asyncio
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+from multiprocessing import Process
+
+import SparkConnect
+
+from SparkConnect_init import SHARD_ROOMS, SHARD_STORE, SHARD_WORKERS, SHARD_LEASE_TTL, SHARD_HEARTBEAT
+from SparkConnect_init import WLAN_DEPLOY, WLAN_DISABLE
+from SparkConnect_async import ProvisioningEngine, INSTRUCTIONS, READY
+from SparkConnect_deploy import SUCCESS_RESULTS, is_live_after
+from SparkConnect_jobs import JOB_DEADLINE, JOB_TIMEOUT
+from SparkConnect_rooms import SparkRoomNotFoundError
+
+DEPLOY_WAIT = 0.5       # seconds between two checks while another worker deploys a template to the controller
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, heartbeat REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS rooms (room_name TEXT PRIMARY KEY, room_id TEXT, owner TEXT,
+                                  lease_expires REAL NOT NULL DEFAULT 0, last_message_id TEXT);
+CREATE TABLE IF NOT EXISTS controllers (controller TEXT PRIMARY KEY, live INTEGER NOT NULL DEFAULT 0,
+                                        job_status TEXT, deploying_until REAL NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS hotspots (controller TEXT NOT NULL, worker_id TEXT NOT NULL,
+                                     active INTEGER NOT NULL, expires REAL NOT NULL,
+                                     PRIMARY KEY (controller, worker_id));
+"""
+
+
+class ShardStore(object):
+    """
+    SQLite store of the worker heartbeats, the room ownership leases, and the shared controller WLAN state
+    The store file at {path} is shared by all the workers, on one node or on a shared file system
+    """
+
+    def __init__(self, path=SHARD_STORE, lease_ttl=SHARD_LEASE_TTL):
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.local = threading.local()     # one connection for each thread
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self.local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        """
+        This function will run the statements of the with block in one write transaction
+        :return: the SQLite connection
+        """
+
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def add_rooms(self, room_names):
+        """
+        This function will add the {room_names} to the rooms served by the workers
+        :param room_names: list of the Spark room names
+        :return: none
+        """
+
+        with self.transaction() as connection:
+            connection.executemany('INSERT OR IGNORE INTO rooms (room_name) VALUES (?)',
+                                   [(room_name,) for room_name in room_names])
+
+    def heartbeat(self, worker_id):
+        """
+        This function will renew the heartbeat of the worker, take its fair share of the rooms, and renew
+        the leases of the rooms it owns. The rooms of the dead workers are taken over when their leases expire,
+        the extra rooms are released when new workers join.
+        :param worker_id: the worker id
+        :return: list of (room name, room id, last message id) of the rooms owned by the worker
+        """
+
+        now = time.time()
+        expires = now + self.lease_ttl
+        with self.transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO workers (worker_id, heartbeat) VALUES (?, ?)',
+                               (worker_id, now))
+            connection.execute('DELETE FROM workers WHERE heartbeat <= ?', (now - 10 * self.lease_ttl,))
+            live_workers = [row[0] for row in connection.execute(
+                'SELECT worker_id FROM workers WHERE heartbeat > ? ORDER BY worker_id', (now - self.lease_ttl,))]
+            room_count = connection.execute('SELECT COUNT(*) FROM rooms').fetchone()[0]
+            fair_share, remainder = divmod(room_count, len(live_workers))
+            if live_workers.index(worker_id) < remainder:
+                fair_share += 1     # the first workers, by worker id, serve one of the remaining rooms
+            owned = [row[0] for row in connection.execute(
+                'SELECT room_name FROM rooms WHERE owner = ? AND lease_expires > ? ORDER BY room_name',
+                (worker_id, now))]
+            if len(owned) > fair_share:
+                connection.executemany('UPDATE rooms SET owner = NULL, lease_expires = 0 WHERE room_name = ?',
+                                       [(room_name,) for room_name in owned[fair_share:]])
+            elif len(owned) < fair_share:
+                connection.execute(
+                    'UPDATE rooms SET owner = ? WHERE room_name IN (SELECT room_name FROM rooms '
+                    'WHERE owner IS NULL OR lease_expires <= ? ORDER BY room_name LIMIT ?)',
+                    (worker_id, now, fair_share - len(owned)))
+            connection.execute('UPDATE rooms SET lease_expires = ? WHERE owner = ?', (expires, worker_id))
+            return connection.execute('SELECT room_name, room_id, last_message_id FROM rooms WHERE owner = ? '
+                                      'ORDER BY room_name', (worker_id,)).fetchall()
+
+    def release_rooms(self, worker_id):
+        """
+        This function will release all the rooms of the worker, and remove its heartbeat, when it stops
+        :param worker_id: the worker id
+        :return: none
+        """
+
+        with self.transaction() as connection:
+            connection.execute('UPDATE rooms SET owner = NULL, lease_expires = 0 WHERE owner = ?', (worker_id,))
+            connection.execute('DELETE FROM workers WHERE worker_id = ?', (worker_id,))
+
+    def set_room_id(self, room_name, room_id):
+        with self.transaction() as connection:
+            connection.execute('UPDATE rooms SET room_id = ? WHERE room_name = ?', (room_id, room_name))
+
+    def checkpoint(self, room_name, worker_id, message_id):
+        """
+        This function will save the id of the last message processed in the room, if the worker still owns it
+        :param room_name: the Spark room name
+        :param worker_id: the worker id
+        :param message_id: the Spark message id
+        :return: False if the room is owned by another worker
+        """
+
+        with self.transaction() as connection:
+            cursor = connection.execute('UPDATE rooms SET last_message_id = ? WHERE room_name = ? AND owner = ?',
+                                        (message_id, room_name, worker_id))
+            return cursor.rowcount == 1
+
+    def room_owners(self):
+        """
+        This function will find the owner of every room, for the status report
+        :return: dict of the room name to the worker id, None for the rooms not owned
+        """
+
+        return dict(self.connection().execute('SELECT room_name, owner FROM rooms').fetchall())
+
+
+class SharedControllerStateTracker(object):
+    """
+    Controller WLAN state tracker shared by all the workers through the {store}, with the same interface as the
+    ControllerStateTracker. The active HotSpots are counted for each controller and worker, with the expiry time
+    of the last HotSpot, so the HotSpots of a dead worker are counted until they expire.
+    """
+
+    def __init__(self, store, worker_id, deploy_function, job_waiter, enable_template=WLAN_DEPLOY,
+                 disable_template=WLAN_DISABLE, deadline=JOB_DEADLINE):
+        self.store = store
+        self.worker_id = worker_id
+        self.deploy_function = deploy_function
+        self.job_waiter = job_waiter
+        self.enable_template = enable_template
+        self.disable_template = disable_template
+        self.deadline = deadline
+
+    def deploy(self, controller_name, template_name):
+        job_name = self.deploy_function(controller_name, template_name)
+        return self.job_waiter.wait_one(job_name, self.deadline)
+
+    def claim_deploy(self, connection, controller_name, now):
+        """
+        This function will mark the controller as deploying, the other workers wait for the deployment
+        :return: the controller row (live, job status), or None if another worker is deploying
+        """
+
+        connection.execute('INSERT OR IGNORE INTO controllers (controller) VALUES (?)', (controller_name,))
+        live, job_status, deploying_until = connection.execute(
+            'SELECT live, job_status, deploying_until FROM controllers WHERE controller = ?',
+            (controller_name,)).fetchone()
+        if deploying_until > now:
+            return None
+        return live, job_status
+
+    def active_count(self, connection, controller_name, now):
+        return connection.execute('SELECT COALESCE(SUM(active), 0) FROM hotspots WHERE controller = ? AND '
+                                  'expires > ?', (controller_name, now)).fetchone()[0]
+
+    def add_hotspot(self, connection, controller_name, expires):
+        connection.execute('INSERT INTO hotspots (controller, worker_id, active, expires) VALUES (?, ?, 1, ?) '
+                           'ON CONFLICT (controller, worker_id) DO UPDATE SET active = active + 1, '
+                           'expires = MAX(expires, excluded.expires)', (controller_name, self.worker_id, expires))
+
+    def claim_enable(self, controller_name):
+        """
+        This function will add one active HotSpot of this worker if the WLAN is live, or claim the enable deployment
+        :param controller_name: the controller name
+        :return: (True, job status) if the WLAN is live, (False, None) if claimed, None if another worker deploys
+        """
+
+        now = time.time()
+        with self.store.transaction() as connection:
+            row = self.claim_deploy(connection, controller_name, now)
+            if row is None:
+                return None
+            live, job_status = row
+            if live and job_status in SUCCESS_RESULTS:
+                self.add_hotspot(connection, controller_name, now + self.store.lease_ttl)
+                print('WLAN already live on controller ', controller_name, ', deploy skipped')
+                return True, job_status
+            connection.execute('UPDATE controllers SET deploying_until = ? WHERE controller = ?',
+                               (now + self.deadline + self.store.lease_ttl, controller_name))
+            return False, None
+
+    def finish_enable(self, controller_name, job_status):
+        """
+        This function will save the WLAN state after the enable deployment, and add the HotSpot if successful
+        :param controller_name: the controller name
+        :param job_status: the job status, None if the deployTemplate call failed
+        :return: True if the WLAN is live, or possibly live
+        """
+
+        live = is_live_after(job_status, True)     # possibly live, disabled when no HotSpot is active
+        with self.store.transaction() as connection:
+            connection.execute('UPDATE controllers SET live = ?, job_status = ?, deploying_until = 0 '
+                               'WHERE controller = ?', (int(live), job_status, controller_name))
+            if job_status in SUCCESS_RESULTS:
+                self.add_hotspot(connection, controller_name, time.time() + self.store.lease_ttl)
+        return live
+
+    def acquire(self, controller_name):
+        """
+        This function will add one active HotSpot of this worker on the controller, the WLAN template is
+        deployed if the WLAN is not live, only one worker deploys at a time to a controller
+        :param controller_name: the controller name
+        :return: the job status of the deployment that made the WLAN live
+        """
+
+        claim = self.claim_enable(controller_name)
+        while claim is None:
+            time.sleep(DEPLOY_WAIT)
+            claim = self.claim_enable(controller_name)
+        if claim[0]:
+            return claim[1]
+        job_status = None
+        try:
+            job_status = self.deploy(controller_name, self.enable_template)
+        finally:
+            live = self.finish_enable(controller_name, job_status)
+        if live and job_status not in SUCCESS_RESULTS:
+            self.disable_if_idle(controller_name)
+        return job_status
+
+    async def acquire_async(self, controller_name, call):
+        """
+        This function will add one active HotSpot of this worker on the controller, as acquire, the PI job is awaited
+        :param controller_name: the controller name
+        :param call: coroutine function, call(function, *args) runs the blocking function
+        :return: the job status of the deployment that made the WLAN live
+        """
+
+        claim = await call(self.claim_enable, controller_name)
+        while claim is None:
+            await asyncio.sleep(DEPLOY_WAIT)
+            claim = await call(self.claim_enable, controller_name)
+        if claim[0]:
+            return claim[1]
+        job_status = None
+        try:
+            job_name = await call(self.deploy_function, controller_name, self.enable_template)
+            job_status = JOB_TIMEOUT    # deployed, possibly live if the wait is cancelled
+            job_status = await self.job_waiter.wait_one_async(job_name, self.deadline)
+        finally:
+            live = await call(self.finish_enable, controller_name, job_status)
+        if live and job_status not in SUCCESS_RESULTS:
+            await self.disable_if_idle_async(controller_name, call)
+        return job_status
+
+    def release(self, controller_name, count=1):
+        """
+        This function will remove {count} active HotSpots of this worker from the controller, the WLAN disable
+        template is deployed when no HotSpot of any worker is active any more
+        :param controller_name: the controller name
+        :param count: the number of HotSpots ended
+        :return: the job status of the disable deployment, or None if not required
+        """
+
+        with self.store.transaction() as connection:
+            connection.execute('UPDATE hotspots SET active = MAX(active - ?, 0) WHERE controller = ? AND '
+                               'worker_id = ?', (count, controller_name, self.worker_id))
+            connection.execute('DELETE FROM hotspots WHERE active = 0')
+        return self.disable_if_idle(controller_name)
+
+    def claim_disable(self, controller_name):
+        """
+        This function will claim the disable deployment, if the WLAN is live and no HotSpot is active
+        :param controller_name: the controller name
+        :return: True if claimed, the caller deploys the WLAN disable template
+        """
+
+        now = time.time()
+        with self.store.transaction() as connection:
+            row = self.claim_deploy(connection, controller_name, now)
+            if row is None or not row[0] or self.active_count(connection, controller_name, now) > 0:
+                return False
+            connection.execute('UPDATE controllers SET deploying_until = ? WHERE controller = ?',
+                               (now + self.deadline + self.store.lease_ttl, controller_name))
+            return True
+
+    def finish_disable(self, controller_name, job_status):
+        with self.store.transaction() as connection:
+            connection.execute('UPDATE controllers SET live = ?, deploying_until = 0 WHERE controller = ?',
+                               (int(is_live_after(job_status, False)), controller_name))
+
+    def disable_if_idle(self, controller_name):
+        """
+        This function will deploy the WLAN disable template if the WLAN is live and no HotSpot is active,
+        also used for the controllers of the dead workers, when their last HotSpot expires
+        :param controller_name: the controller name
+        :return: the job status of the disable deployment, or None if not required
+        """
+
+        if not self.claim_disable(controller_name):
+            return None
+        job_status = None
+        try:
+            job_status = self.deploy(controller_name, self.disable_template)
+        finally:
+            self.finish_disable(controller_name, job_status)
+        return job_status
+
+    async def disable_if_idle_async(self, controller_name, call):
+        if not await call(self.claim_disable, controller_name):
+            return None
+        job_status = None
+        try:
+            job_name = await call(self.deploy_function, controller_name, self.disable_template)
+            job_status = await self.job_waiter.wait_one_async(job_name, self.deadline)
+        finally:
+            await call(self.finish_disable, controller_name, job_status)
+        return job_status
+
+    def sync_hotspots(self, leases):
+        """
+        This function will save the expiry time of the last HotSpot of this worker on each controller,
+        from the lease scheduler, so the extensions are included. The HotSpots of a dead worker are not renewed,
+        they are removed when they expire.
+        :param leases: list of the active leases of the worker
+        :return: list of the controllers with no active HotSpot and a live WLAN, to be disabled
+        """
+
+        now = time.time()
+        expires = {}
+        for lease in leases:
+            expires[lease.controller] = max(expires.get(lease.controller, 0), lease.expires_at + self.store.lease_ttl)
+        with self.store.transaction() as connection:
+            connection.executemany('UPDATE hotspots SET expires = MAX(expires, ?) WHERE controller = ? AND '
+                                   'worker_id = ?', [(controller_expires, controller, self.worker_id)
+                                                     for controller, controller_expires in expires.items()])
+            connection.execute('DELETE FROM hotspots WHERE expires <= ?', (now,))
+            return [row[0] for row in connection.execute(
+                'SELECT controller FROM controllers WHERE live = 1 AND deploying_until <= ? AND controller NOT IN '
+                '(SELECT controller FROM hotspots WHERE expires > ?)', (now, now))]
+
+    def active_hotspots(self, controller_name):
+        """
+        This function will find the number of active HotSpots of all the workers on the controller
+        :param controller_name: the controller name
+        :return: number of active HotSpots
+        """
+
+        return self.active_count(self.store.connection(), controller_name, time.time())
+
+
+class ShardWorker(object):
+    """
+    One SparkConnect worker, serving its share of the rooms of the {store} with its own provisioning engine
+    """
+
+    def __init__(self, store, worker_id=None, heartbeat_interval=SHARD_HEARTBEAT):
+        self.store = store
+        self.worker_id = worker_id or '%s-%d-%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:6])
+        self.heartbeat_interval = heartbeat_interval
+        self.controllers = SharedControllerStateTracker(store, self.worker_id, SparkConnect.deploy_pi_wlan_template,
+                                                        SparkConnect.PI_JOBS)
+        self.engine = None
+        self.rooms = {}     # room name -> polling task
+
+    async def start_room(self, room_name, room_id, last_message_id):
+        """
+        This function will start polling the room, the room is created on first use
+        :param room_name: the Spark room name
+        :param room_id: the Spark room id saved in the store, or None
+        :param last_message_id: the last message processed by the previous owner, or None
+        :return: none
+        """
+
+        if room_id is None:
+            room_id = await self.engine.call(SparkConnect.find_spark_room_id, room_name)
+            if room_id is None:
+                room_id = await self.engine.call(SparkConnect.create_spark_room, room_name)
+                await self.engine.post(room_id, INSTRUCTIONS)
+                await self.engine.post(room_id, READY)
+            await self.engine.call(self.store.set_room_id, room_name, room_id)
+
+        def checkpoint(message_id):
+            return self.store.checkpoint(room_name, self.worker_id, message_id)
+
+        print('Worker ', self.worker_id, ' serving room ', room_name)
+        try:
+            await self.engine.poll_room(room_id, last_message_id, checkpoint)
+        except SparkRoomNotFoundError:
+            print('Worker ', self.worker_id, ' room ', room_name, ' deleted, found or created again')
+            SparkConnect.ROOM_CACHE.invalidate(room_id)
+            await self.engine.call(self.store.set_room_id, room_name, None)     # on the next heartbeat
+
+    async def heartbeat(self):
+        """
+        This function will renew the worker heartbeat, start polling the rooms taken, stop polling the rooms lost,
+        and save the active HotSpots of the worker
+        :return: none
+        """
+
+        owned = await self.engine.call(self.store.heartbeat, self.worker_id)
+        owned_names = set()
+        for room_name, room_id, last_message_id in owned:
+            owned_names.add(room_name)
+            task = self.rooms.get(room_name)
+            if task is None or task.done():
+                self.rooms[room_name] = asyncio.ensure_future(self.start_room(room_name, room_id, last_message_id))
+        for room_name in list(self.rooms):
+            if room_name not in owned_names:
+                self.rooms.pop(room_name).cancel()
+                print('Worker ', self.worker_id, ' released room ', room_name)
+        idle = await self.engine.call(self.controllers.sync_hotspots, self.engine.leases.active_leases())
+        for controller_name in idle:
+            await self.controllers.disable_if_idle_async(controller_name, self.engine.call)
+
+    async def run(self):
+        """
+        This function will run the worker until it is stopped, the rooms are released on exit
+        :return: none
+        """
+
+        self.engine = ProvisioningEngine(controllers=self.controllers)
+        self.engine.start_services()
+        try:
+            while True:
+                try:
+                    await self.heartbeat()
+                except sqlite3.Error as error:
+                    print('Worker ', self.worker_id, ' heartbeat failed: ', repr(error))
+                await asyncio.sleep(self.heartbeat_interval)
+        finally:
+            for task in self.rooms.values():
+                task.cancel()
+            self.store.release_rooms(self.worker_id)
+
+
+def run_worker(store_path=SHARD_STORE):
+    """
+    This function will run one worker process
+    :param store_path: the path of the SQLite store
+    :return: none
+    """
+
+    worker = ShardWorker(ShardStore(store_path))
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    """
+    This program will serve the site rooms SHARD_ROOMS with SHARD_WORKERS worker processes,
+    or one worker process with the 'worker' argument, to add workers from other nodes
+    """
+
+    store = ShardStore(SHARD_STORE)
+    store.add_rooms(SHARD_ROOMS)
+    if sys.argv[1:] == ['worker']:
+        run_worker(SHARD_STORE)
+        return
+    workers = [Process(target=run_worker, args=(SHARD_STORE,)) for index in range(SHARD_WORKERS)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        print('\nEnd of Application Run!')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,517 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the local stand-in HTTP servers for Spark, CMX, APIC-EM and Prime Infrastructure
+# The stand-ins implement the API endpoints used by SparkConnect and the lab modules, with synthetic data.
+# The latency, the delay between the chunks of the large responses, the payload size (number of clients,
+# controllers and rooms) and the error rate are configurable,
+# so the client functions can be benchmarked offline. use_standins() points SparkConnect to the stand-ins.
+
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+STANDIN_HOST = '127.0.0.1'
+
+SPARK_PREFIX = '/v1'
+EM_PREFIX = '/api/v1'
+
+
+def created_time():
+    """
+    This function will format the current time as the Spark {created} attribute, with milliseconds
+    """
+
+    now = time.time()
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now)) + '.%03dZ' % (now * 1000 % 1000)
+
+
+class StandinData(object):
+    """
+    The synthetic data served by the stand-ins, {num_clients} CMX clients on {num_controllers} controllers,
+    {num_rooms} Spark rooms, and the PI jobs completed {job_duration} seconds after the deployment
+    """
+
+    def __init__(self, num_clients=1000, num_controllers=10, num_rooms=100, job_duration=0.0):
+        self.lock = threading.Lock()
+        self.job_duration = job_duration
+        self.controllers = []
+        for index in range(num_controllers):
+            self.controllers.append({'ip_address': '10.%d.%d.1' % (index // 250, index % 250 + 1),
+                                     'hostname': 'WLC-%03d' % index, 'em_id': str(uuid.uuid4()),
+                                     'pi_id': str(100000 + index)})
+        self.clients = []
+        for index in range(num_clients):
+            controller = self.controllers[index % num_controllers]
+            self.clients.append(self.cmx_client(index, controller))
+        self.clients_by_username = {client['userName']: client for client in self.clients}
+        self.clients_by_mac = {client['macAddress']: client for client in self.clients}
+        self.rooms = [{'id': str(uuid.uuid4()), 'title': 'Site room %d' % index} for index in range(num_rooms)]
+        self.messages = {}      # room id -> list of the messages, the newest first
+        self.memberships = {}   # room id -> list of the memberships
+        self.webhooks = []
+        self.tickets = set()
+        self.jobs = {}          # job name -> [deployment time, job id]
+        self.job_ids = iter(range(500000, 10 ** 9))
+
+    @staticmethod
+    def cmx_client(index, controller):
+        return {'macAddress': '00:2b:01:%02x:%02x:%02x' % (index >> 16 & 255, index >> 8 & 255, index & 255),
+                'userName': 'user%05d@example.com' % index,
+                'ipAddress': ['10.200.%d.%d' % (index >> 8 & 255, index & 255)],
+                'ssId': 'CLIVE', 'band': 'IEEE_802_11_B', 'apMacAddress': '00:2b:01:00:00:%02x' % (index % 256),
+                'detectingControllers': controller['ip_address'],
+                'currentlyTracked': True, 'dot11Status': 'ASSOCIATED',
+                'mapInfo': {'mapHierarchyString': 'DevNetCampus>DevNetBuilding>DevNetZone%d' % (index % 5),
+                            'floorRefId': str(index % 5)},
+                'mapCoordinate': {'x': float(index % 300), 'y': float(index % 200), 'unit': 'FEET'},
+                'statistics': {'currentServerTime': time.strftime('%Y-%m-%dT%H:%M:%S.000+0000', time.gmtime()),
+                               'firstLocatedTime': '2017-02-27T09:10:00.000+0000'}}
+
+    def add_message(self, room_id, text, person_email):
+        message = {'id': str(uuid.uuid4()), 'roomId': room_id, 'roomType': 'group', 'text': text,
+                   'personEmail': person_email, 'created': created_time()}
+        with self.lock:
+            self.messages.setdefault(room_id, []).insert(0, message)
+        return message
+
+    def job_summary(self, job_name):
+        deployed_at, job_id = self.jobs[job_name]
+        if time.time() - deployed_at >= self.job_duration:
+            return {'@id': job_id, 'jobName': job_name, 'jobStatus': 'COMPLETED', 'runStatus': 'COMPLETED',
+                    'resultStatus': 'SUCCESS'}
+        return {'@id': job_id, 'jobName': job_name, 'jobStatus': 'RUNNING', 'runStatus': 'RUNNING',
+                'resultStatus': None}
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """
+    HTTP request handler of the stand-ins, the request is routed by the backend of the server
+    """
+
+    protocol_version = 'HTTP/1.1'   # keep-alive, as the real backends
+    disable_nagle_algorithm = True  # the headers and the body are written separately, no delayed ACK wait
+
+    def do_GET(self):
+        self.server.handle_call(self, 'GET')
+
+    def do_POST(self):
+        self.server.handle_call(self, 'POST')
+
+    def do_PUT(self):
+        self.server.handle_call(self, 'PUT')
+
+    def do_DELETE(self):
+        self.server.handle_call(self, 'DELETE')
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.body = self.rfile.read(length) if length else b''    # always read, the connection is reused
+
+    def read_json(self):
+        return json.loads(self.body.decode('utf-8')) if self.body else {}
+
+    def send_json(self, status, body, headers=None):
+        if status == 204:
+            self.send_response(204)
+            self.end_headers()
+            return
+        data = json.dumps(body).encode('utf-8')
+        if status == 200 and self.command == 'GET':
+            etag = '"' + hashlib.md5(data).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)     # conditional request, the response did not change
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            headers = dict(headers or {}, ETag=etag)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json_list(self, items, batch_size=500):
+        """
+        This function will send the JSON list of the {items} with the chunked transfer encoding,
+        {batch_size} items in each chunk, as the large backend responses are received
+        :param items: the list of the items
+        :param batch_size: the number of items encoded in one chunk
+        :return: none
+        """
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for first in range(0, max(len(items), 1), batch_size):
+            text = json.dumps(items[first:first + batch_size])[1:-1]
+            text = ('[' if first == 0 else ',') + text + (']' if first + batch_size >= len(items) else '')
+            data = text.encode('utf-8')
+            if first and self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)     # a slow response body
+            self.wfile.write(('%x\r\n' % len(data)).encode('ascii') + data + b'\r\n')
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandinServer(ThreadingHTTPServer):
+    """
+    Local stand-in for one backend, 'Spark', 'CMX', 'APIC-EM' or 'PI', serving the shared {data}
+    Every request is delayed by {latency} seconds, plus a random {jitter}, and fails with {error_status}
+    with the probability {error_rate}, the chunks of the large responses are sent {chunk_delay} seconds apart
+    """
+
+    daemon_threads = True
+    request_queue_size = 256    # listen backlog, the clients open more connections than the pool size under load
+
+    def __init__(self, backend, data, port=0, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503,
+                 chunk_delay=0.0):
+        ThreadingHTTPServer.__init__(self, (STANDIN_HOST, port), StandinHandler)
+        self.backend = backend
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.chunk_delay = chunk_delay
+        self.lock = threading.Lock()
+        self.calls = {}     # (method, route) -> number of requests
+        self.thread = None
+        self.routes = {'Spark': self.spark_call, 'CMX': self.cmx_call, 'APIC-EM': self.em_call,
+                       'PI': self.pi_call}[backend]
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % (STANDIN_HOST, self.server_address[1])
+
+    def handle_call(self, handler, method):
+        handler.read_body()
+        parts = urlsplit(handler.path)
+        query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+        route = re.sub(r'/[0-9a-f]{8}-[0-9a-f-]{27,}|/\d+(\.\d+){0,3}', '/{id}', parts.path)
+        with self.lock:
+            self.calls[(method, route)] = self.calls.get((method, route), 0) + 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            handler.send_json(self.error_status, {'message': 'Injected error'})
+            return
+        try:
+            self.routes(handler, method, parts.path, query)
+        except (KeyError, ValueError) as error:
+            handler.send_json(400, {'message': repr(error)})
+
+    def call_counts(self):
+        """
+        This function will find the number of requests served for each endpoint
+        :return: dict of (method, route) to the number of requests
+        """
+
+        with self.lock:
+            return dict(self.calls)
+
+    def reset_counts(self):
+        with self.lock:
+            self.calls = {}
+
+    # Spark - /people/me, /rooms, /messages, /memberships, /webhooks
+
+    def spark_call(self, handler, method, path, query):
+        data = self.data
+        if not handler.headers.get('Authorization', '').startswith('Bearer '):
+            handler.send_json(401, {'message': 'The request requires a valid access token'})
+            return
+        path = path[len(SPARK_PREFIX):]
+        if path == '/rooms' and method == 'GET':
+            max_items = int(query.get('max', 100))
+            start = int(query.get('cursor', 0))
+            with data.lock:
+                items = data.rooms[start:start + max_items]
+                more = start + max_items < len(data.rooms)
+            headers = {}
+            if more:
+                next_url = '%s%s/rooms?max=%d&cursor=%d' % (self.url, SPARK_PREFIX, max_items, start + max_items)
+                headers['Link'] = '<' + next_url + '>; rel="next"'
+            handler.send_json(200, {'items': items}, headers)
+        elif path == '/rooms' and method == 'POST':
+            room = {'id': str(uuid.uuid4()), 'title': handler.read_json()['title']}
+            with data.lock:
+                data.rooms.append(room)
+            handler.send_json(200, room)
+        elif path == '/people/me' and method == 'GET':
+            handler.send_json(200, {'id': 'standin-bot', 'emails': ['sparkconnect@sparkbot.io'],
+                                    'displayName': 'SparkConnect', 'type': 'bot'})
+        elif path.startswith('/rooms/') and method == 'DELETE':
+            room_id = path[len('/rooms/'):]
+            with data.lock:
+                data.rooms = [room for room in data.rooms if room['id'] != room_id]
+                data.messages.pop(room_id, None)
+            handler.send_json(204, {})
+        elif path == '/messages' and method == 'GET':
+            room_id = query['roomId']
+            max_items = int(query.get('max', 50))
+            with data.lock:
+                if not any(room['id'] == room_id for room in data.rooms):
+                    handler.send_json(404, {'message': 'Room not found'})
+                    return
+                messages = data.messages.get(room_id, [])
+                start = 0
+                if 'beforeMessage' in query:
+                    ids = [message['id'] for message in messages]
+                    start = ids.index(query['beforeMessage']) + 1 if query['beforeMessage'] in ids else len(ids)
+                items = messages[start:start + max_items]
+                more = start + max_items < len(messages)
+            headers = {}
+            if more:
+                next_url = '%s%s/messages?roomId=%s&max=%d&beforeMessage=%s' % (self.url, SPARK_PREFIX, room_id,
+                                                                                max_items, items[-1]['id'])
+                headers['Link'] = '<' + next_url + '>; rel="next"'
+            handler.send_json(200, {'items': items}, headers)
+        elif path.startswith('/messages/') and method == 'GET':
+            message_id = path[len('/messages/'):]
+            with data.lock:
+                for messages in data.messages.values():
+                    for message in messages:
+                        if message['id'] == message_id:
+                            handler.send_json(200, message)
+                            return
+            handler.send_json(404, {'message': 'Message not found'})
+        elif path == '/messages' and method == 'POST':
+            payload = handler.read_json()
+            with data.lock:
+                found = any(room['id'] == payload['roomId'] for room in data.rooms)
+            if not found:
+                handler.send_json(404, {'message': 'Room not found'})
+                return
+            message = data.add_message(payload['roomId'], payload.get('text') or payload.get('markdown'),
+                                       'sparkconnect@sparkbot.io')
+            handler.send_json(200, message)
+        elif path == '/memberships' and method == 'POST':
+            membership = dict(handler.read_json(), id=str(uuid.uuid4()))
+            with data.lock:
+                data.memberships.setdefault(membership['roomId'], []).append(membership)
+            handler.send_json(200, membership)
+        elif path == '/memberships' and method == 'GET':
+            room_id = query['roomId']
+            max_items = int(query.get('max', 100))
+            start = int(query.get('cursor', 0))
+            with data.lock:
+                memberships = data.memberships.get(room_id, [])
+                items = memberships[start:start + max_items]
+                more = start + max_items < len(memberships)
+            headers = {}
+            if more:
+                next_url = '%s%s/memberships?roomId=%s&max=%d&cursor=%d' % (self.url, SPARK_PREFIX, room_id,
+                                                                            max_items, start + max_items)
+                headers['Link'] = '<' + next_url + '>; rel="next"'
+            handler.send_json(200, {'items': items}, headers)
+        elif path == '/webhooks' and method == 'POST':
+            webhook = dict(handler.read_json(), id=str(uuid.uuid4()))
+            webhook.pop('secret', None)
+            with data.lock:
+                data.webhooks.append(webhook)
+            handler.send_json(200, webhook)
+        elif path == '/webhooks' and method == 'GET':
+            with data.lock:
+                handler.send_json(200, {'items': list(data.webhooks)})
+        elif path.startswith('/webhooks/') and method == 'DELETE':
+            webhook_id = path[len('/webhooks/'):]
+            with data.lock:
+                data.webhooks = [webhook for webhook in data.webhooks if webhook['id'] != webhook_id]
+            handler.send_json(204, {})
+        else:
+            handler.send_json(404, {'message': 'Not found'})
+
+    # CMX - /api/location/v2/clients
+
+    def cmx_call(self, handler, method, path, query):
+        data = self.data
+        if not handler.headers.get('Authorization', '').startswith('Basic '):
+            handler.send_json(401, {'message': 'Unauthorized'})
+            return
+        if path == '/api/location/v2/clients/count':
+            handler.send_json(200, {'count': len(data.clients)})
+        elif path == '/api/location/v2/clients/active':
+            handler.send_json_list(data.clients)
+        elif path == '/api/location/v2/clients/':
+            if 'username' in query:
+                client = data.clients_by_username.get(query['username'])
+            else:
+                client = data.clients_by_mac.get(query.get('macAddress', '').lower())
+            handler.send_json(200, [client] if client else [])
+        else:
+            handler.send_json(404, {'message': 'Not found'})
+
+    # APIC-EM - /ticket, /network-device
+
+    def em_call(self, handler, method, path, query):
+        data = self.data
+        path = path[len(EM_PREFIX):]
+        if path == '/ticket' and method == 'POST':
+            ticket = 'ST-' + uuid.uuid4().hex
+            with data.lock:
+                data.tickets.add(ticket)
+            handler.send_json(200, {'response': {'serviceTicket': ticket, 'idleTimeout': 1800,
+                                                 'sessionTimeout': 21600}, 'version': '1.0'})
+            return
+        if handler.headers.get('X-Auth-Token') not in data.tickets:
+            handler.send_json(401, {'response': {'errorCode': 'RBAC', 'message': 'Invalid ticket'}})
+            return
+        if path == '/network-device/count':
+            handler.send_json(200, {'response': len(data.controllers), 'version': '1.0'})
+        elif path.startswith('/network-device/ip-address/'):
+            ip_address = path[len('/network-device/ip-address/'):]
+            for controller in data.controllers:
+                if controller['ip_address'] == ip_address:
+                    handler.send_json(200, {'response': {'hostname': controller['hostname'],
+                                                         'managementIpAddress': ip_address,
+                                                         'id': controller['em_id'], 'family': 'Wireless Controller'},
+                                            'version': '1.0'})
+                    return
+            handler.send_json(404, {'response': {'errorCode': 'Not found', 'message': 'Device not found'}})
+        elif re.match(r'^/network-device/\d+/\d+$', path):
+            start_index, count = [int(value) for value in path.split('/')[2:]]
+            page = data.controllers[start_index - 1:start_index - 1 + count]
+            handler.send_json(200, {'response': [{'hostname': controller['hostname'],
+                                                  'managementIpAddress': controller['ip_address'],
+                                                  'id': controller['em_id']} for controller in page],
+                                    'version': '1.0'})
+        else:
+            handler.send_json(404, {'response': {'message': 'Not found'}})
+
+    # Prime Infrastructure - /data/Devices, /op/wlanProvisioning/deployTemplate, /data/JobSummary
+
+    def pi_call(self, handler, method, path, query):
+        data = self.data
+        if not handler.headers.get('Authorization', '').startswith('Basic '):
+            handler.send_json(401, {'message': 'Unauthorized'})
+            return
+        if path == '/webacs/api/v1/data/Devices':
+            if 'deviceName' in query:
+                devices = [controller for controller in data.controllers
+                           if controller['hostname'] == query['deviceName']]
+                handler.send_json(200, {'queryResponse': {
+                    '@count': len(devices),
+                    'entityId': [{'$': controller['pi_id'], '@url': self.url + path + '/' + controller['pi_id']}
+                                 for controller in devices]}})
+                return
+            first = int(query.get('.firstResult', 0))
+            max_results = int(query.get('.maxResults', 100))
+            page = data.controllers[first:first + max_results]
+            handler.send_json(200, {'queryResponse': {
+                '@count': len(data.controllers), '@first': first, '@last': first + len(page) - 1,
+                'entity': [{'devicesDTO': {'@id': controller['pi_id'], 'deviceName': controller['hostname'],
+                                           'ipAddress': controller['ip_address']}} for controller in page]}})
+        elif path == '/webacs/api/v1/op/wlanProvisioning/deployTemplate' and method == 'PUT':
+            payload = handler.read_json()['deployWlanTemplateDTO']
+            with data.lock:
+                job_name = 'WlanTemplateDeployment_%s_%s' % (payload['controllerName'], uuid.uuid4().hex[:12])
+                data.jobs[job_name] = [time.time(), next(data.job_ids)]
+            handler.send_json(200, {'mgmtResponse': {'jobInformation': {'jobName': job_name}}})
+        elif path == '/webacs/api/v1/data/JobSummary':
+            names = re.findall(r'"([^"]+)"', query.get('jobName', ''))
+            if not names and query.get('jobName'):
+                names = [query['jobName']]
+            with data.lock:
+                entities = [{'jobSummaryDTO': data.job_summary(name)} for name in names if name in data.jobs]
+            handler.send_json(200, {'queryResponse': {'@count': len(entities), 'entity': entities}})
+        else:
+            handler.send_json(404, {'message': 'Not found'})
+
+    def start(self):
+        """
+        This function will start serving the requests on a background thread
+        :return: the server
+        """
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.serve_forever, name='standin-' + self.backend, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        This function will stop the server
+        :return: none
+        """
+
+        if self.thread is not None:
+            self.shutdown()
+            self.server_close()
+            self.thread = None
+
+
+def start_standins(data=None, latency=0.0, jitter=0.0, error_rate=0.0, **backend_options):
+    """
+    This function will start the stand-in servers for Spark, CMX, APIC-EM and PI, sharing the same {data}
+    :param data: the StandinData, a default data set is created if None
+    :param latency: the latency of every request, in seconds
+    :param jitter: the maximum random latency added to every request, in seconds
+    :param error_rate: the probability of an injected error response
+    :param backend_options: per-backend options overriding the defaults, for example PI={'latency': 2.0}
+    :return: dict of the backend name to the StandinServer
+    """
+
+    data = data or StandinData()
+    servers = {}
+    for backend in ('Spark', 'CMX', 'APIC-EM', 'PI'):
+        options = {'latency': latency, 'jitter': jitter, 'error_rate': error_rate}
+        options.update(backend_options.get(backend.replace('-', '_'), {}))
+        servers[backend] = StandinServer(backend, data, **options).start()
+    return servers
+
+
+def stop_standins(servers):
+    for server in servers.values():
+        server.stop()
+
+
+def use_standins(servers, room_cache_file=None):
+    """
+    This function will point the SparkConnect API functions, and the shared indexes, to the stand-in {servers}
+    Call before the ProvisioningEngine is created, the engine outbox is created with the Spark URL
+    :param servers: dict of the backend name to the StandinServer, returned by start_standins()
+    :param room_cache_file: the room cache file, a new in-memory cache is used if None
+    :return: none
+    """
+
+    import SparkConnect
+    from SparkConnect_rooms import SparkRoomCache
+
+    spark_url = servers['Spark'].url + SPARK_PREFIX
+    cmx_url = servers['CMX'].url + '/'
+    em_url = servers['APIC-EM'].url + EM_PREFIX
+    pi_url = servers['PI'].url
+    SparkConnect.SPARK_URL = spark_url
+    SparkConnect.CMX_URL = cmx_url
+    SparkConnect.EM_URL = em_url
+    SparkConnect.PI_URL = pi_url
+    SparkConnect.EM_TICKETS.em_url = em_url
+    SparkConnect.EM_TICKETS.ticket = None
+    SparkConnect.INVENTORY.em_url = em_url
+    SparkConnect.INVENTORY.pi_url = pi_url
+    SparkConnect.CMX_INDEX.cmx_url = cmx_url
+    SparkConnect.PI_JOBS.pi_url = pi_url
+    if room_cache_file is None:
+        SparkConnect.ROOM_CACHE.rooms = {}
+        SparkConnect.ROOM_CACHE.save = lambda: None     # the stand-in room ids are not saved
+    else:
+        SparkConnect.ROOM_CACHE = SparkRoomCache(room_cache_file)
+    SparkConnect.SPARK_SESSION.headers['authorization'] = 'Bearer standin-token'
@@ -0,0 +1,180 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the streaming JSON parser for the large CMX and PI responses
+# The items of one JSON array in the response body, the top level array of the CMX clients, or the
+# queryResponse.entity array of PI, are parsed incrementally while the body is downloaded, and yielded one at a time.
+# Only one item and one download chunk are in memory, and the first item is available before the body is complete.
+
+
+import codecs
+import json
+
+STREAM_CHUNK_SIZE = 65536       # bytes read from the response body at a time
+JSON_WHITESPACE = ' \t\n\r'
+JSON_NUMBER = '0123456789.eE+-'
+
+
+class JsonStreamError(ValueError):
+    """
+    Raised when the streamed response body is not the expected JSON document
+    """
+
+
+class JsonItemStream(object):
+    """
+    Incremental parser of the items of the JSON array found at the key {path} of the document, read from the text
+    {chunks}. The scalar values found before the array, in the objects along the {path}, are saved in {attributes},
+    for example the PI @count, @first and @last.
+    """
+
+    def __init__(self, chunks, path=(), attributes=None):
+        self.chunks = iter(chunks)
+        self.path = tuple(path)
+        self.attributes = {} if attributes is None else attributes
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        This function will read the next chunk, the parsed text is dropped from the buffer
+        :return: False if the document is complete
+        """
+
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        This function will skip the whitespace and find the next character
+        :return: the next character, None at the end of the document
+        """
+
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return None
+
+    def expect(self, characters):
+        character = self.peek()
+        if character is None or character not in characters:
+            raise JsonStreamError('Expected one of ' + characters + ', found ' + repr(character))
+        self.pos += 1
+        return character
+
+    def value(self):
+        """
+        This function will parse the next JSON value, more chunks are read until the value is complete
+        :return: the value
+        """
+
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self.fill():
+                    raise JsonStreamError('Incomplete JSON document')
+                continue
+            if (isinstance(value, (int, float)) and (end == len(self.buffer) or self.buffer[end] in JSON_NUMBER) and
+                    self.fill()):
+                continue    # the number may continue in the next chunk
+            self.pos = end
+            return value
+
+    def find_array(self):
+        """
+        This function will find the start of the array at the key {path}
+        :return: False if a key of the path is not found
+        """
+
+        for key in self.path:
+            self.expect('{')
+            if self.peek() == '}':
+                return False
+            while True:
+                name = self.value()
+                self.expect(':')
+                if name == key:
+                    break
+                value = self.value()
+                if not isinstance(value, (dict, list)):
+                    self.attributes[name] = value
+                if self.expect(',}') == '}':
+                    return False
+        if self.peek() == 'n':
+            self.value()    # null instead of an empty array
+            return False
+        self.expect('[')
+        return True
+
+    def __iter__(self):
+        if not self.find_array():
+            return
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_response_items(response, path=(), attributes=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    This function will yield the items of the JSON array at the key {path} of the {response} body, one at a time
+    The response must be requested with stream=True, it is closed when the generator is closed or exhausted
+    :param response: the requests response
+    :param path: the keys of the array in the document, () for a top level array
+    :param attributes: optional dict, filled with the scalar values found before the array along the path
+    :param chunk_size: the number of bytes read at a time
+    :return: generator of the array items
+    """
+
+    text_decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+
+    def chunks():
+        for chunk in response.iter_content(chunk_size):
+            yield text_decoder.decode(chunk)
+        yield text_decoder.decode(b'', final=True)
+
+    try:
+        for item in JsonItemStream(chunks(), path, attributes):
+            yield item
+    finally:
+        response.close()
+
+
+def stream_json_items(session, url, path=(), attributes=None, **kwargs):
+    """
+    This function will request the {url}, and yield the items of the JSON array at the key {path} of the response,
+    while the response body is downloaded
+    :param session: the requests session
+    :param url: the API URL
+    :param path: the keys of the array in the document, () for a top level array
+    :param attributes: optional dict, filled with the scalar values found before the array along the path
+    :param kwargs: the request arguments, for example headers and params
+    :return: generator of the array items
+    """
+
+    response = session.get(url, stream=True, **kwargs)
+    try:
+        response.raise_for_status()
+    except Exception:
+        response.close()
+        raise
+    return iter_response_items(response, path, attributes)
@@ -0,0 +1,148 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the APIC-EM service ticket manager
+# The ticket is created once and shared by all the callers, it is refreshed in the background before it expires.
+# The API calls made through the manager are retried once with a new ticket if APIC-EM returns 401.
+
+
+import json
+import threading
+import time
+
+from SparkConnect_http import set_session_ticket
+
+TICKET_LIFETIME = 1800          # seconds, used if APIC-EM does not return the ticket timeouts
+TICKET_REFRESH_MARGIN = 120     # seconds, the ticket is refreshed this long before it expires
+
+
+class ServiceTicketManager(object):
+    """
+    APIC-EM service ticket manager, for the controller at {em_url}
+    The ticket is set as the X-Auth-Token header of the APIC-EM {session}
+    """
+
+    def __init__(self, em_url, username, password, session, refresh_margin=TICKET_REFRESH_MARGIN):
+        self.em_url = em_url
+        self.username = username
+        self.password = password
+        self.session = session
+        self.refresh_margin = refresh_margin
+        self.lock = threading.Lock()
+        self.ticket = None
+        self.session_expires = 0
+        self.idle_timeout = TICKET_LIFETIME
+        self.last_used = 0
+        self.timer = None
+
+    def create_ticket(self):
+        """
+        This function will generate the Auth ticket required to access APIC-EM
+        API call to /ticket is used to create a new user ticket
+        :return: APIC-EM ticket
+        """
+
+        payload = {'username': self.username, 'password': self.password}
+        url = self.em_url + '/ticket'
+        header = {'content-type': 'application/json'}
+        ticket_response = self.session.post(url, data=json.dumps(payload), headers=header)
+        ticket_response.raise_for_status()
+        ticket_json = ticket_response.json()['response']
+        now = time.time()
+        self.ticket = ticket_json['serviceTicket']
+        self.idle_timeout = ticket_json.get('idleTimeout', TICKET_LIFETIME)
+        self.session_expires = now + ticket_json.get('sessionTimeout', TICKET_LIFETIME)
+        self.last_used = now
+        set_session_ticket(self.session, self.ticket)
+        print('APIC-EM ticket: ', self.ticket)
+        self.schedule_refresh()
+        return self.ticket
+
+    def schedule_refresh(self):
+        """
+        This function will schedule the background refresh of the ticket, before the session timeout
+        :return: none
+        """
+
+        if self.timer is not None:
+            self.timer.cancel()
+        delay = max(self.session_expires - time.time() - self.refresh_margin, 1)
+        self.timer = threading.Timer(delay, self.background_refresh)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def background_refresh(self):
+        with self.lock:
+            try:
+                self.create_ticket()
+            except Exception as error:
+                print('APIC-EM ticket refresh failed: ', repr(error))
+                self.ticket = None
+
+    def is_valid(self):
+        """
+        This function will check if the ticket will be valid for at least the refresh margin
+        Both the APIC-EM session timeout and the idle timeout are checked
+        :return: True if the ticket is valid
+        """
+
+        now = time.time()
+        return (self.ticket is not None and
+                now < self.session_expires - self.refresh_margin and
+                now < self.last_used + self.idle_timeout - self.refresh_margin)
+
+    def get_ticket(self):
+        """
+        This function will return the cached ticket, or create a new one
+        Only one caller creates the new ticket, the concurrent callers wait and share it
+        :return: APIC-EM ticket
+        """
+
+        with self.lock:
+            if not self.is_valid():
+                self.create_ticket()
+            self.last_used = time.time()
+            return self.ticket
+
+    def refresh(self, expired_ticket):
+        """
+        This function will replace the {expired_ticket}, if it was not already replaced by another caller
+        :param expired_ticket: the ticket rejected by APIC-EM
+        :return: APIC-EM ticket
+        """
+
+        with self.lock:
+            if self.ticket is None or self.ticket == expired_ticket:
+                self.create_ticket()
+            self.last_used = time.time()
+            return self.ticket
+
+    def request(self, method, url, ticket=None, **kwargs):
+        """
+        This function will make an APIC-EM API call authenticated with the ticket, retried once on 401
+        :param method: the HTTP method
+        :param url: the API URL
+        :param ticket: the APIC-EM ticket to use, the cached ticket if None
+        :param kwargs: the requests arguments
+        :return: the API call response
+        """
+
+        ticket = ticket or self.get_ticket()
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers['X-Auth-Token'] = ticket
+        response = self.session.request(method, url, headers=headers, **kwargs)
+        if response.status_code == 401:
+            headers['X-Auth-Token'] = self.refresh(ticket)
+            response = self.session.request(method, url, headers=headers, **kwargs)
+        return response
+
+    def close(self):
+        """
+        This function will stop the background refresh
+        :return: none
+        """
+
+        if self.timer is not None:
+            self.timer.cancel()
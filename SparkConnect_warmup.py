@@ -0,0 +1,106 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the startup pre-warming of the backend connections
+# The Spark, CMX, APIC-EM and PI host names are resolved, and the keep-alive connections opened and authenticated,
+# for all the backends in parallel, before the first user request. Every backend credential is validated with
+# a light API call, and the startup report shows the readiness, the DNS time and the handshake time per backend.
+# The warm connections stay in the session pools, so the first user request does not pay the DNS lookup,
+# the TCP connect and the TLS handshake.
+
+
+import socket
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+WARMUP_CONNECTIONS = 2      # keep-alive connections opened for each backend
+NO_CACHE = {'Cache-Control': 'no-cache'}   # the validation calls reach the backend, not the local HTTP cache
+
+
+class BackendCheck(object):
+    """
+    The startup check of one backend, {validate}() makes an authenticated API call through the backend session,
+    with the NO_CACHE headers, and returns the response
+    """
+
+    def __init__(self, name, url, validate, connections=WARMUP_CONNECTIONS):
+        self.name = name
+        self.url = url
+        self.validate = validate
+        self.connections = connections
+
+
+def resolve_host(url):
+    """
+    This function will resolve the host name of the {url}
+    :param url: the backend URL
+    :return: the DNS resolution time in milliseconds, and the list of the IP addresses
+    """
+
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    start = time.perf_counter()
+    addresses = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+    return (time.perf_counter() - start) * 1000, sorted(set(address[4][0] for address in addresses))
+
+
+def timed_validate(check):
+    start = time.perf_counter()
+    response = check.validate()
+    elapsed = (time.perf_counter() - start) * 1000
+    if response is not None:
+        response.raise_for_status()
+    return elapsed
+
+
+def warm_up_backend(check, executor):
+    """
+    This function will resolve the backend host, open and authenticate the keep-alive connections,
+    and measure the handshake time, the first call time less the call time on a warm connection
+    :param check: the BackendCheck
+    :param executor: the executor used to open the extra connections in parallel
+    :return: dict with the readiness report of the backend
+    """
+
+    report = {'backend': check.name, 'ready': False, 'addresses': [], 'dns_ms': None, 'cold_ms': None,
+              'warm_ms': None, 'handshake_ms': None, 'error': None}
+    try:
+        report['dns_ms'], report['addresses'] = resolve_host(check.url)
+        report['cold_ms'] = timed_validate(check)
+        report['warm_ms'] = timed_validate(check)
+        report['handshake_ms'] = max(report['cold_ms'] - report['warm_ms'], 0.0)
+        if check.connections > 1:   # concurrent calls, each one opens a pooled connection
+            extra = [executor.submit(check.validate) for index in range(check.connections)]
+            for future in extra:
+                future.result()
+        report['ready'] = True
+    except Exception as error:
+        report['error'] = repr(error)
+    return report
+
+
+def warm_up(checks):
+    """
+    This function will warm up all the backends in parallel, and print the startup report
+    :param checks: list of the BackendCheck
+    :return: dict of the backend name to the readiness report
+    """
+
+    start = time.perf_counter()
+    workers = len(checks) + sum(check.connections for check in checks)
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [executor.submit(warm_up_backend, check, executor) for check in checks]
+        reports = {check.name: future.result() for check, future in zip(checks, futures)}
+    elapsed = time.perf_counter() - start
+    print('\nBackend readiness, warm up in %.2f seconds:' % elapsed)
+    for report in reports.values():
+        if report['ready']:
+            print('  %-8s ready      DNS %7.1f ms, handshake %7.1f ms, first call %7.1f ms, warm call %7.1f ms' % (
+                report['backend'], report['dns_ms'], report['handshake_ms'], report['cold_ms'], report['warm_ms']))
+        else:
+            print('  %-8s NOT READY  %s' % (report['backend'], report['error']))
+    return reports
@@ -0,0 +1,160 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the local HTTP webhook receiver for the Spark message-created events
+# The notifications are passed straight to the command handler, instead of polling the room every 5 seconds.
+# Every message is dispatched once, even if Spark delivers the notification more than once. The message text is
+# read from Spark, the text included in the notification is used only if the notification signature is verified.
+# post_webhook_event() is a local stand-in for Spark, it will POST a webhook payload to the receiver.
+
+
+import hashlib
+import hmac
+import json
+import threading
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import SparkConnect
+
+SEEN_NOTIFICATIONS = 1000       # number of message ids remembered, to drop the duplicate notifications
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """
+    HTTP request handler for the Spark webhook notifications
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        secret = self.server.secret
+        verified = False
+        if secret:
+            signature = hmac.new(secret.encode('utf-8'), body, hashlib.sha1).hexdigest()
+            if not hmac.compare_digest(signature, self.headers.get('X-Spark-Signature', '')):
+                self.send_response(403)
+                self.end_headers()
+                return
+            verified = True
+        try:
+            event_json = json.loads(body.decode('utf-8'))
+        except ValueError:
+            self.send_response(400)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.end_headers()
+        if event_json.get('resource') == 'messages' and event_json.get('event') == 'created':
+            self.server.receive(event_json['data'], verified)
+
+    def log_message(self, format, *args):
+        pass    # no access log for every notification
+
+
+class WebhookReceiver(ThreadingHTTPServer):
+    """
+    Local HTTP server receiving the Spark webhook notifications, every new message is passed to {callback}
+    The text included in the unsigned notifications is trusted only if {trust_inline}, for the local stand-in
+    """
+
+    daemon_threads = True
+
+    def __init__(self, callback, port, host='', secret=None, trust_inline=False):
+        ThreadingHTTPServer.__init__(self, (host, port), WebhookHandler)
+        self.callback = callback
+        self.secret = secret
+        self.trust_inline = trust_inline
+        self.webhook_id = None      # the Spark webhook delivering the notifications
+        self.thread = None
+        self.lock = threading.Lock()
+        self.seen_ids = set()
+        self.seen_order = deque()
+
+    def remember(self, message_id):
+        """
+        This function will add the {message_id} to the dispatched messages, the oldest ids are forgotten
+        :param message_id: the Spark message id
+        :return: False if the message was already dispatched
+        """
+
+        with self.lock:
+            if message_id in self.seen_ids:
+                return False
+            self.seen_ids.add(message_id)
+            self.seen_order.append(message_id)
+            if len(self.seen_order) > SEEN_NOTIFICATIONS:
+                self.seen_ids.discard(self.seen_order.popleft())
+            return True
+
+    def is_seen(self, message_id):
+        with self.lock:
+            return message_id in self.seen_ids
+
+    def receive(self, message_data, verified=False):
+        """
+        This function will find the text of the new message and call the command handler, once for each message
+        The Spark notification includes only the message id, the text is read from Spark, the text included by
+        the local stand-in is used only if the notification signature was verified, or {trust_inline}
+        :param message_data: the {data} of the webhook notification
+        :param verified: True if the notification signature was verified with the webhook secret
+        :return: none
+        """
+
+        if not self.remember(message_data['id']):
+            return      # duplicate notification
+        if 'text' in message_data and (verified or self.trust_inline):
+            text, person_email = message_data['text'], message_data['personEmail']
+        else:
+            try:
+                text, person_email = SparkConnect.get_spark_message(message_data['id'])
+            except Exception:
+                with self.lock:
+                    self.seen_ids.discard(message_data['id'])   # not dispatched, found later by the room check
+                raise
+        self.callback(message_data['roomId'], text, person_email)
+
+    def start(self):
+        """
+        This function will start serving the notifications in a background thread
+        :return: none
+        """
+
+        self.thread = threading.Thread(target=self.serve_forever, name='spark-webhook', daemon=True)
+        self.thread.start()
+        print('Spark webhook receiver listening on port: ', self.server_address[1])
+
+    def stop(self):
+        """
+        This function will stop the receiver
+        :return: none
+        """
+
+        self.shutdown()
+        self.server_close()
+
+
+def post_webhook_event(receiver_url, room_id, text, person_email, message_id='local-message', secret=None):
+    """
+    This function is the local stand-in for Spark, it will POST a message-created webhook payload
+    :param receiver_url: the webhook receiver URL, for example http://127.0.0.1:8080/
+    :param room_id: the Spark room id
+    :param text: the text of the message
+    :param person_email: the author of the message
+    :param message_id: the message id
+    :param secret: the webhook secret used to sign the payload
+    :return: the HTTP status code returned by the receiver
+    """
+
+    payload = {'resource': 'messages', 'event': 'created',
+               'data': {'id': message_id, 'roomId': room_id, 'personEmail': person_email, 'text': text}}
+    body = json.dumps(payload).encode('utf-8')
+    header = {'content-type': 'application/json'}
+    if secret:
+        header['X-Spark-Signature'] = hmac.new(secret.encode('utf-8'), body, hashlib.sha1).hexdigest()
+    response = requests.post(receiver_url, data=body, headers=header)
+    return response.status_code
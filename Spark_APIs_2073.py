@@ -18,9 +18,18 @@ from random import *
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
 from config_data_2073 import SPARK_URL, SPARK_AUTH, ROOM_NAME  # the file includes all config data required for the lab
+from config_data_2073 import SPARK_POOL_SIZE
+
+from SparkConnect_http import create_api_session
+from SparkConnect_metrics import instrument
+from SparkConnect_rooms import SparkRoomCache, SparkRoomNotFoundError, find_room_id_paginated
 
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)  # Disable insecure https warnings
 
+SPARK_SESSION = create_api_session(headers={'authorization': SPARK_AUTH}, pool_maxsize=SPARK_POOL_SIZE)
+
+ROOM_CACHE = SparkRoomCache()    # Spark room title to room id cache
+
 
 def pprint(json_data):
     """
@@ -32,6 +41,7 @@ def pprint(json_data):
     print(json.dumps(json_data, indent=4, separators=(' , ', ' : ')))
 
 
+@instrument('Spark')
 def create_spark_room(room_name):
     """
     This function will create a Spark room with the title {room_name}
@@ -43,35 +53,34 @@ def create_spark_room(room_name):
     payload = {'title': room_name}
     url = SPARK_URL + '/rooms'
     print('\nThe Spark API request URL: ', url)
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    room_response = requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    header = {'content-type': 'application/json'}
+    room_response = SPARK_SESSION.post(url, data=json.dumps(payload), headers=header)
     print('\nThe Spark API request status code: ', room_response.status_code)
     room_json = room_response.json()
     room_number = room_json['id']
+    ROOM_CACHE.store(room_name, room_number)
     return room_number
 
 
+@instrument('Spark')
 def find_spark_room_id(room_name):
     """
     This function will find the Spark room id based on the {room_name}
-    API call to /rooms
+    The room id is returned from the room cache if available, without any API call
+    API call to /rooms, paginated, until the first room with the title {room_name} is found
     :param room_name: the room name for which to find the Spark room id
     :return: room_number: the Spark room id
     """
 
-    payload = {'title': room_name}
-    room_number = None
-    url = SPARK_URL + '/rooms'
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    room_response = requests.get(url, data=json.dumps(payload), headers=header, verify=False)
-    room_list_json = room_response.json()
-    room_list = room_list_json['items']
-    for rooms in room_list:
-        if rooms['title'] == room_name:
-            room_number = rooms['id']
+    room_number = ROOM_CACHE.get(room_name)
+    if room_number is None:
+        room_number = find_room_id_paginated(SPARK_URL, SPARK_SESSION, room_name)
+        if room_number is not None:
+            ROOM_CACHE.store(room_name, room_number)
     return room_number
 
 
+@instrument('Spark')
 def add_spark_room_membership(room_id, email_invite):
     """
     This function will add membership to the Spark room with the {room_id}
@@ -83,11 +92,12 @@ def add_spark_room_membership(room_id, email_invite):
 
     payload = {'roomId': room_id, 'personEmail': email_invite, 'isModerator': 'true'}
     url = SPARK_URL + '/memberships'
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    header = {'content-type': 'application/json'}
+    SPARK_SESSION.post(url, data=json.dumps(payload), headers=header)
     print("Invitation sent to :  ", email_invite)
 
 
+@instrument('Spark')
 def last_spark_room_message(room_id):
     """
     This function will find the last message from the Spark room with the {room_id}
@@ -95,34 +105,46 @@ def last_spark_room_message(room_id):
     :param room_id: the Spark room id
     :return: {last_message} - the text of the last message posted in the room
              {last_person_email} - the author of the last message in the room
+             None for each if the room is empty, SparkRoomNotFoundError is raised if the room was deleted
     """
 
-    url = SPARK_URL + '/messages?roomId=' + room_id
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    response = requests.get(url, headers=header, verify=False)
+    url = SPARK_URL + '/messages?max=1&roomId=' + room_id     # only the last message is required
+    header = {'content-type': 'application/json'}
+    response = SPARK_SESSION.get(url, headers=header)
+    if response.status_code == 404:
+        ROOM_CACHE.invalidate(room_id)  # the room was deleted, the cached room id is not valid
+        raise SparkRoomNotFoundError('Spark room not found: ' + room_id, response=response)
+    response.raise_for_status()
     list_messages_json = response.json()
     list_messages = list_messages_json['items']
+    if not list_messages:
+        return [None, None]
     last_message = list_messages[0]['text']
     last_person_email = list_messages[0]['personEmail']
     return [last_message, last_person_email]
 
 
+@instrument('Spark')
 def post_spark_room_message(room_id, message):
     """
     This function will post the {message} to the Spark room with the {room_id}
     API call to /messages
     :param room_id: the Spark room id
     :param message: the text of the message to be posted in the room
-    :return: none
+    :return: none, SparkRoomNotFoundError is raised if the room was deleted
     """
 
     payload = {'roomId': room_id, 'text': message}
     url = SPARK_URL + '/messages'
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    header = {'content-type': 'application/json'}
+    response = SPARK_SESSION.post(url, data=json.dumps(payload), headers=header)
+    if response.status_code == 404:
+        ROOM_CACHE.invalidate(room_id)  # the room was deleted, the cached room id is not valid
+        raise SparkRoomNotFoundError('Spark room not found: ' + room_id, response=response)
     print("Message posted :  ", message)
 
 
+@instrument('Spark')
 def delete_spark_room(room_id):
     """
     This function will delete the Spark room with the room Id
@@ -132,8 +154,9 @@ def delete_spark_room(room_id):
     """
 
     url = SPARK_URL + '/rooms/' + room_id
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    requests.delete(url, headers=header, verify=False)
+    header = {'content-type': 'application/json'}
+    SPARK_SESSION.delete(url, headers=header)
+    ROOM_CACHE.invalidate(room_id)
     print("Deleted Spark Room :  ", ROOM_NAME)
 
 
@@ -176,8 +199,7 @@ def main():
     print('\nWe will retrieve this message and the name of the user that entered the message')
     time.sleep(timer)
 
-    last_message = last_spark_room_message(devnet_room_id)[0]
-    last_email = last_spark_room_message(devnet_room_id)[1]
+    last_message, last_email = last_spark_room_message(devnet_room_id)
     print('\n\nThe last message : ', last_message, ', was posted by : ', last_email)
 
     print('\nEnd of Application Run')
@@ -24,3 +24,8 @@ CMX_URL = 'https://cmxlocationsandbox.cisco.com/'
 CMX_USER = 'learning'
 CMX_PASSW = 'learning'
 
+# HTTP connection pool sizes, the maximum number of keep-alive connections to each backend
+
+SPARK_POOL_SIZE = 10
+CMX_POOL_SIZE = 10
+APIC_EM_POOL_SIZE = 10
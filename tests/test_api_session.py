@@ -0,0 +1,105 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the shared HTTP client layer, against the local stand-in servers
+# Run from the repository directory:  python -m pytest tests
+
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+import requests
+
+from requests.auth import HTTPBasicAuth
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SparkConnect
+
+import SparkConnect_http
+
+from SparkConnect_http import CircuitBreaker, CircuitOpenError, create_api_session, hedged_call, timeout_tuple
+from SparkConnect_standins import StandinData, start_standins, stop_standins, use_standins
+
+
+class ApiSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = StandinData(num_clients=2000, num_controllers=2, num_rooms=1)
+        self.servers = start_standins(self.data)
+        use_standins(self.servers)
+        self.url = SparkConnect.SPARK_URL + '/people/me'
+        self.headers = {'Authorization': SparkConnect.SPARK_SESSION.headers['Authorization']}
+
+    def tearDown(self):
+        stop_standins(self.servers)
+
+    def test_scalar_timeout(self):
+        self.assertEqual(timeout_tuple(5), (5, 5))
+        self.assertEqual(timeout_tuple((3.05, 30)), (3.05, 30))
+        session = create_api_session(headers=self.headers, timeout=5)
+        self.assertEqual(session.get(self.url, deadline=2).status_code, 200)
+
+    def test_invalid_url_does_not_keep_the_circuit_open(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        session = create_api_session(headers=self.headers, breaker=breaker)
+        with self.assertRaises(requests.exceptions.RequestException):
+            session.get('http://[invalid')
+        self.assertFalse(breaker.trial)
+        self.assertEqual(session.get(self.url).status_code, 200)
+        self.assertFalse(breaker.is_open())
+
+    def test_any_request_error_is_a_failure(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+        session = create_api_session(headers=self.headers, breaker=breaker)
+        for attempt in range(2):
+            with self.assertRaises(requests.exceptions.RequestException):
+                session.get('http://127.0.0.1:1/', timeout=0.5)
+        with self.assertRaises(CircuitOpenError):
+            session.get(self.url)
+
+    def test_deadline_is_enforced(self):
+        self.servers['Spark'].latency = 0.5
+        session = create_api_session(headers=self.headers)
+        start = time.perf_counter()
+        with self.assertRaises(requests.exceptions.Timeout):
+            session.get(self.url, deadline=0.1)
+        self.assertLess(time.perf_counter() - start, 0.4)
+
+    def test_default_deadline_of_a_slow_body(self):
+        self.servers['CMX'].chunk_delay = 0.3    # 4 chunks, each one read before the read timeout
+        url = SparkConnect.CMX_URL + 'api/location/v2/clients/active'
+        session = create_api_session(auth=HTTPBasicAuth('user', 'password'), timeout=(3.05, 0.5), deadline=None)
+        self.assertEqual(len(session.get(url).json()), 2000)
+        session = create_api_session(auth=HTTPBasicAuth('user', 'password'), timeout=(3.05, 0.5), deadline=0.6)
+        start = time.perf_counter()
+        with self.assertRaises(requests.exceptions.Timeout):
+            session.get(url)
+        self.assertLess(time.perf_counter() - start, 0.9)
+
+    def test_no_hedge_for_the_time_in_the_queue(self):
+        calls = []
+        release = threading.Event()
+        executor = SparkConnect_http.HEDGE_EXECUTOR
+        busy = [executor.submit(release.wait) for index in range(SparkConnect_http.HEDGE_WORKERS)]    # a full pool
+        threading.Timer(0.3, release.set).start()
+
+        def lookup():
+            calls.append(time.perf_counter())
+            time.sleep(0.05)
+            return 'result'
+
+        self.assertEqual(hedged_call(lookup, hedge_after=0.1), 'result')
+        self.assertEqual(len(calls), 1)
+        for future in busy:
+            future.result()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the per-controller WLAN state tracker
+# Run from the repository directory:  python -m pytest tests
+
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SparkConnect_deploy import ControllerStateTracker, WlanTemplateFanout
+
+ENABLE = 'enable-wlan'
+DISABLE = 'disable-wlan'
+
+
+class FakeJobs(object):
+    """
+    The deployTemplate and the job waiter, the job status of each template is set by the test
+    """
+
+    def __init__(self, results, duration=0.0):
+        self.results = results
+        self.duration = duration
+        self.deployed = []
+
+    def deploy(self, controller_name, template_name):
+        self.deployed.append(template_name)
+        return template_name
+
+    def wait_one(self, job_name, deadline):
+        time.sleep(self.duration)
+        return self.results[job_name]
+
+    async def wait_one_async(self, job_name, deadline):
+        await asyncio.sleep(self.duration)
+        return self.results[job_name]
+
+
+class FakeFanoutJobs(object):
+    """
+    The deployTemplate and the job waiter of the fan-out, the job statuses of each controller are set by the test,
+    one for each wait
+    """
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.deployed = []
+
+    def deploy(self, controller_name, template_name):
+        self.deployed.append(controller_name)
+        return controller_name + '-job-%d' % len(self.deployed)
+
+    def wait(self, job_names, deadline):
+        return {job_name: self.statuses[job_name.split('-job-')[0]].pop(0) for job_name in job_names}
+
+
+async def call(function, *args):
+    return function(*args)
+
+
+class ControllerStateTest(unittest.TestCase):
+
+    def tracker(self, jobs):
+        return ControllerStateTracker(jobs.deploy, jobs, ENABLE, DISABLE)
+
+    def test_timeout_is_possibly_live_and_disabled(self):
+        jobs = FakeJobs({ENABLE: 'TIMEOUT', DISABLE: 'SUCCESS'})
+        tracker = self.tracker(jobs)
+        self.assertEqual(tracker.acquire('wlc-1'), 'TIMEOUT')
+        self.assertEqual(jobs.deployed, [ENABLE, DISABLE])
+        self.assertEqual(tracker.active_hotspots('wlc-1'), 0)
+        self.assertFalse(tracker.state('wlc-1').live)
+
+    def test_failure_is_not_disabled(self):
+        jobs = FakeJobs({ENABLE: 'FAILURE', DISABLE: 'SUCCESS'})
+        tracker = self.tracker(jobs)
+        self.assertEqual(tracker.acquire('wlc-1'), 'FAILURE')
+        self.assertEqual(jobs.deployed, [ENABLE])
+        self.assertEqual(tracker.active_hotspots('wlc-1'), 0)
+
+    def test_lock_not_held_during_the_job(self):
+        jobs = FakeJobs({ENABLE: 'SUCCESS', DISABLE: 'SUCCESS'}, duration=0.3)
+        tracker = self.tracker(jobs)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(tracker.acquire('wlc-1'))) for index in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        self.assertFalse(tracker.state('wlc-1').lock.locked())
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['SUCCESS'] * 5)
+        self.assertEqual(jobs.deployed, [ENABLE])
+        self.assertEqual(tracker.active_hotspots('wlc-1'), 5)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(tracker.acquire('wlc-1'), 'SUCCESS')
+        tracker.release('wlc-1', 6)
+        self.assertEqual(jobs.deployed, [ENABLE, DISABLE])
+
+    def test_acquire_async_shares_one_deployment(self):
+        jobs = FakeJobs({ENABLE: 'SUCCESS', DISABLE: 'SUCCESS'}, duration=0.1)
+        tracker = self.tracker(jobs)
+
+        async def scenario():
+            return await asyncio.gather(*[tracker.acquire_async('wlc-1', call) for index in range(5)])
+
+        self.assertEqual(asyncio.run(scenario()), ['SUCCESS'] * 5)
+        self.assertEqual(jobs.deployed, [ENABLE])
+        self.assertEqual(tracker.active_hotspots('wlc-1'), 5)
+
+    def test_acquire_async_timeout_is_disabled(self):
+        jobs = FakeJobs({ENABLE: 'TIMEOUT', DISABLE: 'SUCCESS'})
+        tracker = self.tracker(jobs)
+        self.assertEqual(asyncio.run(tracker.acquire_async('wlc-1', call)), 'TIMEOUT')
+        self.assertEqual(jobs.deployed, [ENABLE, DISABLE])
+        self.assertEqual(tracker.active_hotspots('wlc-1'), 0)
+
+
+class WlanTemplateFanoutTest(unittest.TestCase):
+
+    def test_running_jobs_are_not_deployed_again(self):
+        jobs = FakeFanoutJobs({'wlc-1': ['FAILURE', 'SUCCESS'], 'wlc-2': ['TIMEOUT', 'TIMEOUT'],
+                               'wlc-3': ['TIMEOUT', 'FAILURE', 'SUCCESS'], 'wlc-4': ['SUCCESS']})
+        fanout = WlanTemplateFanout(jobs.deploy, jobs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fanout.deploy(['wlc-1', 'wlc-2', 'wlc-3', 'wlc-4'], ENABLE)
+            jobs.deployed = []
+            fanout.retry_failed(result)
+        self.assertEqual(sorted(jobs.deployed), ['wlc-1', 'wlc-3'])
+        self.assertEqual(result.failed(), ['wlc-2'])
+        self.assertEqual(result.running(), ['wlc-2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
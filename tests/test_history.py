@@ -0,0 +1,58 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the CMX client location history store
+# Run from the repository directory:  python -m pytest tests
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SparkConnect_history import CmxHistoryStore
+
+
+def clients(count):
+    return [{'macAddress': '00:00:2a:01:00:%02x' % index, 'detectingControllers': '10.0.0.1',
+             'location': {'mapHierarchyString': 'Campus>Building>Floor 1', 'x': 1.0, 'y': 2.0}}
+            for index in range(count)]
+
+
+class CmxHistoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_interrupted_append_is_ignored_and_truncated(self):
+        store = CmxHistoryStore(self.path)
+        store.append(1000, clients(3))
+        with open(store.column_file('mac'), 'ab') as column_file:
+            column_file.write(b'\0' * 8 * 2)    # the process stopped after writing one column
+        store = CmxHistoryStore(self.path)
+        self.assertEqual(store.row_count(), 3)
+        store.append(1060, clients(2))
+        self.assertEqual(store.row_count(), 5)
+        columns = store.columns()
+        self.assertEqual(list(columns['timestamp']), [1000] * 3 + [1060] * 2)
+        self.assertEqual(os.path.getsize(store.column_file('mac')), 5 * 8)
+
+    def test_dwell_times_use_the_store_interval(self):
+        store = CmxHistoryStore(self.path, interval=30)
+        for timestamp in (1000, 1030, 1060):
+            store.append(timestamp, clients(1))
+        store = CmxHistoryStore(self.path, interval=60)     # opened with another interval
+        self.assertEqual(store.interval, 30)
+        self.assertEqual(store.dwell_times(), {'00:00:2a:01:00:00': 90})
+
+
+if __name__ == '__main__':
+    unittest.main()
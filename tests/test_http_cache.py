@@ -0,0 +1,75 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the on-disk HTTP response cache, against the local stand-in servers
+# Run from the repository directory:  python -m pytest tests
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SparkConnect
+
+from SparkConnect_http import create_api_session
+from SparkConnect_httpcache import CacheRule, HttpCache
+from SparkConnect_standins import StandinData, start_standins, stop_standins, use_standins
+from SparkConnect_warmup import NO_CACHE
+
+RULES = [CacheRule(r'/people/me$', 300), CacheRule(r'/rooms$', 300)]
+
+
+class HttpCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = StandinData(num_clients=10, num_controllers=2, num_rooms=50)
+        self.servers = start_standins(self.data)
+        use_standins(self.servers)
+        self.directory = tempfile.mkdtemp()
+        self.headers = {'Authorization': SparkConnect.SPARK_SESSION.headers['Authorization']}
+
+    def tearDown(self):
+        stop_standins(self.servers)
+        shutil.rmtree(self.directory)
+
+    def session(self, cache):
+        return create_api_session(headers=self.headers, cache=cache)
+
+    def test_no_cache_request_is_revalidated(self):
+        cache = HttpCache(self.directory, rules=RULES)
+        session = self.session(cache)
+        url = SparkConnect.SPARK_URL + '/people/me'
+        session.get(url)
+        session.get(url)
+        self.assertEqual(cache.stats['hits'], 1)
+        response = session.get(url, headers=NO_CACHE)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['revalidated'], 1)
+
+    def test_shared_directory(self):
+        first = HttpCache(self.directory, rules=RULES)
+        second = HttpCache(self.directory, rules=RULES)
+        me_url, rooms_url = SparkConnect.SPARK_URL + '/people/me', SparkConnect.SPARK_URL + '/rooms'
+        self.session(first).get(me_url)
+        self.session(second).get(me_url)
+        self.assertEqual(second.stats['hits'], 1)     # saved by the other process
+        self.session(first).get(rooms_url)
+        sizes = [os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory)]
+        first.clear()
+        second.scan()
+        first.max_bytes = second.max_bytes = max(sizes) + 1    # one response at a time
+        self.session(first).get(me_url)
+        self.session(second).get(rooms_url)
+        files = [name for name in os.listdir(self.directory) if name.endswith('.cache')]
+        self.assertEqual(len(files), 1)     # the response saved by the other process is evicted
+        self.assertEqual(second.stats['evicted'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the network inventory index paging
+# Run from the repository directory:  python -m pytest tests
+
+
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SparkConnect_inventory import NetworkInventory
+
+PI_URL = 'https://pi.sparkconnect.io'
+
+
+class FakeResponse(object):
+    """
+    A streamed response with the JSON {body}
+    """
+
+    encoding = 'utf-8'
+
+    def __init__(self, body):
+        self.content = body.encode('utf-8')
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakePiSession(object):
+    """
+    The PI Devices data, one page at a time, @count and @last are sent after the entity array, or not sent
+    """
+
+    def __init__(self, num_devices, attributes=True):
+        self.devices = ['wlc-%d' % index for index in range(num_devices)]
+        self.attributes = attributes
+        self.pages = 0
+
+    def get(self, url, params=None, **kwargs):
+        self.pages += 1
+        first = params['.firstResult']
+        page = self.devices[first:first + params['.maxResults']]
+        entities = [{'devicesDTO': {'@id': index + first, 'deviceName': hostname, 'ipAddress': '10.0.0.1'}}
+                    for index, hostname in enumerate(page)]
+        body = '{"queryResponse": {"entity": ' + json.dumps(entities)
+        if self.attributes:
+            body += ', "@count": %d, "@last": %d' % (len(self.devices), first + len(page) - 1)
+        return FakeResponse(body + '}}')
+
+
+class PiDevicesPagingTest(unittest.TestCase):
+
+    def test_attributes_after_the_entity_array(self):
+        session = FakePiSession(7)
+        inventory = NetworkInventory(None, None, PI_URL, session, page_size=3)
+        self.assertEqual([device['hostname'] for device in inventory.fetch_pi_devices()], session.devices)
+        self.assertEqual(session.pages, 3)
+
+    def test_no_attributes_full_last_page(self):
+        session = FakePiSession(6, attributes=False)
+        inventory = NetworkInventory(None, None, PI_URL, session, page_size=3)
+        self.assertEqual([device['hostname'] for device in inventory.fetch_pi_devices()], session.devices)
+        self.assertEqual(session.pages, 3)     # the empty page ends the paging
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the HotSpot lease scheduler
+# Run from the repository directory:  python -m pytest tests
+
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SparkConnect_leases import LeaseScheduler
+
+
+class LeaseSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.expired = []
+        self.event = threading.Event()
+
+    def scheduler(self, coalesce_window):
+        scheduler = LeaseScheduler(self.on_expire, coalesce_window=coalesce_window)
+        self.addCleanup(scheduler.stop)
+        return scheduler
+
+    def on_expire(self, controller, leases):
+        self.expired.append((controller, sorted(lease.lease_id for lease in leases)))
+        self.event.set()
+
+    def test_leases_of_a_controller_expire_together(self):
+        scheduler = self.scheduler(0.2)
+        first = scheduler.add('wlc-1', 0.05)
+        second = scheduler.add('wlc-1', 0.1)
+        other = scheduler.add('wlc-2', 0.05)
+        time.sleep(0.5)
+        self.assertEqual(sorted(self.expired), [('wlc-1', [first, second]), ('wlc-2', [other])])
+        self.assertEqual(scheduler.active_leases(), [])
+
+    def test_extended_lease_expires_later(self):
+        scheduler = self.scheduler(0)
+        lease_id = scheduler.add('wlc-1', 0.1)
+        scheduler.extend(lease_id, 0.3)
+        time.sleep(0.25)
+        self.assertEqual(self.expired, [])
+        self.assertTrue(self.event.wait(1))
+        self.assertEqual(self.expired, [('wlc-1', [lease_id])])
+        self.assertIsNone(scheduler.extend(lease_id, 10))
+
+    def test_lease_extended_in_the_coalesce_window_stays_active(self):
+        scheduler = self.scheduler(0.3)
+        lease_id = scheduler.add('wlc-1', 0.05)
+        time.sleep(0.15)    # expired, waiting for the end of the coalesce window
+        scheduler.extend(lease_id, 5)
+        time.sleep(0.4)
+        self.assertEqual(self.expired, [])
+        self.assertEqual([lease.lease_id for lease in scheduler.active_leases('wlc-1')], [lease_id])
+
+    def test_cancelled_lease_is_not_expired(self):
+        scheduler = self.scheduler(0)
+        cancelled = scheduler.add('wlc-1', 0.05)
+        kept = scheduler.add('wlc-2', 0.1)
+        self.assertIsNotNone(scheduler.cancel(cancelled))
+        self.assertTrue(self.event.wait(1))
+        time.sleep(0.1)
+        self.assertEqual(self.expired, [('wlc-2', [kept])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the built-in metrics, against the local stand-in servers
+# Run from the repository directory:  python -m pytest tests
+
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SparkConnect
+
+from SparkConnect_messages import SparkMessageReader
+from SparkConnect_metrics import METRICS, REQUEST_METRICS, route_template
+from SparkConnect_standins import StandinData, start_standins, stop_standins, use_standins
+
+
+class RequestMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = StandinData(num_clients=10, num_controllers=2, num_rooms=1)
+        self.servers = start_standins(self.data)
+        use_standins(self.servers)
+        METRICS.enabled = True
+        self.addCleanup(setattr, METRICS, 'enabled', False)
+
+    def tearDown(self):
+        stop_standins(self.servers)
+
+    def test_route_template(self):
+        self.assertEqual(route_template('https://host/v1/messages/Y2lzY29zcGFyazovL3VzL01FU1NBR0U?max=1'),
+                         '/v1/messages/{id}')
+        self.assertEqual(route_template('https://host/api/v1/network-device/ip-address/10.93.140.35'),
+                         '/api/v1/network-device/ip-address/{id}')
+        self.assertEqual(route_template('https://host/webacs/api/v1/data/Devices?.full=true'),
+                         '/webacs/api/v1/data/Devices')
+
+    def test_engine_requests_are_recorded(self):
+        reader = SparkMessageReader(self.data.rooms[0]['id'], SparkConnect.SPARK_URL, SparkConnect.SPARK_SESSION)
+        reader.prime()      # not an instrumented API function
+        self.assertIn(('Spark', 'GET /v1/messages'), REQUEST_METRICS.latency)
+        self.assertIn('sparkconnect_http_request_latency_seconds_count{backend="Spark",route="GET /v1/messages"}',
+                      REQUEST_METRICS.prometheus_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the outbound Spark message queue
+# Run from the repository directory:  python -m pytest tests
+
+
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SparkConnect_outbox
+
+from SparkConnect_outbox import SparkMessageQueue, OUTBOX_RETRIES
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSparkSession(object):
+    """
+    The Spark /messages endpoint, the status codes of the posts are set by the test, 200 after the last one
+    """
+
+    def __init__(self, statuses=(), headers=None):
+        self.statuses = list(statuses)
+        self.headers = headers
+        self.posts = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def post(self, url, data=None, headers=None):
+        self.started.set()
+        self.release.wait()
+        payload = json.loads(data)
+        self.posts.append((time.time(), payload['roomId'], payload['markdown']))
+        return FakeResponse(self.statuses.pop(0) if self.statuses else 200, self.headers)
+
+
+class SparkMessageQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.delay = SparkConnect_outbox.OUTBOX_RETRY_DELAY
+        SparkConnect_outbox.OUTBOX_RETRY_DELAY = 0.01
+
+    def tearDown(self):
+        SparkConnect_outbox.OUTBOX_RETRY_DELAY = self.delay
+
+    def deliver(self, session, messages, timeout=5):
+        outbox = SparkMessageQueue('https://spark.example.com/v1', session, rate=100, burst=100)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for room_id, message in messages:
+                outbox.post(room_id, message)
+            self.assertTrue(outbox.flush(timeout))
+        return outbox
+
+    def test_consecutive_messages_of_a_room_are_merged(self):
+        session = FakeSparkSession()
+        session.release.clear()     # the first post waits, while the next messages are queued
+        outbox = SparkMessageQueue('https://spark.example.com/v1', session, rate=100, burst=100)
+        with contextlib.redirect_stdout(io.StringIO()):
+            outbox.post('room-1', 'a')
+            session.started.wait(5)
+            for room_id, message in (('room-1', 'b'), ('room-1', 'c'), ('room-2', 'd'), ('room-1', 'e')):
+                outbox.post(room_id, message)
+            session.release.set()
+            self.assertTrue(outbox.flush(5))
+        self.assertEqual([(room_id, markdown) for sent, room_id, markdown in session.posts],
+                         [('room-1', 'a'), ('room-1', 'b\n\nc'), ('room-2', 'd'), ('room-1', 'e')])
+
+    def test_retry_after_is_respected(self):
+        session = FakeSparkSession([429], {'Retry-After': '1'})
+        outbox = self.deliver(session, [('room-1', 'a')])
+        self.assertEqual([markdown for sent, room_id, markdown in session.posts], ['a', 'a'])
+        self.assertGreaterEqual(session.posts[1][0] - session.posts[0][0], 0.9)
+        self.assertEqual(outbox.failed, 0)
+
+    def test_server_errors_are_retried_with_increasing_delays(self):
+        session = FakeSparkSession([503] * (OUTBOX_RETRIES + 1))
+        outbox = self.deliver(session, [('room-1', 'a')])
+        self.assertEqual(len(session.posts), OUTBOX_RETRIES + 1)
+        delays = [session.posts[index + 1][0] - session.posts[index][0] for index in range(OUTBOX_RETRIES)]
+        self.assertGreater(delays[-1], delays[0])
+        self.assertEqual(outbox.failed, 1)
+
+    def test_client_errors_are_not_retried(self):
+        session = FakeSparkSession([404])
+        outbox = self.deliver(session, [('room-1', 'a')])
+        self.assertEqual(len(session.posts), 1)
+        self.assertEqual(outbox.failed, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the Spark list iterators and the room lookup, against the local stand-in servers
+# Run from the repository directory:  python -m pytest tests
+
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SparkConnect
+
+from SparkConnect_pages import iter_spark_items, iter_spark_rooms
+from SparkConnect_rooms import find_room_id_paginated
+from SparkConnect_standins import StandinData, start_standins, stop_standins, use_standins
+
+
+class SparkPagesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = StandinData(num_clients=10, num_controllers=2, num_rooms=25)
+        self.servers = start_standins(self.data)
+        use_standins(self.servers)
+        self.servers['Spark'].reset_counts()
+
+    def tearDown(self):
+        stop_standins(self.servers)
+
+    def room_pages(self):
+        time.sleep(0.2)     # a prefetch started in the background is counted
+        return sum(count for (method, route), count in self.servers['Spark'].call_counts().items()
+                   if method == 'GET' and route.endswith('/rooms'))
+
+    def test_all_the_pages_are_requested(self):
+        rooms = list(iter_spark_rooms(SparkConnect.SPARK_URL, SparkConnect.SPARK_SESSION, page_size=10))
+        self.assertEqual([room['id'] for room in rooms], [room['id'] for room in self.data.rooms])
+        self.assertEqual(self.room_pages(), 3)
+
+    def test_no_page_requested_after_the_caller_stops(self):
+        rooms = iter_spark_items(SparkConnect.SPARK_SESSION, SparkConnect.SPARK_URL + '/rooms', {'max': 10},
+                                 prefetch=False)
+        self.assertEqual(next(rooms)['id'], self.data.rooms[0]['id'])
+        rooms.close()
+        self.assertEqual(self.room_pages(), 1)
+
+    def test_lookup_stops_at_the_first_match(self):
+        room = self.data.rooms[5]
+        self.assertEqual(find_room_id_paginated(SparkConnect.SPARK_URL, SparkConnect.SPARK_SESSION, room['title'],
+                                                page_size=10), room['id'])
+        self.assertEqual(self.room_pages(), 1)
+        room = self.data.rooms[15]
+        self.assertEqual(find_room_id_paginated(SparkConnect.SPARK_URL, SparkConnect.SPARK_SESSION, room['title'],
+                                                page_size=10), room['id'])
+        self.assertEqual(self.room_pages(), 1 + 2)
+
+    def test_lookup_of_an_unknown_room(self):
+        self.assertIsNone(find_room_id_paginated(SparkConnect.SPARK_URL, SparkConnect.SPARK_SESSION, 'unknown',
+                                                 page_size=10))
+        self.assertEqual(self.room_pages(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
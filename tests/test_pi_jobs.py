@@ -0,0 +1,61 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the PI job completion waiter, against the local stand-in servers
+# Run from the repository directory:  python -m pytest tests
+
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SparkConnect
+import SparkConnect_jobs
+
+from SparkConnect_init import WLAN_DEPLOY
+from SparkConnect_jobs import JOB_TIMEOUT
+from SparkConnect_standins import StandinData, start_standins, stop_standins, use_standins
+
+
+class PiJobWaiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = StandinData(num_clients=10, num_controllers=2, num_rooms=1, job_duration=0.2)
+        self.servers = start_standins(self.data)
+        use_standins(self.servers)
+        self.delay = SparkConnect_jobs.JOB_POLL_DELAY
+        SparkConnect_jobs.JOB_POLL_DELAY = 0.05
+
+    def tearDown(self):
+        SparkConnect_jobs.JOB_POLL_DELAY = self.delay
+        stop_standins(self.servers)
+
+    def deploy(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return SparkConnect.deploy_pi_wlan_template(self.data.controllers[0]['hostname'], WLAN_DEPLOY)
+
+    def test_wait_async_does_not_use_a_thread(self):
+        job_names = [self.deploy() for index in range(3)]
+
+        async def scenario():
+            return await asyncio.gather(*[SparkConnect.PI_JOBS.wait_one_async(job_name, 5)
+                                          for job_name in job_names])
+
+        self.assertEqual(asyncio.run(scenario()), ['SUCCESS'] * 3)
+        self.assertEqual(SparkConnect.PI_JOBS.jobs, {})
+
+    def test_wait_async_timeout(self):
+        job_name = self.deploy()
+        self.assertEqual(asyncio.run(SparkConnect.PI_JOBS.wait_one_async(job_name, 0.01)), JOB_TIMEOUT)
+        self.assertNotIn(job_name, SparkConnect.PI_JOBS.jobs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the HotSpot provisioning pipeline
+# Run from the repository directory:  python -m pytest tests
+
+
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SparkConnect
+
+HOSTNAME = 'wlc-1'
+
+
+class FakeBackends(object):
+    """
+    The blocking API functions and the controller state, the PI device id lookup takes {lookup_time} seconds
+    """
+
+    def __init__(self, device_id='pi-1', lookup_time=0.2, deploy_time=0.2):
+        self.results = {SparkConnect.check_cmx_client: '10.0.0.1', SparkConnect.get_em_service_ticket: 'ticket',
+                        SparkConnect.get_controller_hostname: HOSTNAME}
+        self.device_id = device_id
+        self.lookup_time = lookup_time
+        self.deploy_time = deploy_time
+        self.released = []
+
+    async def call(self, function, *args):
+        if function is SparkConnect.get_pi_device_id:
+            await asyncio.sleep(self.lookup_time)
+            if self.device_id is None:
+                raise KeyError('entityId')
+            return self.device_id
+        return self.results[function]
+
+    async def notify(self, message):
+        pass
+
+    async def acquire(self, hostname):
+        await asyncio.sleep(self.deploy_time)
+        return 'SUCCESS'
+
+    async def release(self, hostname):
+        self.released.append(hostname)
+
+
+class ProvisioningPipelineTest(unittest.TestCase):
+
+    def pipeline(self, backends):
+        return SparkConnect.provisioning_pipeline('user@sparkconnect.io', backends.call, backends.notify,
+                                                  backends.acquire, backends.release)
+
+    def test_device_id_lookup_runs_with_the_deploy(self):
+        backends = FakeBackends()
+        pipeline = self.pipeline(backends)
+        results = asyncio.run(pipeline.run())
+        self.assertEqual((results['deploy'], results['pi_id']), ('SUCCESS', 'pi-1'))
+        self.assertLess(pipeline.elapsed, 0.35)     # not 0.2 + 0.2 seconds
+        self.assertEqual(backends.released, [])
+
+    def test_hotspot_released_when_the_lookup_fails(self):
+        backends = FakeBackends(device_id=None)
+        with self.assertRaises(KeyError):
+            asyncio.run(self.pipeline(backends).run())
+        self.assertEqual(backends.released, [HOSTNAME])
+
+
+if __name__ == '__main__':
+    unittest.main()
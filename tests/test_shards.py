@@ -0,0 +1,103 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the sharded multi-room mode, against the local stand-in servers
+# Run from the repository directory:  python -m pytest tests
+
+
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SparkConnect_async
+
+from SparkConnect_async import ProvisioningEngine, DURATION_QUESTION
+from SparkConnect_shards import ShardStore
+from SparkConnect_standins import StandinData, start_standins, stop_standins, use_standins
+
+USER_EMAIL = 'user@sparkconnect.io'
+BOT_EMAIL = 'sparkconnect@sparkbot.io'
+
+
+class ShardStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ShardStore(os.path.join(self.directory, 'shards.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rooms_shared_with_floor_and_remainder(self):
+        self.store.add_rooms(['room-%d' % index for index in range(4)])
+        workers = ['worker-a', 'worker-b', 'worker-c']
+        for worker_id in workers:
+            self.store.heartbeat(worker_id)     # all the workers alive
+        for worker_id in workers:
+            self.store.heartbeat(worker_id)
+        counts = sorted(len(self.store.heartbeat(worker_id)) for worker_id in workers)
+        self.assertEqual(counts, [1, 1, 2])
+
+    def test_checkpoint_fails_for_another_owner(self):
+        self.store.add_rooms(['room-0'])
+        self.store.heartbeat('worker-a')
+        self.assertTrue(self.store.checkpoint('room-0', 'worker-a', 'message-1'))
+        self.assertFalse(self.store.checkpoint('room-0', 'worker-b', 'message-2'))
+
+
+class ShardPollingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = StandinData(num_clients=10, num_controllers=2, num_rooms=1)
+        self.servers = start_standins(self.data)
+        use_standins(self.servers)
+        self.room_id = self.data.rooms[0]['id']
+        self.interval = SparkConnect_async.POLL_INTERVAL
+        SparkConnect_async.POLL_INTERVAL = 0.02
+
+    def tearDown(self):
+        SparkConnect_async.POLL_INTERVAL = self.interval
+        stop_standins(self.servers)
+
+    def test_polling_stops_when_the_checkpoint_fails(self):
+        async def scenario():
+            engine = ProvisioningEngine()
+            poller = asyncio.ensure_future(engine.poll_room(self.room_id, checkpoint=lambda message_id: False))
+            await asyncio.sleep(0.1)
+            self.data.add_message(self.room_id, '/E', USER_EMAIL)
+            await asyncio.wait_for(poller, 5)
+            for pending in engine.pending_duration.values():
+                pending.cancel()
+            engine.leases.stop()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(scenario())
+
+    def test_messages_of_the_previous_owner_are_ignored(self):
+        last = self.data.add_message(self.room_id, '/E', USER_EMAIL)
+        question = self.data.add_message(self.room_id, DURATION_QUESTION, BOT_EMAIL)
+
+        async def scenario():
+            engine = ProvisioningEngine()      # a new worker, with no message posted
+            poller = asyncio.ensure_future(engine.poll_room(self.room_id, last['id']))
+            await asyncio.sleep(0.3)
+            self.assertFalse(poller.done())
+            poller.cancel()
+            engine.leases.stop()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(scenario())
+        self.assertIs(self.data.messages[self.room_id][0], question)    # the newest first, no answer posted
+
+
+if __name__ == '__main__':
+    unittest.main()
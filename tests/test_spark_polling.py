@@ -0,0 +1,121 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the Spark room polling, against the local stand-in servers
+# Run from the repository directory:  python -m pytest tests
+
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SparkConnect
+import SparkConnect_async
+
+from SparkConnect_async import ProvisioningEngine
+from SparkConnect_http import CircuitBreaker
+from SparkConnect_messages import SparkMessageReader
+from SparkConnect_rooms import SparkRoomNotFoundError
+from SparkConnect_standins import StandinData, start_standins, stop_standins, use_standins
+
+USER_EMAIL = 'user@sparkconnect.io'
+
+
+class SparkPollingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = StandinData(num_clients=10, num_controllers=2, num_rooms=1)
+        self.servers = start_standins(self.data)
+        use_standins(self.servers)
+        SparkConnect.SPARK_SESSION.breaker = CircuitBreaker('Spark', reset_timeout=0.05)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.room_id = SparkConnect.create_spark_room('SparkConnect polling test')
+
+    def tearDown(self):
+        stop_standins(self.servers)
+
+    def test_poll_room_survives_spark_errors(self):
+        async def scenario():
+            engine = ProvisioningEngine()
+            poller = asyncio.ensure_future(engine.poll_room(self.room_id))
+            await asyncio.sleep(0.1)
+            self.servers['Spark'].error_rate = 1.0      # every Spark call fails with 503
+            await asyncio.sleep(0.3)
+            self.servers['Spark'].error_rate = 0.0
+            self.assertFalse(poller.done())
+            self.data.add_message(self.room_id, '/E', USER_EMAIL)
+            deadline = time.time() + 5
+            while (self.room_id, USER_EMAIL) not in engine.pending_duration and time.time() < deadline:
+                await asyncio.sleep(0.02)
+            self.assertIn((self.room_id, USER_EMAIL), engine.pending_duration)
+            self.assertFalse(poller.done())
+            poller.cancel()
+            for pending in engine.pending_duration.values():
+                pending.cancel()
+            engine.leases.stop()
+
+        intervals = (SparkConnect_async.POLL_INTERVAL, SparkConnect_async.POLL_MAX_BACKOFF)
+        SparkConnect_async.POLL_INTERVAL, SparkConnect_async.POLL_MAX_BACKOFF = 0.02, 0.1
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                asyncio.run(scenario())
+        finally:
+            SparkConnect_async.POLL_INTERVAL, SparkConnect_async.POLL_MAX_BACKOFF = intervals
+
+    def test_deleted_cursor_message_is_not_replayed(self):
+        self.data.add_message(self.room_id, '/E', 'old@sparkconnect.io')
+        time.sleep(0.002)
+        last = self.data.add_message(self.room_id, 'last seen', USER_EMAIL)
+        reader = SparkMessageReader(self.room_id, SparkConnect.SPARK_URL, SparkConnect.SPARK_SESSION)
+        reader.prime()
+        self.data.messages[self.room_id].remove(last)   # the last seen message is deleted
+        time.sleep(0.002)
+        self.data.add_message(self.room_id, 'new', USER_EMAIL)
+        self.assertEqual([message['text'] for message in reader.new_messages()], ['new'])
+
+    def test_unknown_cursor_primes_again(self):
+        for index in range(5):
+            self.data.add_message(self.room_id, '/E', 'old@sparkconnect.io')
+        reader = SparkMessageReader(self.room_id, SparkConnect.SPARK_URL, SparkConnect.SPARK_SESSION)
+        reader.resume('deleted-message-id')
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(reader.new_messages(), [])
+        self.data.add_message(self.room_id, 'new', USER_EMAIL)
+        self.assertEqual([message['text'] for message in reader.new_messages()], ['new'])
+
+    def test_deleted_room_raises_and_is_removed_from_the_cache(self):
+        SparkConnect.ROOM_CACHE.store('SparkConnect polling test', self.room_id)
+        SparkConnect.SPARK_SESSION.delete(SparkConnect.SPARK_URL + '/rooms/' + self.room_id).raise_for_status()
+        with self.assertRaises(SparkRoomNotFoundError):
+            SparkConnect.last_spark_room_message(self.room_id)
+        self.assertIsNone(SparkConnect.ROOM_CACHE.get('SparkConnect polling test'))
+
+    def test_poll_room_raises_for_a_deleted_room(self):
+        async def scenario():
+            engine = ProvisioningEngine()
+            poller = asyncio.ensure_future(engine.poll_room(self.room_id))
+            await asyncio.sleep(0.1)
+            await engine.call(SparkConnect.SPARK_SESSION.delete, SparkConnect.SPARK_URL + '/rooms/' + self.room_id)
+            with self.assertRaises(SparkRoomNotFoundError):
+                await asyncio.wait_for(poller, 5)
+            engine.leases.stop()
+
+        interval = SparkConnect_async.POLL_INTERVAL
+        SparkConnect_async.POLL_INTERVAL = 0.02
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                asyncio.run(scenario())
+        finally:
+            SparkConnect_async.POLL_INTERVAL = interval
+
+
+if __name__ == '__main__':
+    unittest.main()
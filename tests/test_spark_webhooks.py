@@ -0,0 +1,101 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the Spark webhook receiver, against the local stand-in servers
+# Run from the repository directory:  python -m pytest tests
+
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SparkConnect_async
+
+from SparkConnect_async import ProvisioningEngine
+from SparkConnect_standins import StandinData, start_standins, stop_standins, use_standins
+from SparkConnect_webhook import WebhookReceiver, post_webhook_event
+
+USER_EMAIL = 'user@sparkconnect.io'
+WEBHOOK_URL = 'https://sparkconnect.example.com/webhook'
+
+
+class SparkWebhookTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = StandinData(num_clients=10, num_controllers=2, num_rooms=1)
+        self.servers = start_standins(self.data)
+        use_standins(self.servers)
+        self.room_id = self.data.rooms[0]['id']
+        self.received = []
+
+    def tearDown(self):
+        stop_standins(self.servers)
+
+    def start_receiver(self, secret=None):
+        receiver = WebhookReceiver(lambda *message: self.received.append(message), 0, host='127.0.0.1',
+                                   secret=secret)
+        with contextlib.redirect_stdout(io.StringIO()):
+            receiver.start()
+        self.addCleanup(receiver.stop)
+        return receiver, 'http://127.0.0.1:%d/' % receiver.server_address[1]
+
+    def test_duplicate_notifications_are_dispatched_once(self):
+        receiver, url = self.start_receiver(secret='secret')
+        for attempt in range(3):
+            post_webhook_event(url, self.room_id, '/E', USER_EMAIL, message_id='message-1', secret='secret')
+        self.assertEqual(self.received, [(self.room_id, '/E', USER_EMAIL)])
+
+    def test_unsigned_inline_text_is_not_trusted(self):
+        receiver, url = self.start_receiver()
+        message = self.data.add_message(self.room_id, 'hello', USER_EMAIL)
+        post_webhook_event(url, self.room_id, '/E', 'attacker@example.com', message_id=message['id'])
+        self.assertEqual(self.received, [(self.room_id, 'hello', USER_EMAIL)])
+
+    def test_webhook_registered_once_and_deleted_on_stop(self):
+        async def scenario():
+            engine = ProvisioningEngine()
+            for restart in range(3):
+                receiver = await engine.receive_webhooks(self.room_id, WEBHOOK_URL, 0)
+                self.assertEqual(len(self.data.webhooks), 1)
+                if restart < 2:
+                    receiver.stop()     # the process ended without deleting the webhook
+            await engine.stop_webhooks(receiver)
+            self.assertEqual(self.data.webhooks, [])
+            engine.leases.stop()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(scenario())
+
+    def test_polling_resumes_when_notifications_stop(self):
+        async def scenario():
+            engine = ProvisioningEngine()
+            receiver = await engine.receive_webhooks(self.room_id, WEBHOOK_URL, 0)
+            watcher = asyncio.ensure_future(engine.watch_webhooks(self.room_id, receiver))
+            await asyncio.sleep(0.1)
+            message = self.data.add_message(self.room_id, '/E', USER_EMAIL)     # not notified by the webhook
+            last_message_id = await asyncio.wait_for(watcher, 5)
+            self.assertEqual(last_message_id, message['id'])
+            self.assertIn((self.room_id, USER_EMAIL), engine.pending_duration)
+            for pending in engine.pending_duration.values():
+                pending.cancel()
+            await engine.stop_webhooks(receiver)
+            engine.leases.stop()
+
+        intervals = (SparkConnect_async.WEBHOOK_CHECK_INTERVAL, SparkConnect_async.WEBHOOK_GRACE)
+        SparkConnect_async.WEBHOOK_CHECK_INTERVAL, SparkConnect_async.WEBHOOK_GRACE = 0.05, 0.05
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                asyncio.run(scenario())
+        finally:
+            SparkConnect_async.WEBHOOK_CHECK_INTERVAL, SparkConnect_async.WEBHOOK_GRACE = intervals
+
+
+if __name__ == '__main__':
+    unittest.main()
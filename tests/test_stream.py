@@ -0,0 +1,81 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the streaming JSON parser
+# Run from the repository directory:  python -m pytest tests
+
+
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SparkConnect_stream import JsonItemStream, JsonStreamError, iter_response_items
+
+PI_DOCUMENT = {'queryResponse': {'@count': 12345, '@first': 0, '@last': 2, '@type': 'Devices',
+                                 'entity': [{'devicesDTO': {'@id': 1001, 'deviceName': 'wlc-é€'}},
+                                            {'devicesDTO': {'@id': 1002.5, 'deviceName': 'wlc "2"\n'}},
+                                            {'devicesDTO': {'@id': -3e2, 'deviceName': None}}]}}
+
+
+def split_text(text, size):
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+
+class FakeResponse(object):
+    """
+    A streamed response, the body is read in the {chunks}
+    """
+
+    encoding = 'utf-8'
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class JsonItemStreamTest(unittest.TestCase):
+
+    def test_items_split_at_every_chunk_boundary(self):
+        text = json.dumps(PI_DOCUMENT, indent=1)
+        for size in range(1, 40):
+            attributes = {}
+            items = list(JsonItemStream(split_text(text, size), ('queryResponse', 'entity'), attributes))
+            self.assertEqual(items, PI_DOCUMENT['queryResponse']['entity'], 'chunk size %d' % size)
+            self.assertEqual(attributes['@count'], 12345, 'chunk size %d' % size)
+
+    def test_top_level_array_of_numbers(self):
+        for size in range(1, 6):
+            self.assertEqual(list(JsonItemStream(split_text('[ 123456, 7.25e3 ,-8 ]', size))), [123456, 7250.0, -8])
+
+    def test_utf8_character_split_between_chunks(self):
+        body = json.dumps(PI_DOCUMENT, ensure_ascii=False).encode('utf-8')
+        for size in range(1, 8):
+            response = FakeResponse([body[start:start + size] for start in range(0, len(body), size)])
+            items = list(iter_response_items(response, ('queryResponse', 'entity')))
+            self.assertEqual(items, PI_DOCUMENT['queryResponse']['entity'])
+            self.assertTrue(response.closed)
+
+    def test_empty_missing_and_null_arrays(self):
+        self.assertEqual(list(JsonItemStream(['[', ' ]'])), [])
+        self.assertEqual(list(JsonItemStream(['{"queryResponse": {"@count": 0}}'], ('queryResponse', 'entity'))), [])
+        self.assertEqual(list(JsonItemStream(['{"queryResponse": {"entity": null}}'],
+                                             ('queryResponse', 'entity'))), [])
+
+    def test_truncated_document(self):
+        with self.assertRaises(JsonStreamError):
+            list(JsonItemStream(['[{"a": 1}, {"b"']))
+
+
+if __name__ == '__main__':
+    unittest.main()
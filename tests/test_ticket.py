@@ -0,0 +1,65 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+# This file includes the tests of the APIC-EM service ticket manager, against the local stand-in servers
+# Run from the repository directory:  python -m pytest tests
+
+
+import contextlib
+import io
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SparkConnect
+
+from SparkConnect_http import create_api_session
+from SparkConnect_standins import StandinData, start_standins, stop_standins, use_standins
+from SparkConnect_ticket import ServiceTicketManager
+
+
+class ServiceTicketManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = StandinData(num_clients=10, num_controllers=2, num_rooms=1)
+        self.servers = start_standins(self.data)
+        use_standins(self.servers)
+        self.tickets = ServiceTicketManager(SparkConnect.EM_URL, 'user', 'password', create_api_session())
+        self.addCleanup(self.tickets.close)
+
+    def tearDown(self):
+        stop_standins(self.servers)
+
+    def ticket_calls(self):
+        return self.servers['APIC-EM'].call_counts().get(('POST', '/api/v1/ticket'), 0)
+
+    def test_concurrent_callers_share_one_ticket(self):
+        tickets = []
+        threads = [threading.Thread(target=lambda: tickets.append(self.tickets.get_ticket())) for index in range(10)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(set(tickets)), 1)
+        self.assertEqual(self.ticket_calls(), 1)
+
+    def test_rejected_ticket_is_replaced_once(self):
+        url = SparkConnect.EM_URL + '/network-device/count'
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(self.tickets.request('GET', url).status_code, 200)
+            expired = self.tickets.ticket
+            self.data.tickets.clear()   # the ticket expired on APIC-EM
+            self.assertEqual(self.tickets.request('GET', url).status_code, 200)
+        self.assertNotEqual(self.tickets.ticket, expired)
+        self.assertEqual(self.tickets.refresh(expired), self.tickets.ticket)     # already replaced by another caller
+        self.assertEqual(self.ticket_calls(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()